@@ -0,0 +1,86 @@
+import os
+import time
+import random
+import argparse
+
+import utils
+
+'''
+Benchmark of text_cleaning against the original __simple_text_cleaning
+(default_text_preprocessing of every full text and time split).
+
+Both functions are run on the preprocessed texts of a folder (e.g.
+preproc/02_main) or on generated records of a given length; the outputs
+are checked to be equal before the times are compared.
+
+    python clitri/benchmark_cleaning.py --folder preproc/02_main
+    python clitri/benchmark_cleaning.py --records 200 --length 200000
+'''
+
+timer = getattr(time, 'perf_counter', time.time)
+
+simple_text_cleaning = getattr(utils, '__simple_text_cleaning')
+
+def generated_records(count, length, seed = 0):
+    """*count* texts of about *length* characters in the layout of 02_main."""
+    rng = random.Random(seed)
+    words = ['patient', 'record', 'within', 'months', 'HRTMED', 'creatinine', 'HIGHCRT', 'hba1c', 'mg', 'dl',
+             'x', 'a', 'MEDRX', 'denies', 'NEGATED', 'status', 'post', 'ABDMNL', 'aspirin']
+    separators = [' ', ' ', ' ', ' . \n ', ' , ', '\n', ' : ', '  ']
+    texts = []
+    for i in range(count):
+        parts = []
+        size = 0
+        while size < length:
+            word = rng.choice(words) if rng.random() < 0.85 else str(rng.randint(0, 20000)) + rng.choice(['', '.5', '%'])
+            parts.append(word)
+            parts.append(rng.choice(separators))
+            size += len(word) + 2
+        texts.append(''.join(parts))
+    return texts
+
+def folder_records(folder, count = None):
+    """Texts of the files in *folder* (at most *count*)."""
+    names = sorted(os.listdir(folder))[:count]
+    texts = []
+    for name in names:
+        with open(os.path.join(folder, name)) as f:
+            texts.append(f.read())
+    return texts
+
+def best_time(func, texts, repeats):
+    """Best time of func(texts) in *repeats* runs."""
+    best = None
+    for i in range(repeats):
+        start = timer()
+        func(texts)
+        seconds = timer() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+def run(texts, repeats = 3):
+    """Returns (seconds of the original, seconds of text_cleaning_batch); fails if outputs differ."""
+    expected = [simple_text_cleaning(text) for text in texts]
+    if utils.text_cleaning_batch(texts) != expected:
+        raise AssertionError('text_cleaning differs from __simple_text_cleaning')
+    old = best_time(lambda items: [simple_text_cleaning(text) for text in items], texts, repeats)
+    new = best_time(utils.text_cleaning_batch, texts, repeats)
+    return old, new
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description="Benchmark of text_cleaning against __simple_text_cleaning")
+    argparser.add_argument("--folder", dest="folder", default = None, help="folder with preprocessed texts")
+    argparser.add_argument("--records", dest="records", type = int, default = 100, help="number of texts")
+    argparser.add_argument("--length", dest="length", type = int, default = 100000,
+                           help="characters of a generated text (without --folder)")
+    argparser.add_argument("--repeats", dest="repeats", type = int, default = 3, help="runs of each function")
+    args = argparser.parse_args()
+    if args.folder:
+        texts = folder_records(args.folder, args.records)
+    else:
+        texts = generated_records(args.records, args.length)
+    old, new = run(texts, args.repeats)
+    chars = sum(len(text) for text in texts)
+    print('{} texts, {:.1f} MB, outputs equal'.format(len(texts), chars / 1e6))
+    print('__simple_text_cleaning {:8.3f} s'.format(old))
+    print('text_cleaning          {:8.3f} s  ({:.1f}x)'.format(new, old / new if new else float('inf')))
@@ -2,6 +2,7 @@ import re
 import os
 import datetime
 import argparse
+import multiprocessing
 
 from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
 
@@ -19,6 +20,8 @@ from sklearn.decomposition import TruncatedSVD
 from sklearn.feature_selection import SelectFromModel
 
 from medicalcase import MedicalCase, load_whole_dataset
+from labels import load_labels
+from features import FeatureCache
 from utils import *
 
 class BorutaVoter(object):
@@ -43,19 +46,24 @@ def build_tfidf(texts, file_to_save = None):
         save_pickle(vectorizer, tfidf_name)
     return vectorizer
 
-def build_model(clf, trdata, annotations, tfidf_name, label, file_to_save = None, time = False):
+def build_model(clf, trdata, annotations, tfidf_name, label, file_to_save = None, time = False, features = None,
+                threads = None):
     """
     Create model from given texts *trdata* which are vectorized using *tfidf_name*,
     trained to recognize *label* from *annotations* and saved if specified *file_to_save*.
+    *annotations* are a label matrix (rows of LabelMatrix, one per text) or a list of gold dicts.
+    *features* is *trdata* already vectorized (see features.FeatureCache), otherwise it is done here.
+    *threads* limits the threads of the estimators (see set_threads).
     """
     if isinstance(clf, BorutaVoter):
-        build_boruta_voter(trdata, annotations, tfidf_name, label, file_to_save, time)
+        build_boruta_voter(trdata, annotations, tfidf_name, label, file_to_save, time, features, threads)
     else:
-        vectorizer = load_pickle(tfidf_name)
-        annot_enc = np.array([encode_annotations(ant) for ant in annotations])
+        if threads:
+            set_threads(clf, threads)
+        annot_enc = encode_annotations_matrix(annotations)
         tag_enc = get_tag_encoding(annot_enc, label)
         frsttag, sectag = balancing(tag_enc, method='under')
-        X_tr = vectorizer.transform(trdata)
+        X_tr = features if features is not None else load_pickle(tfidf_name).transform(trdata)
         X_tr = X_tr[np.r_[frsttag,sectag]] # balanced training data
         tag_enc = tag_enc[np.r_[frsttag,sectag]] # balanced labels
         if clf.__class__.__name__ != 'HelmholtzClassifier':
@@ -65,7 +73,7 @@ def build_model(clf, trdata, annotations, tfidf_name, label, file_to_save = None
             #        ])
             clf.fit(X_tr, tag_enc)
         else:
-            clf.fit(trdata, annotations)
+            clf.fit(trdata, decode_annotations_matrix(annotations))
         if file_to_save:
             if time:
                 now = str(datetime.datetime.now())[:-7].replace(':','_').replace(' ','_').replace('-','_')
@@ -74,17 +82,17 @@ def build_model(clf, trdata, annotations, tfidf_name, label, file_to_save = None
             clf_name = file_to_save + '_' + now + label
             save_pickle(clf, clf_name)
 
-def build_boruta_voter(trdata, annotations, tfidf_name, label, file_to_save = None, time = False):
+def build_boruta_voter(trdata, annotations, tfidf_name, label, file_to_save = None, time = False, features = None,
+                       threads = None):
     """
     Building boruta algorithm + ensemble learning.
     """
     from boruta import BorutaPy
-    vectorizer = load_pickle(tfidf_name)
-    X_tr = vectorizer.transform(trdata)
-    annot_enc = np.array([encode_annotations(ant) for ant in annotations])
+    X_tr = features if features is not None else load_pickle(tfidf_name).transform(trdata)
+    annot_enc = encode_annotations_matrix(annotations)
     tag_enc = get_tag_encoding(annot_enc, label)
 
-    rf = RandomForestClassifier(n_jobs=-1, class_weight='balanced', max_depth=5)
+    rf = RandomForestClassifier(n_jobs=threads or -1, class_weight='balanced', max_depth=5)
 
     feat_selector = BorutaPy(rf, n_estimators='auto', verbose=2, random_state=1)
     log_clf = LogisticRegression(random_state=42)
@@ -109,9 +117,76 @@ def build_boruta_voter(trdata, annotations, tfidf_name, label, file_to_save = No
         clf_name = file_to_save + '_' + now + label
         save_pickle(pipe, clf_name)
 
+# --- training of tags in a pool of processes (--jobs)
+THREAD_PARAMS = ['n_jobs', 'nthread', 'thread_count'] # sklearn, xgboost, catboost
+
+_training = None # texts, annotations, vectorizer and features of a training process
+
+def set_threads(clf, threads):
+    """Sets the number of threads of *clf* and of the estimators inside it (pipelines, voting) to *threads*."""
+    if hasattr(clf, 'get_params'):
+        params = dict((key, threads) for key in clf.get_params(deep = True) if key.split('__')[-1] in THREAD_PARAMS)
+        clf.set_params(**params)
+    return clf
+
+def thread_budget(jobs, tasks):
+    """
+    Splits *jobs* cores (0: all CPU cores) among *tasks* fits running at the same time.
+    Returns the number of processes and the threads of every task, so that
+    processes x threads does not exceed the cores.
+    """
+    cores = multiprocessing.cpu_count() if jobs == 0 else jobs
+    workers = max(1, min(cores, tasks))
+    threads = [cores // workers + (1 if i < cores % workers else 0) for i in range(workers)]
+    return workers, [threads[i % workers] for i in range(tasks)]
+
+def init_trainer(texts, annotations, vectorizer, features):
+    """
+    Data of train_tag in this process.
+    Args:
+      texts, features (dict) - training texts and their matrix by time limit (None: whole texts)
+    """
+    global _training
+    _training = (texts, annotations, vectorizer, features)
+
+def train_tag(task):
+    """Builds and saves the models of *task* (clf, tag, file_to_save, threads) as the serial training does."""
+    clf, tag, file_to_save, threads = task
+    texts, annotations, vectorizer, features = _training
+    windows = ([TIME_LIMITED_TAGS[tag]] if tag in TIME_LIMITED_TAGS else []) + [None]
+    for window in windows:
+        build_model(clf, texts[window], annotations, vectorizer, tag, file_to_save, features = features[window],
+                    threads = threads)
+    return tag
+
+def train_tags(clf, tags, mcdata, annotations, vectorizer, features, file_to_save, jobs = 0):
+    """
+    Trains a model of every tag of *tags*, the tags in parallel on *jobs* cores
+    (0: all), see thread_budget. Tags with a time limit go first, they fit two models.
+    *features* is a FeatureCache, the matrices are computed before the processes start.
+    """
+    windows = set(TIME_LIMITED_TAGS[tag] for tag in tags if tag in TIME_LIMITED_TAGS) | set([None])
+    texts, matrices = {}, {}
+    for window in windows:
+        texts[window], _ = get_training_from_mc(mcdata, window)
+        matrices[window] = features.transform(vectorizer, texts[window], window)
+    tags = sorted(tags, key = lambda tag: tag not in TIME_LIMITED_TAGS)
+    workers, threads = thread_budget(jobs, len(tags))
+    print('Training {} tags in {} processes, threads: {}'.format(len(tags), workers, threads))
+    tasks = [(clf, tag, file_to_save, n) for tag, n in zip(tags, threads)]
+    pool = multiprocessing.Pool(workers, initializer = init_trainer,
+                                initargs = (texts, annotations, vectorizer, matrices))
+    try:
+        for tag in pool.imap_unordered(train_tag, tasks):
+            print('Built: ' + tag)
+    finally:
+        pool.close()
+        pool.join()
+
 if __name__ == '__main__':
-    mcdata = load_whole_dataset()
-    texts, annots = get_training_from_mc(mcdata)
+    mcdata = load_whole_dataset(snapshot = CONFIG_PATH['snapshot'])
+    texts, _ = get_training_from_mc(mcdata)
+    annots = load_labels('train', CONFIG_PATH['label_matrix']).select([mc.name for mc in mcdata])
     parser = argparse.ArgumentParser(description="Builds clf model. Will be stored in 'models' folder.")
     parser.add_argument("-t", "--tfidf", dest="tfidf", default=None, type=str,
                         help="""
@@ -125,6 +200,8 @@ if __name__ == '__main__':
                          help="if given uses specific vectorizer. Must be in models folder")
     parser.add_argument("-g", "--tag", dest="tag", type = str, default = None,
                          help="Tag to train. If not given, all models will be created.")
+    parser.add_argument("-j", "--jobs", dest="jobs", type = int, default = None,
+                         help="Train the tags in parallel on this many CPU cores, 0 for all.")
     args = parser.parse_args()
     if not args.tfidf is None:
         build_tfidf(texts, 'models/' + args.tfidf)
@@ -136,11 +213,17 @@ if __name__ == '__main__':
         else:
             clf = eval(args.classifier + "(TAGS_LABELS)")
         vectorizer = 'models/' + args.vectorizer if args.vectorizer else DEFAULT_VECTORIZER
-        if args.tag:
+        features = FeatureCache(CONFIG_PATH['features'])
+        if args.jobs is not None:
+            tags = [args.tag] if args.tag else [tag for tag in TAGS_LABELS if tag != 'KETO-1YR']
+            train_tags(clf, tags, mcdata, annots, vectorizer, features, 'models/' + args.name, args.jobs)
+        elif args.tag:
             if args.tag in TIME_LIMITED_TAGS.keys():
                     texts_timed, _ = get_training_from_mc(mcdata, TIME_LIMITED_TAGS[args.tag])
-                    build_model(clf, texts_timed, annots, vectorizer, args.tag, 'models/' + args.name)                
-            build_model(clf, texts, annots, vectorizer, args.tag, 'models/' + args.name)
+                    build_model(clf, texts_timed, annots, vectorizer, args.tag, 'models/' + args.name,
+                                features = features.transform(vectorizer, texts_timed, TIME_LIMITED_TAGS[args.tag]))
+            build_model(clf, texts, annots, vectorizer, args.tag, 'models/' + args.name,
+                        features = features.transform(vectorizer, texts))
         else:
             for tag in TAGS_LABELS:
                 if tag == 'KETO-1YR':
@@ -148,6 +231,8 @@ if __name__ == '__main__':
                 print('Building: ' + tag)
                 if tag in TIME_LIMITED_TAGS.keys():
                     texts_timed, _ = get_training_from_mc(mcdata, TIME_LIMITED_TAGS[tag])
-                    build_model(clf, texts_timed, annots, vectorizer, tag, 'models/' + args.name)
-                build_model(clf, texts, annots, vectorizer, tag, 'models/' + args.name)
+                    build_model(clf, texts_timed, annots, vectorizer, tag, 'models/' + args.name,
+                                features = features.transform(vectorizer, texts_timed, TIME_LIMITED_TAGS[tag]))
+                build_model(clf, texts, annots, vectorizer, tag, 'models/' + args.name,
+                            features = features.transform(vectorizer, texts))
         print('.')
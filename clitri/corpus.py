@@ -0,0 +1,275 @@
+import os
+import numpy as np
+import xml.etree.cElementTree as ET
+
+from utils import TAGS_LABELS, MET_LABEL, NOTMET_LABEL, build_tags, select_lab_values
+
+'''
+Compact corpus: the cases of a large cohort kept in a few shared arrays
+instead of one MedicalCase object per patient.
+
+  buffer       - one string with the text of every case (and its clean text
+                 if kept); texts of records are slices of the case text, only
+                 those which are not found in it are added to the buffer
+  *_start/end  - offsets of these texts in buffer
+  dates        - datetime64[D] array with the date of every record
+  gold, annots - int8 matrices cases x TAGS_LABELS (1 met, 0 not met, -1 none)
+
+corpus[i] returns a CaseView with the attributes and methods of MedicalCase
+used by Discover and classifiers (name, text, time_splits, gold, annots, labs,
+get_timed_text, lab_values, build_tags ...); texts are cut from the buffer
+on access.
+'''
+
+# --- codes of the label matrices
+LABEL_CODES = {MET_LABEL: 1, NOTMET_LABEL: 0, None: -1}
+LABEL_NAMES = {1: MET_LABEL, 0: NOTMET_LABEL, -1: None}
+
+class CompactCorpus(object):
+    """
+    Cases in shared arrays, see module description. Build with from_cases().
+    """
+    def __init__(self):
+        self.names = []
+        self.labs = []
+        self.buffer = ''
+        self.text_start = self.text_end = None      # per case
+        self.clean_start = self.clean_end = None    # per case, -1 if clean text is not kept
+        self.split_first = None                     # per case + 1, first record of a case
+        self.has_splits = None                      # per case, False if time_splits is None
+        self.has_gold = None                        # per case, False if gold is None
+        self.split_start = self.split_end = None    # per record
+        self.dates = None                           # per record
+        self.gold = None
+        self.annots = None
+        self.index = {}
+        self.windows = {}                           # time_limit: text of get_timed_text, case windows_row only
+        self.windows_row = None
+
+    @classmethod
+    def from_cases(cls, chunks, keep_clean_text = False):
+        """
+        Compacts MedicalCase objects from *chunks* (iterable of lists of cases);
+        the cases of a chunk can be freed as soon as the next one is read.
+        """
+        corpus = cls()
+        parts = []
+        size = 0
+        case_cols = dict((key, []) for key in ['text_start', 'text_end', 'clean_start', 'clean_end', 'split_first',
+                                               'has_splits', 'has_gold'])
+        split_cols = dict((key, []) for key in ['split_start', 'split_end', 'dates'])
+        gold, annots = [], []
+        for cases in chunks:
+            for mc in cases:
+                corpus.names.append(mc.name)
+                corpus.labs.append(mc.labs)
+                text = mc.text
+                text_start = size
+                parts.append(text)
+                size += len(text)
+                case_cols['text_start'].append(text_start)
+                case_cols['text_end'].append(size)
+                splits = mc.time_splits
+                case_cols['split_first'].append(len(split_cols['dates']))
+                case_cols['has_splits'].append(splits is not None)
+                position = 0
+                for ts, ttext in splits or []:
+                    found = text.find(ttext, position)
+                    if found >= 0:
+                        start = text_start + found
+                        position = found + len(ttext)
+                    else:
+                        start = size
+                        parts.append(ttext)
+                        size += len(ttext)
+                    split_cols['split_start'].append(start)
+                    split_cols['split_end'].append(start + len(ttext))
+                    split_cols['dates'].append(ts.strftime('%Y-%m-%d'))
+                if keep_clean_text:
+                    clean_text = mc.clean_text
+                    case_cols['clean_start'].append(size)
+                    parts.append(clean_text)
+                    size += len(clean_text)
+                    case_cols['clean_end'].append(size)
+                else:
+                    case_cols['clean_start'].append(-1)
+                    case_cols['clean_end'].append(-1)
+                case_cols['has_gold'].append(mc.gold is not None)
+                gold.append(_encode(mc.gold))
+                annots.append(_encode(mc.annots))
+        corpus.buffer = ''.join(parts)
+        del parts
+        case_cols['split_first'].append(len(split_cols['dates']))
+        for key, values in case_cols.items():
+            setattr(corpus, key, np.array(values, dtype = bool if key.startswith('has_') else np.int64))
+        corpus.split_start = np.array(split_cols['split_start'], dtype = np.int64)
+        corpus.split_end = np.array(split_cols['split_end'], dtype = np.int64)
+        corpus.dates = np.array(split_cols['dates'], dtype = 'datetime64[D]')
+        corpus.gold = np.array(gold, dtype = np.int8).reshape(len(corpus.names), len(TAGS_LABELS))
+        corpus.annots = np.array(annots, dtype = np.int8).reshape(len(corpus.names), len(TAGS_LABELS))
+        corpus.index = dict((name, row) for row, name in enumerate(corpus.names))
+        return corpus
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self.names)
+        if not 0 <= row < len(self.names):
+            raise IndexError('case {} out of range'.format(row))
+        return CaseView(self, row)
+
+    def __iter__(self):
+        for row in range(len(self.names)):
+            yield CaseView(self, row)
+
+    def case(self, name):
+        """View of case *name*."""
+        return CaseView(self, self.index[name])
+
+    def nbytes(self):
+        """Approximate size of the texts and arrays in bytes."""
+        arrays = [self.text_start, self.text_end, self.clean_start, self.clean_end, self.split_first, self.has_splits,
+                  self.has_gold, self.split_start, self.split_end, self.dates, self.gold, self.annots]
+        return len(self.buffer) + sum(array.nbytes for array in arrays)
+
+def _encode(annotations):
+    """Row of a label matrix from dict *annotations* (None: no annotations)."""
+    if annotations is None:
+        return [-1] * len(TAGS_LABELS)
+    return [LABEL_CODES.get(annotations.get(tag), -1) for tag in TAGS_LABELS]
+
+class AnnotationRow(object):
+    """Dict-like view of one row of a label matrix, tag: 'met', 'not met' or None."""
+    __slots__ = ('matrix', 'row')
+
+    def __init__(self, matrix, row):
+        self.matrix = matrix
+        self.row = row
+
+    def __getitem__(self, tag):
+        return LABEL_NAMES[int(self.matrix[self.row, TAGS_LABELS.index(tag)])]
+
+    def __setitem__(self, tag, value):
+        self.matrix[self.row, TAGS_LABELS.index(tag)] = LABEL_CODES[value]
+
+    def __iter__(self):
+        return iter(TAGS_LABELS)
+
+    def __len__(self):
+        return len(TAGS_LABELS)
+
+    def __contains__(self, tag):
+        return tag in TAGS_LABELS
+
+    def keys(self):
+        return list(TAGS_LABELS)
+
+    def items(self):
+        return [(tag, self[tag]) for tag in TAGS_LABELS]
+
+    def get(self, tag, default = None):
+        return self[tag] if tag in TAGS_LABELS else default
+
+class CaseView(object):
+    """
+    One case of a CompactCorpus with the interface of MedicalCase.
+    """
+    __slots__ = ('corpus', 'row')
+
+    index = None
+    conner = None
+
+    def __init__(self, corpus, row):
+        self.corpus = corpus
+        self.row = row
+
+    @property
+    def name(self):
+        return self.corpus.names[self.row]
+
+    @property
+    def text(self):
+        c = self.corpus
+        return c.buffer[c.text_start[self.row]:c.text_end[self.row]]
+
+    @property
+    def clean_text(self):
+        c = self.corpus
+        if c.clean_start[self.row] < 0:
+            raise ValueError('clean text of {} was not kept in the compact corpus'.format(self.name))
+        return c.buffer[c.clean_start[self.row]:c.clean_end[self.row]]
+
+    @property
+    def time_splits(self):
+        c = self.corpus
+        if not c.has_splits[self.row]:
+            return None
+        first, last = c.split_first[self.row], c.split_first[self.row + 1]
+        return [(date, c.buffer[start:end]) for date, start, end in
+                zip(c.dates[first:last].astype('datetime64[s]').tolist(), c.split_start[first:last],
+                    c.split_end[first:last])]
+
+    @property
+    def gold(self):
+        if not self.corpus.has_gold[self.row]:
+            return None
+        return dict((tag, LABEL_NAMES[int(code)]) for tag, code in zip(TAGS_LABELS, self.corpus.gold[self.row])
+                    if code >= 0)
+
+    @property
+    def annots(self):
+        return AnnotationRow(self.corpus.annots, self.row)
+
+    @property
+    def labs(self):
+        return self.corpus.labs[self.row]
+
+    def get_timed_text(self, time_limit):
+        """
+        Args:
+          *time_limit* (int) - in days
+        """
+        c = self.corpus
+        first, last = c.split_first[self.row], c.split_first[self.row + 1]
+        if time_limit is None or not c.has_splits[self.row] or last - first == 1:
+            return self.text
+        if c.windows_row != self.row:
+            c.windows.clear()
+            c.windows_row = self.row
+        if time_limit not in c.windows:
+            days = c.dates[first:last].astype(np.int64)
+            if (days[1:] >= days[:-1]).all():
+                selected = range(first + np.searchsorted(days, days[-1] - time_limit, 'left'), last)
+            else:
+                selected = np.nonzero(days[-1] - days <= time_limit)[0] + first
+            c.windows[time_limit] = ''.join([c.buffer[c.split_start[i]:c.split_end[i]] + ' ' for i in selected])
+        return c.windows[time_limit]
+
+    def lab_values(self, analyte, time_limit = None):
+        """Values of *analyte*, None if the case has no lab table (see MedicalCase.lab_values)."""
+        if self.labs is None:
+            return None
+        return select_lab_values(self.labs, analyte, self.time_splits, time_limit)
+
+    def meaningfulness(self, score_dict, splitter = ' '):
+        """See MedicalCase.meaningfulness."""
+        val = 0
+        for tok in self.clean_text.split(splitter):
+            if tok in score_dict:
+                val += score_dict[tok]
+        return val
+
+    def build_tags(self, noprint = False, save = False, save_folder = 'output'):
+        """Build output tags and save them to XML format if *save* is True"""
+        root = build_tags(dict(self.annots.items()))
+        if not noprint:
+            print(ET.tostring(root, 'utf-8'))
+        if save:
+            strdata = ET.tostring(root, 'utf-8')
+            with open(os.path.join(save_folder, self.name + '.xml'), "w") as f:
+                f.write(strdata)
+
+    def __repr__(self):
+        return "MedicalCase {}".format(self.name)
@@ -1,8 +1,9 @@
 import re
-import os, shutil
-import subprocess
+import os
 
-from medicalcase import MedicalCase
+from medicalcase import MedicalCase, load_cases
+from labels import LabelMatrix, load_labels
+from features import FeatureCache
 from utils import *
 
 from classifiers import *
@@ -18,7 +19,6 @@ from sklearn.naive_bayes import GaussianNB
 from sklearn.neural_network import MLPClassifier
 from xgboost import XGBClassifier
 from catboost import CatBoostClassifier
-from sklearn.model_selection import ShuffleSplit
 import numpy as np
 
 ### Params:
@@ -31,28 +31,20 @@ def load_cross_dataset(subj_names):
     """
     Loads crossvalidation dataset of patients data description.
     """
-    mcdata = []
-    for subj in subj_names:
-        mc = MedicalCase(subj,
-            description_path = CONFIG_PATH['preprocessed'].format(subj),
-            annotation_path= CONFIG_PATH['annotations'].format(subj),
-            conner = CONFIG_PATH['conner'].format(subj))
-        mcdata.append(mc)
-    return mcdata
+    tasks = [(subj, CONFIG_PATH['annotations'].format(subj), False, dict(conner = CONFIG_PATH['conner'].format(subj)))
+             for subj in subj_names]
+    return load_cases(tasks, snapshot = CONFIG_PATH['snapshot'])
 
-ss = ShuffleSplit(n_splits = N_cross, test_size = 0.1)
-
-all_paths = [x[:-4] for x in os.listdir('train/')]
+labels = load_labels('train', CONFIG_PATH['label_matrix'])
+features = FeatureCache(CONFIG_PATH['features'])
 
 full_scores = dict([(t, []) for t in TAGS_LABELS])
 full_scores['Overall'] = []
 
-for spl in ss.split(all_paths):
-    test_paths = [ap for e, ap in enumerate(all_paths) if e in spl[1]]
-    train_paths = [ap for e, ap in enumerate(all_paths) if e in spl[0]]
-
+for train_paths, test_paths in labels.shuffle_splits(N_cross, test_size = 0.1):
     mc_train = load_cross_dataset(train_paths)
-    texts, annots = get_training_from_mc(mc_train)
+    texts, _ = get_training_from_mc(mc_train)
+    annots = labels.select(train_paths)
 
     vectorizer = DEFAULT_VECTORIZER
     if model_building:
@@ -62,8 +54,10 @@ for spl in ss.split(all_paths):
             print('Building: ' + tag)
             if tag in TIME_LIMITED_TAGS.keys():
                 texts_timed, _ = get_training_from_mc(mc_train, TIME_LIMITED_TAGS[tag])
-                build_model(clf, texts_timed, annots, vectorizer, tag, 'models/model')
-            build_model(clf, texts, annots, vectorizer, tag, 'models/model')
+                build_model(clf, texts_timed, annots, vectorizer, tag, 'models/model',
+                            features = features.transform(vectorizer, texts_timed, TIME_LIMITED_TAGS[tag]))
+            build_model(clf, texts, annots, vectorizer, tag, 'models/model',
+                        features = features.transform(vectorizer, texts))
 
     mc_test = load_cross_dataset(test_paths)
 
@@ -71,34 +65,11 @@ for spl in ss.split(all_paths):
         disc = TAG_TO_CLASSES[tag](mc_test)
         disc.predict()
 
-    out_fold_name = 'crossout'
-    trn_fold_name = 'crosstrn'
-
-    os.mkdir(out_fold_name)
-    os.mkdir(trn_fold_name)
-
-    for mc in mc_test:
-        mc.build_tags(noprint=True, save=True, save_folder = out_fold_name)
-
-    for mc in mc_test:
-        shutil.copyfile('train/' + mc.name +'.xml', trn_fold_name + '/' + mc.name +'.xml')
-
-    bash_command = "python iaa.py -t 1 {}/ {}/".format(trn_fold_name, out_fold_name)
-    process = subprocess.Popen(bash_command.split(), stdout=subprocess.PIPE)
-    output, error = process.communicate()
-
-    print(output)
-
-    idx = output.index('Overall')
-    full_scores['Overall'].append(float(output[idx+24:idx+31].strip()))
-    for tg in TAGS_LABELS:
-        idx = output.index(tg[0] + tg[1:].lower())
-        patt = re.findall('[0-9].[0-9][0-9][0-9]*', output[idx:idx+36])
-        patt = patt[-1] # to get F1, 0 would be precision
-        full_scores[tg].append(float(patt))
-
-    shutil.rmtree(out_fold_name)
-    shutil.rmtree(trn_fold_name)
+    predicted = LabelMatrix.from_annotations(test_paths, [mc.annots for mc in mc_test]).matrix
+    scores = labels.score(predicted, test_paths)
+    for tg in TAGS_LABELS + ['Overall']:
+        print('{:>20}  {:<5.4f}  {:<5.4f}  {:<5.4f}'.format(tg[0] + tg[1:].lower(), *scores[tg]))
+        full_scores[tg].append(scores[tg][2]) # F1
 
 print('+' * 12)
 
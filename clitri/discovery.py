@@ -1,7 +1,6 @@
 import re
 import os, sys
 import sklearn
-from datetime import timedelta
 
 from medicalcase import MedicalCase, load_whole_dataset, load_test_dataset
 from utils import *
@@ -29,14 +28,7 @@ class Discover(object):
         Returns text from medical condition object *mc*.
         The function check time constraints on medical data if provided.
         '''
-        if self.time_limit is None or mc.time_splits is None or len(mc.time_splits) == 1:
-            return mc.text
-        now_ = mc.time_splits[-1][0]
-        selected_text = ""
-        for ts, ttext in mc.time_splits:
-            if not now_ - ts > timedelta(days=self.time_limit):
-                selected_text += ttext + ' '
-        return selected_text
+        return mc.get_timed_text(self.time_limit)
 
     def predict(self, data = None):
         """
@@ -114,8 +106,20 @@ class DiscoverHBA1C(Discover):
           data (list <MedicalCase>)
         """
         super(DiscoverHBA1C, self).__init__(data)
+        self.hba1c_low = 6.5
+        self.hba1c_high = 9.5
         self.tag = 'HBA1C'
 
+    def _textual_detection(self, txt):
+        """
+        Detect based on HbA1c values of the lab table, taken from the records of *txt*
+        (same time limit). Returns True if a value is in range, None (model decides) otherwise.
+        """
+        values = self.currmc.lab_values('hba1c', self.time_limit)
+        if values and any(self.hba1c_low <= x <= self.hba1c_high for x in values):
+            return True
+        return None
+
 
 class DiscoverCreatinine(Discover):
     """Discover for CREATININE clinical trial"""
@@ -129,6 +133,16 @@ class DiscoverCreatinine(Discover):
         self.creatinine_high = 1.5
         self.tag = 'CREATININE'
 
+    def _textual_detection(self, txt):
+        """
+        Detect based on creatinine values of the lab table, taken from the records of *txt*
+        (same time limit). Returns True if a value is above normal, None (model decides) otherwise.
+        """
+        values = self.currmc.lab_values('creatinine', self.time_limit)
+        if values and max(values) > self.creatinine_high:
+            return True
+        return None
+
 class DiscoverKeto(Discover):
     """Discover for KETO-1YR clinical trial"""
     def __init__(self, data):
@@ -306,14 +320,14 @@ TAG_TO_CLASSES = {
 
 if __name__ == '__main__':
     if len(sys.argv) == 1:
-        mcdata = load_test_dataset()
+        mcdata = load_test_dataset(lazy = True, keep_clean_text = False, snapshot = CONFIG_PATH['test_snapshot'])
         for tag in TAGS_LABELS:
             disc = TAG_TO_CLASSES[tag](mcdata)
             disc.predict()
         for mc in mcdata:
             mc.build_tags(noprint=True, save=True, save_folder = 'testoutput/')
     else:
-        mcdata = load_test_dataset(annotations = 'test_gold/{}.xml')
+        mcdata = load_test_dataset(annotations = 'test_gold/{}.xml', snapshot = CONFIG_PATH['test_snapshot'])
         #mcdata = load_whole_dataset()
         tag_to_predict = sys.argv[1]
         disc = TAG_TO_CLASSES[tag_to_predict](mcdata)
@@ -0,0 +1,71 @@
+import os
+import hashlib
+import scipy.sparse
+
+from utils import load_pickle
+from snapshot import file_signature
+
+'''
+Cache of vectorized corpora shared by the models of all tags.
+
+vectorizer.transform() of the whole training corpus is the same for every tag
+trained on the same texts, so the CSR matrix is computed once per (vectorizer,
+texts) and kept in memory and on disk as .npz in CONFIG_PATH['features'], where
+other processes and later runs find it. The key is the size and modification
+time of the vectorizer pickle and a sha1 of the texts, which covers the corpus
+(snapshot) and the time window the texts were cut with.
+'''
+
+class FeatureCache(object):
+    """
+    Args:
+      folder (str) - folder of the .npz files, created on first write
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        self.matrices = {}     # key: csr matrix
+        self.vectorizers = {}  # path: vectorizer
+
+    def key(self, vectorizer_path, texts):
+        """Key of *texts* vectorized by the pickle *vectorizer_path*."""
+        h = hashlib.sha1()
+        h.update(file_signature(vectorizer_path).encode('utf-8'))
+        for text in texts:
+            h.update(b'\0')
+            h.update(text.encode('utf-8') if not isinstance(text, bytes) else text)
+        return h.hexdigest()
+
+    def path(self, vectorizer_path, key, window = None):
+        """File of matrix *key*; *window* (days) is added to the name for readability."""
+        name = '{}_{}_{}.npz'.format(os.path.basename(vectorizer_path).replace('.pkl', ''),
+                                     'full' if window is None else window, key[:16])
+        return os.path.join(self.folder, name)
+
+    def vectorizer(self, vectorizer_path):
+        """Vectorizer from pickle *vectorizer_path*, loaded once."""
+        if vectorizer_path not in self.vectorizers:
+            self.vectorizers[vectorizer_path] = load_pickle(vectorizer_path)
+        return self.vectorizers[vectorizer_path]
+
+    def transform(self, vectorizer_path, texts, window = None):
+        """
+        Returns CSR matrix of *texts* (rows in their order) vectorized by the
+        pickle *vectorizer_path*, computed only if it is not cached.
+        Args:
+          window (int) - time limit the texts were cut with, only used in the file name
+        """
+        key = self.key(vectorizer_path, texts)
+        if key in self.matrices:
+            return self.matrices[key]
+        path = self.path(vectorizer_path, key, window)
+        if os.path.exists(path):
+            matrix = scipy.sparse.load_npz(path).tocsr()
+        else:
+            matrix = self.vectorizer(vectorizer_path).transform(texts).tocsr()
+            if not os.path.isdir(self.folder):
+                os.makedirs(self.folder)
+            tmp = path[:-len('.npz')] + '.tmp.npz'
+            scipy.sparse.save_npz(tmp, matrix, compressed = False)
+            os.rename(tmp, path)
+        self.matrices[key] = matrix
+        return matrix
@@ -7,7 +7,7 @@ import matplotlib.pyplot as plt
 meaning_threshold = 1.1
 ###########
 
-mcdata = load_whole_dataset()
+mcdata = load_whole_dataset(snapshot = CONFIG_PATH['snapshot'])
 texts, annots = get_training_from_mc(mcdata)
 
 tags = annots[0].keys()
@@ -0,0 +1,137 @@
+import os
+import hashlib
+import numpy as np
+
+from utils import TAGS_LABELS, MET_LABEL, get_annotations, balancing
+from snapshot import file_signature
+
+'''
+Gold labels of a corpus as one uint8 matrix: a row per patient, a column per
+tag of TAGS_LABELS, 1 for met and 0 for not met. It is parsed once from the
+annotation files and stored as .npz (CONFIG_PATH['label_matrix']) together with
+the sizes and modification times of the files; tag selection, balancing,
+cross-validation splits and scoring work on rows of the matrix.
+'''
+
+class LabelMatrix(object):
+    """
+    Args:
+      ids (list <str>) - patient names, one per row of *matrix*
+      matrix (np.array) - uint8 array len(ids) x len(TAGS_LABELS)
+      sources (str) - signature of the annotation files the matrix was built from
+    """
+    def __init__(self, ids, matrix, sources = ''):
+        self.ids = list(ids)
+        self.matrix = np.asarray(matrix, dtype = np.uint8)
+        self.sources = sources
+        self.index = dict((name, row) for row, name in enumerate(self.ids))
+
+    @classmethod
+    def from_annotations(cls, ids, annotations, sources = ''):
+        """Matrix of *annotations* (list of dicts tag: 'met'/'not met') of patients *ids*."""
+        matrix = np.array([[1 if annotation.get(tag) == MET_LABEL else 0 for tag in TAGS_LABELS]
+                           for annotation in annotations], dtype = np.uint8).reshape(len(ids), len(TAGS_LABELS))
+        return cls(ids, matrix, sources)
+
+    @classmethod
+    def from_folder(cls, folder):
+        """Matrix of all annotation files <id>.xml in *folder*, rows sorted by id."""
+        names = sorted(x for x in os.listdir(folder) if x.endswith('.xml'))
+        annotations = [get_annotations(os.path.join(folder, name)) for name in names]
+        return cls.from_annotations([name[:-4] for name in names], annotations, folder_signature(folder, names))
+
+    @classmethod
+    def load(cls, path):
+        """Matrix saved by save()."""
+        data = np.load(path)
+        return cls([str(x) for x in data['ids']], data['matrix'], str(data['sources']))
+
+    def save(self, path):
+        """Writes the matrix to *path* (.npz); the old file is replaced only after a complete write."""
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, ids = np.array(self.ids), matrix = self.matrix, sources = np.array(self.sources))
+        os.rename(tmp, path)
+
+    def rows(self, ids):
+        """Row numbers of patients *ids*."""
+        return np.array([self.index[name] for name in ids], dtype = np.intp)
+
+    def select(self, ids):
+        """Sub-matrix with rows of patients *ids* in their order."""
+        return self.matrix[self.rows(ids)]
+
+    def column(self, tag, ids = None):
+        """Labels of *tag* of all patients or of *ids*."""
+        matrix = self.matrix if ids is None else self.select(ids)
+        return matrix[:, TAGS_LABELS.index(tag)]
+
+    def balanced(self, tag, ids = None, method = 'under'):
+        """
+        Positions (in *ids*, or rows of the matrix) of a sample balanced on *tag*,
+        see utils.balancing.
+        """
+        first, second = balancing(self.column(tag, ids), method)
+        return np.r_[first, second]
+
+    def shuffle_splits(self, n_splits, test_size = 0.1, seed = None):
+        """
+        Returns *n_splits* random (train ids, test ids), *test_size* is the
+        fraction of patients in the test part.
+        """
+        rng = np.random.RandomState(seed)
+        ids = np.array(self.ids)
+        n_test = int(np.ceil(test_size * len(ids)))
+        splits = []
+        for i in range(n_splits):
+            order = rng.permutation(len(ids))
+            splits.append((list(ids[order[n_test:]]), list(ids[order[:n_test]])))
+        return splits
+
+    def score(self, predicted, ids):
+        """
+        Precision, recall and F1 of met per tag and overall (micro), as computed
+        by iaa.py for track 1.
+
+        Args:
+          predicted (np.array) - 0/1 matrix len(ids) x len(TAGS_LABELS)
+          ids (list <str>) - patients of rows of *predicted*
+        Returns:
+          dict tag or 'Overall': (precision, recall, f1)
+        """
+        gold = self.select(ids).astype(bool)
+        predicted = np.asarray(predicted).astype(bool)
+        tp = (gold & predicted).sum(axis = 0)
+        fp = (~gold & predicted).sum(axis = 0)
+        fn = (gold & ~predicted).sum(axis = 0)
+        scores = dict((tag, _prf(tp[i], fp[i], fn[i])) for i, tag in enumerate(TAGS_LABELS))
+        scores['Overall'] = _prf(tp.sum(), fp.sum(), fn.sum())
+        return scores
+
+def _prf(tp, fp, fn):
+    precision = tp * 1. / (tp + fp) if tp + fp else 0.0
+    recall = tp * 1. / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return precision, recall, f1
+
+def folder_signature(folder, names):
+    """sha1 of sizes and modification times of files *names* in *folder*."""
+    h = hashlib.sha1()
+    for name in names:
+        h.update(file_signature(os.path.join(folder, name)).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+def load_labels(folder = 'train', path = None):
+    """
+    LabelMatrix of annotations in *folder*, read from *path* if it was built from
+    the same files, otherwise parsed again (and saved to *path* if given).
+    """
+    if path and os.path.exists(path):
+        labels = LabelMatrix.load(path)
+        names = sorted(x for x in os.listdir(folder) if x.endswith('.xml'))
+        if labels.sources == folder_signature(folder, names):
+            return labels
+    labels = LabelMatrix.from_folder(folder)
+    if path:
+        labels.save(path)
+    return labels
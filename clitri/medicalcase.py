@@ -1,32 +1,150 @@
-import re, os, copy
+import re, os, sys, copy, json
+import bisect
+import multiprocessing
 import xml.etree.cElementTree as ET
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from utils import *
+from packed import PackedCorpus
+from snapshot import CorpusSnapshot
+from corpus import CompactCorpus
 try:
     from conreader import ConNer
 except ImportError:
     pass
 
+PREPROC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'preproc')
+
+_preprocessor = None
+
+def get_preprocessor():
+    """
+    Returns Preprocessor from preproc/preprocessing.py, created on first use
+    and shared by all cases preprocessed in this process.
+    """
+    global _preprocessor
+    if _preprocessor is None:
+        if PREPROC_DIR not in sys.path:
+            sys.path.append(PREPROC_DIR)
+        from preprocessing import Preprocessor
+        _preprocessor = Preprocessor()
+    return _preprocessor
+
+class _Pending(object):
+    """Marks attributes of a lazy case which were not computed yet; pickled by reference."""
+    def __reduce__(self):
+        return '_PENDING'
+
+_PENDING = _Pending()
+
 class MedicalCase(object):
-    def __init__(self, name, description_path, annotation_path = None, conner = False):
+    def __init__(self, name, description_path = None, annotation_path = None, conner = False, text = None,
+                 labs = None, index = None, lazy = False, keep_clean_text = True):
         """
         Args:
           name (str) - patient name
           description_path (str) - description of medical case as txt or xml file
           annotation_path (str) - annotation from XML in PatientMatching format
           conner (str) - path to NER clinical annotations in i2b2 format
+          text (str) - preprocessed description, used instead of *description_path*
+          labs (list) - lab table (record date, analyte, value, offset), see utils.get_labs
+          index (dict) - index of records in the preprocessed description, see utils.get_index
+          lazy (bool) - read the description and compute *text*, *time_splits* and *gold*
+                        on first access instead of here
+          keep_clean_text (bool) - if False, *clean_text* is dropped as soon as *text* and
+                                   *time_splits* are computed (it is read again from
+                                   *description_path* if needed later)
         """
         self.name = name
-        self.clean_text = get_description(description_path) if description_path.endswith('.xml') else get_raw_txt(description_path)
-        self.text = default_text_preprocessing(self.clean_text)
-        self.gold = get_annotations(annotation_path) if annotation_path else None
+        self.description_path = description_path
+        self.annotation_path = annotation_path
+        self.keep_clean_text = keep_clean_text
+        self._clean_text = text
+        self._text = _PENDING
+        self._time_splits = _PENDING
+        self._gold = _PENDING
         self.annots = copy.copy(EMPTY_ANNOT)
-        self.time_splits = self._make_time_splits()
+        self.index = index
+        self.labs = labs
+        self._days = None     # ordinal day of every record, see _window
+        self._windows = {}    # time_limit: text, at most WINDOW_MEMO entries
+        if not lazy:
+            self.text
+            self.gold
+            self.time_splits
         self.conner = None
         if conner:
             self.conner = self._read_conner(conner)
 
+    @property
+    def clean_text(self):
+        """Description text as read (preprocessed, but not by default_text_preprocessing)."""
+        if self._clean_text is None:
+            if self.description_path is None:
+                raise ValueError('clean text of {} was dropped and has no description path'.format(self.name))
+            if self.description_path.endswith('.xml'):
+                self._clean_text = get_description(self.description_path)
+            else:
+                self._clean_text = get_raw_txt(self.description_path)
+        return self._clean_text
+
+    @property
+    def text(self):
+        """Whole description after default_text_preprocessing."""
+        if self._text is _PENDING:
+            self._text = default_text_preprocessing(self.clean_text)
+            self._release_clean_text()
+        return self._text
+
+    @property
+    def time_splits(self):
+        """List of (date, text) of records, None if a record has no date."""
+        if self._time_splits is _PENDING:
+            self._time_splits = self._make_time_splits()
+            self._release_clean_text()
+        return self._time_splits
+
+    @property
+    def gold(self):
+        """Annotations read from *annotation_path*, None without it."""
+        if self._gold is _PENDING:
+            self._gold = get_annotations(self.annotation_path) if self.annotation_path else None
+        return self._gold
+
+    def drop_clean_text(self):
+        """
+        Frees *clean_text*; *text* and *time_splits* are computed first so the
+        case keeps working without it.
+        """
+        self.text
+        self.time_splits
+        self._clean_text = None
+
+    def _release_clean_text(self):
+        if not self.keep_clean_text and self._text is not _PENDING and self._time_splits is not _PENDING:
+            self._clean_text = None
+
+    def __getstate__(self):
+        """Pickled without the memos of get_timed_text, which are rebuilt on use."""
+        state = dict(self.__dict__)
+        state['_days'] = None
+        state['_windows'] = {}
+        return state
+
+    @classmethod
+    def from_record(cls, name, raw_xml, annotation_path = None, preprocessor = None):
+        """
+        Creates a case from unprocessed record *raw_xml* (PatientMatching format),
+        preprocessed in-process instead of reading 02_main.
+        Args:
+          preprocessor (Preprocessor) - default: shared one from get_preprocessor()
+        """
+        preprocessor = preprocessor or get_preprocessor()
+        labs = []
+        text = preprocessor.preprocess_document(raw_xml, labs)
+        labs = [(date, analyte, float(value), offset) for date, analyte, value, offset in labs]
+        return cls(name, annotation_path = annotation_path, text = text, labs = labs)
+
     def build_tags(self, noprint = False, save = False, save_folder = 'output'):
         """Build output tags and save them to XML format if *save* is True"""
         root = build_tags(self.annots)
@@ -44,12 +162,36 @@ class MedicalCase(object):
         """
         if time_limit is None or self.time_splits is None or len(self.time_splits) == 1:
             return self.text
-        now_ = self.time_splits[-1][0]
-        selected_text = ""
-        for ts, ttext in self.time_splits:
-            if not now_ - ts > timedelta(days = time_limit):
-                selected_text += ttext + ' '
-        return selected_text
+        if time_limit not in self._windows:
+            if len(self._windows) >= WINDOW_MEMO:
+                self._windows.clear()
+            self._windows[time_limit] = self._window(time_limit)
+        return self._windows[time_limit]
+
+    def _window(self, time_limit):
+        """
+        Records within *time_limit* days from the last one, each followed by a space.
+        With ascending dates these are the records from the first one in the window,
+        found by bisection.
+        """
+        if self._days is None:
+            self._days = [ts.toordinal() for ts, ttext in self.time_splits]
+        days = self._days
+        if any(a > b for a, b in zip(days, days[1:])):
+            return ''.join([ttext + ' ' for (ts, ttext), day in zip(self.time_splits, days)
+                            if not days[-1] - day > time_limit])
+        first = bisect.bisect_left(days, days[-1] - time_limit)
+        return ''.join([ttext + ' ' for ts, ttext in self.time_splits[first:]])
+
+    def lab_values(self, analyte, time_limit = None):
+        """
+        Values of *analyte* ('creatinine', 'hba1c') found by preprocessing,
+        None if the case has no lab table. With *time_limit* (days) only values
+        of the records in get_timed_text(time_limit).
+        """
+        if self.labs is None:
+            return None
+        return select_lab_values(self.labs, analyte, self.time_splits, time_limit)
 
     def meaningfulness(self, score_dict, splitter = ' '):
         '''
@@ -66,40 +208,43 @@ class MedicalCase(object):
                 val += score_dict[tok]
         return val
 
-    def _make_time_splits(self):
+    def _record_cuts(self):
         """
-        Splits description text into time steps based on "record date" pattern.
+        Returns (start, end, date) of "record date" patterns in description text,
+        date is '' if not found. Read from the record index if the case has one.
         """
-        time_splits = []
+        if self.index is not None:
+            return [tuple(record) for record in self.index['records']]
+        cuts = []
         rex = re.compile("this is record date[ \n:].")
         rex_date = re.compile("[0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9]")
+        for m in rex.finditer(self.clean_text):
+            dates = rex_date.findall(self.clean_text[m.start():m.start()+40].replace('\n', ' '))
+            cuts.append((m.start(), m.end(), dates[0] if dates else ''))
+        return cuts
+
+    def _make_time_splits(self):
+        """
+        Splits description text into time steps based on "record date" pattern.
+        """
+        dates, texts = [], []
         date_format = '%Y%m%d'
-        cuts = [(m.start(), m.end()) for m in rex.finditer(self.clean_text)]
+        clean_text = self.clean_text
+        cuts = self._record_cuts()
         if len(cuts) > 1:
-            for i in range(len(cuts)-1):
-                cutting = self.clean_text[cuts[i][0]:cuts[i][0]+40].replace('\n', ' ')
-                try:
-                    pattdate =  rex_date.findall(cutting)[0]
-                except IndexError:
+            for i in range(len(cuts)):
+                pattdate = cuts[i][2]
+                if not pattdate:
                     return None
-                date = datetime.strptime(pattdate, date_format)
-                txt = self.clean_text[cuts[i][1]:cuts[i+1][0]]
-                time_splits.append((date, default_text_preprocessing(txt)))
-            cutting = self.clean_text[cuts[-1][0]:cuts[-1][0]+40].replace('\n', ' ')
-            try:
-                pattdate =  rex_date.findall(cutting)[0]
-                date = datetime.strptime(pattdate, date_format)
-                txt = self.clean_text[cuts[-1][1]:]
-                time_splits.append((date, default_text_preprocessing(txt)))
-            except IndexError:
-                return None
+                dates.append(datetime.strptime(pattdate, date_format))
+                texts.append(clean_text[cuts[i][1]:cuts[i+1][0]] if i + 1 < len(cuts) else clean_text[cuts[i][1]:])
         else:
-            cutting = self.clean_text[cuts[0][0]:cuts[0][0]+40].replace('\n', ' ')
-            pattdate =  rex_date.findall(cutting)[0]
-            date = datetime.strptime(pattdate, date_format)
-            txt = self.clean_text[cuts[-1][1]:]            
-            time_splits.append((date, default_text_preprocessing(txt)))
-        return time_splits
+            pattdate = cuts[0][2]
+            if not pattdate:
+                raise IndexError('no record date in {}'.format(self.name))
+            dates.append(datetime.strptime(pattdate, date_format))
+            texts.append(clean_text[cuts[-1][1]:])
+        return list(zip(dates, default_text_preprocessing_batch(texts)))
 
     def _read_conner(self, path):
         """Returns ConNer object"""
@@ -109,40 +254,169 @@ class MedicalCase(object):
         return "MedicalCase {}".format(self.name)
 
 
-def load_whole_dataset(path = 'train'):
+def read_labs(path):
+    """Lab table from *path*, None for data preprocessed without 02_labs."""
+    if not os.path.exists(path):
+        return None
+    return get_labs(path)
+
+def read_index(path):
+    """Record index from *path*, None for data preprocessed without 02_index."""
+    if not os.path.exists(path):
+        return None
+    return get_index(path)
+
+def preprocessed(subj, corpus = None, test = False):
+    """
+    Returns keyword arguments of MedicalCase with preprocessed data of *subj*,
+    read from packed *corpus* (PackedCorpus) if given, otherwise from the
+    files in CONFIG_PATH (test files if *test*).
+    """
+    prefix = 'test_' if test else ''
+    if corpus is None:
+        return dict(description_path = CONFIG_PATH[prefix + 'preprocessed'].format(subj),
+                    labs = read_labs(CONFIG_PATH[prefix + 'labs'].format(subj)),
+                    index = read_index(CONFIG_PATH[prefix + 'index'].format(subj)))
+    text = corpus.get(subj)
+    if text is None:
+        raise KeyError('{} is not in packed corpus {}'.format(subj, corpus.path))
+    labs = corpus.get(subj, 'labs')
+    index = corpus.get(subj, 'index')
+    return dict(text = text,
+                labs = None if labs is None else parse_labs(labs),
+                index = None if index is None else json.loads(index))
+
+# --- packed corpus opened in the loading process, see init_loader
+_corpus = None
+
+def init_loader(packed = None):
+    """Opens packed corpus file *packed* (None: preprocessed files) for load_case in this process."""
+    global _corpus
+    if _corpus is not None:
+        _corpus.close()
+    _corpus = PackedCorpus(packed) if packed else None
+
+def load_case(task):
+    """
+    Creates a case from *task* (subj, annotation_path, test, options), where *options*
+    are further arguments of MedicalCase and *test* selects test files of CONFIG_PATH.
+    Returns (case, None), or (None, error message) if the case cannot be loaded.
+    """
+    subj, annotation_path, test, options = task
+    try:
+        kwargs = preprocessed(subj, _corpus, test)
+        kwargs.update(options)
+        return MedicalCase(subj, annotation_path = annotation_path, **kwargs), None
+    except Exception as e:
+        return None, '{}: {}'.format(type(e).__name__, e)
+
+def load_cases(tasks, jobs = None, packed = None, skip_errors = False, snapshot = None):
+    """
+    Loads cases of *tasks* (see load_case) in the order of *tasks*.
+    Args:
+      jobs (int) - number of processes, 0 means one per CPU core, default LOAD_JOBS;
+                   with more than one the cases are loaded completely in the workers
+                   (*lazy* has no effect)
+      packed (str) - packed corpus file, see init_loader
+      skip_errors (bool) - leave out cases which cannot be loaded instead of raising
+                           ValueError; in both cases the failures are printed sorted by patient
+      snapshot (str) - snapshot folder (see snapshot.py, e.g. CONFIG_PATH['snapshot']); cases
+                       are taken from it unless their sources changed, the others are
+                       loaded completely and stored in it
+    """
+    store = None
+    if snapshot:
+        store = CorpusSnapshot(snapshot)
+        tasks = [(subj, annotation_path, test, dict(options, lazy = False))
+                 for subj, annotation_path, test, options in tasks]
+        keys = [store.key(task, packed) for task in tasks]
+        results = [(store.get(entry, key), None) for entry, key in keys]
+    else:
+        results = [(None, None)] * len(tasks)
+    missing = [i for i, (mc, error) in enumerate(results) if mc is None]
+    for i, result in zip(missing, _load_all([tasks[i] for i in missing], jobs, packed)):
+        results[i] = result
+        if store is not None and result[0] is not None:
+            store.put(keys[i][0], keys[i][1], result[0])
+    failures = sorted((task[0], error) for task, (mc, error) in zip(tasks, results) if error is not None)
+    if failures:
+        report = '{} of {} cases could not be loaded:\n'.format(len(failures), len(tasks))
+        report += '\n'.join('  {}: {}'.format(subj, error) for subj, error in failures)
+        if not skip_errors:
+            raise ValueError(report)
+        print(report)
+    return [mc for mc, error in results if error is None]
+
+def _load_all(tasks, jobs, packed):
+    """Results of load_case for all *tasks*, see load_cases."""
+    jobs = LOAD_JOBS if jobs is None else jobs
+    if jobs == 0:
+        jobs = multiprocessing.cpu_count()
+    jobs = min(jobs, len(tasks))
+    if jobs > 1:
+        tasks = [(subj, annotation_path, test, dict(options, lazy = False))
+                 for subj, annotation_path, test, options in tasks]
+        pool = multiprocessing.Pool(jobs, initializer = init_loader, initargs = (packed,))
+        try:
+            return pool.map(load_case, tasks, max(1, len(tasks) // (jobs * 4)))
+        finally:
+            pool.close()
+            pool.join()
+    init_loader(packed)
+    try:
+        return [load_case(task) for task in tasks]
+    finally:
+        init_loader(None)
+
+def load_compact(tasks, jobs = None, packed = None, skip_errors = False, snapshot = None, keep_clean_text = False,
+                 chunk_size = 1000):
+    """
+    Loads cases of *tasks* (see load_cases) into a CompactCorpus, *chunk_size* cases
+    at a time so that only one chunk of MedicalCase objects is in memory (failures
+    are reported per chunk).
+    """
+    chunks = (load_cases(tasks[i:i+chunk_size], jobs, packed, skip_errors, snapshot)
+              for i in range(0, len(tasks), chunk_size))
+    return CompactCorpus.from_cases(chunks, keep_clean_text)
+
+def load_whole_dataset(path = 'train', packed = None, lazy = False, keep_clean_text = True, jobs = None,
+                       skip_errors = False, snapshot = None, compact = False):
     """
     Loads whole dataset of patients data description.
     Paths to specific files are defined in CONFIG_PATH constant.
+    *packed* - packed corpus file (see packed.py, e.g. CONFIG_PATH['packed'])
+               read instead of the preprocessed files
+    *lazy*, *keep_clean_text* - see MedicalCase
+    *jobs*, *skip_errors*, *snapshot* - see load_cases
+    *compact* - return a CompactCorpus (see corpus.py) instead of a list of MedicalCase
     """
-    mcdata = []
-    for subj in [x[:-4] for x in os.listdir(path)]:
-        mc = MedicalCase(subj,
-            description_path = CONFIG_PATH['preprocessed'].format(subj),
-            annotation_path= CONFIG_PATH['annotations'].format(subj)) 
-        #conner = CONFIG_PATH['conner'].format(subj)) - not used in the end
-        mcdata.append(mc)
-    return mcdata
-
-def load_test_dataset(path = 'test_notags', annotations = ''):
+    options = dict(lazy = lazy, keep_clean_text = keep_clean_text)
+    tasks = [(subj, CONFIG_PATH['annotations'].format(subj), False, options)
+             for subj in [x[:-4] for x in os.listdir(path)]]
+    #conner = CONFIG_PATH['conner'].format(subj)) - not used in the end
+    if compact:
+        return load_compact(tasks, jobs, packed, skip_errors, snapshot, keep_clean_text)
+    return load_cases(tasks, jobs, packed, skip_errors, snapshot)
+
+def load_test_dataset(path = 'test_notags', annotations = '', packed = None, lazy = False, keep_clean_text = True,
+                      jobs = None, skip_errors = False, snapshot = None, compact = False):
     """
     Loads whole test dataset of patients data description.
     Paths to specific files are defined in CONFIG_PATH constant.
     *annotantions* - 
+    *packed* - packed corpus file (e.g. CONFIG_PATH['test_packed']), see load_whole_dataset
+    *lazy*, *keep_clean_text* - see MedicalCase
+    *jobs*, *skip_errors*, *snapshot* - see load_cases
+    *compact* - return a CompactCorpus (see corpus.py) instead of a list of MedicalCase
     """
-    mcdata = []
-    for subj in [x[:-4] for x in os.listdir(path)]:
-        if len(annotations):
-            mc = MedicalCase(subj,
-                description_path = CONFIG_PATH['test_preprocessed'].format(subj),
-                annotation_path = annotations.format(subj))
-        else:
-            mc = MedicalCase(subj,
-                description_path = CONFIG_PATH['test_preprocessed'].format(subj))
-        mcdata.append(mc)
-    return mcdata
+    options = dict(lazy = lazy, keep_clean_text = keep_clean_text)
+    tasks = [(subj, annotations.format(subj) if len(annotations) else None, True, options)
+             for subj in [x[:-4] for x in os.listdir(path)]]
+    if compact:
+        return load_compact(tasks, jobs, packed, skip_errors, snapshot, keep_clean_text)
+    return load_cases(tasks, jobs, packed, skip_errors, snapshot)
 
 if __name__ == '__main__':
-    import sys
     subj = sys.argv[1]
     mc = MedicalCase(subj,
         description_path = 'preproc/02_main/{}.xml.txt'.format(subj),
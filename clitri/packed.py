@@ -0,0 +1,109 @@
+import os
+import mmap
+import zlib
+import json
+import struct
+import argparse
+
+'''
+Packed corpus: preprocessed texts of all patients in one file, which is memory
+mapped and hands out the text of a patient without opening a file per patient.
+
+Layout:
+  magic (8 bytes) | offset of the table (8 bytes, little endian) | data | table
+where data are the members of all patients one after another (UTF-8, every
+member compressed on its own with zlib if the pack is compressed) and table is
+json {"compression": "zlib" or "none", "members": {member: {patient: [start, length]}}}.
+Members are 'text' (02_main) and, if preprocessing wrote them, 'index' (02_index)
+and 'labs' (02_labs).
+'''
+
+MAGIC = b'CLTRPCK1'
+HEADER = struct.Struct('<8sQ')
+
+# --- members of a patient and folders of preprocessing output they are read from
+MEMBERS = [('text', '02_main'), ('index', '02_index'), ('labs', '02_labs')]
+SUFFIX = '.xml.txt'
+
+def pack_corpus(preproc_dir, path, compress = False):
+    """
+    Packs preprocessing output from *preproc_dir* (e.g. 'preproc') into *path*;
+    the file is replaced only after a complete write. Returns number of patients.
+    """
+    names = sorted(x[:-len(SUFFIX)] for x in os.listdir(os.path.join(preproc_dir, '02_main')) if x.endswith(SUFFIX))
+    table = {'compression': 'zlib' if compress else 'none', 'members': {}}
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, 0))
+        for member, folder in MEMBERS:
+            if not os.path.isdir(os.path.join(preproc_dir, folder)):
+                continue
+            offsets = table['members'][member] = {}
+            for name in names:
+                member_path = os.path.join(preproc_dir, folder, name + SUFFIX)
+                if not os.path.exists(member_path):
+                    continue
+                with open(member_path, 'rb') as g:
+                    data = g.read()
+                if compress:
+                    data = zlib.compress(data)
+                offsets[name] = [f.tell(), len(data)]
+                f.write(data)
+        table_offset = f.tell()
+        f.write(json.dumps(table, sort_keys = True).encode('utf-8'))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, table_offset))
+    os.rename(tmp, path)
+    return len(names)
+
+class PackedCorpus(object):
+    """
+    Memory mapped packed corpus written by pack_corpus.
+
+    Args:
+      path (str) - pack file
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        magic, table_offset = HEADER.unpack(self.data[:HEADER.size])
+        if magic != MAGIC:
+            raise ValueError('{} is not a packed corpus'.format(path))
+        table = json.loads(self.data[table_offset:].decode('utf-8'))
+        self.compressed = table['compression'] == 'zlib'
+        self.members = table['members']
+
+    def names(self):
+        """Sorted names of patients in the pack."""
+        return sorted(self.members['text'])
+
+    def __contains__(self, name):
+        return name in self.members['text']
+
+    def get(self, name, member = 'text'):
+        """
+        Returns *member* of patient *name* as str, None if the pack does not have it.
+        """
+        offsets = self.members.get(member, {})
+        if name not in offsets:
+            return None
+        start, length = offsets[name]
+        data = self.data[start:start+length]
+        if self.compressed:
+            data = zlib.decompress(data)
+        if not isinstance(data, str):
+            data = data.decode('utf-8')
+        return data
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Packs preprocessed texts of a corpus into one file.")
+    parser.add_argument('preproc_dir', help="folder with preprocessing output, e.g. preproc or preproctst")
+    parser.add_argument('path', help="pack file to write, e.g. preproc/corpus.pack")
+    parser.add_argument('-z', '--compress', action='store_true', help="compress every member with zlib")
+    args = parser.parse_args()
+    print('{} patients packed to {}'.format(pack_corpus(args.preproc_dir, args.path, args.compress), args.path))
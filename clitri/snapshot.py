@@ -0,0 +1,97 @@
+import os
+import hashlib
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from utils import CONFIG_PATH
+
+'''
+Snapshot of a loaded corpus: the MedicalCase objects of the patients (cleaned
+text, time splits, gold labels, lab table) pickled one per file into a folder,
+so entry points do not read and clean the corpus again on every start, and a
+chunk of patients is read without the others.
+
+The file of a case is named after the patient and its loading mode (train or
+test files and the loading options), so the modes of one patient do not replace
+each other. It holds the case with a key made of the sizes and modification
+times of its source files (preprocessed text, index, labs or the packed corpus,
+and annotations) and the code which derives the texts (utils.py,
+medicalcase.py). Cases whose key changed are loaded again and replace the file.
+'''
+
+VERSION = 2
+
+# --- code the stored cases depend on
+CODE_FILES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), name) for name in ['utils.py', 'medicalcase.py']]
+
+def file_signature(path):
+    """Size and modification time of *path*, 'missing' if it does not exist."""
+    if not path or not os.path.exists(path):
+        return '{}:missing'.format(path)
+    st = os.stat(path)
+    return '{}:{}:{!r}'.format(path, st.st_size, st.st_mtime)
+
+def code_signature():
+    """sha1 of the code files."""
+    h = hashlib.sha1()
+    for path in CODE_FILES:
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+def _digest(parts):
+    """sha1 of strings *parts*."""
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+class CorpusSnapshot(object):
+    """
+    Pickled cases of a corpus, one file per patient and loading mode.
+
+    Args:
+      path (str) - snapshot folder, created on first put
+    """
+    def __init__(self, path):
+        self.path = path
+        self.code = code_signature()
+
+    def key(self, task, packed = None):
+        """
+        Key of *task* (subj, annotation_path, test, options), see medicalcase.load_case,
+        for cases read from packed corpus file *packed* or from CONFIG_PATH files.
+        Returns (entry, key): the name of the file of the patient and mode, and the
+        key of its sources and code.
+        """
+        subj, annotation_path, test, options = task
+        if packed:
+            sources = [packed]
+        else:
+            prefix = 'test_' if test else ''
+            sources = [CONFIG_PATH[prefix + name].format(subj) for name in ['preprocessed', 'index', 'labs']]
+        mode = _digest([str(test), repr(sorted((k, v) for k, v in options.items() if k != 'lazy'))])
+        parts = [str(VERSION), self.code, subj] + [file_signature(path) for path in sources + [annotation_path]]
+        return '{}.{}'.format(subj, mode[:12]), _digest(parts)
+
+    def get(self, entry, key):
+        """Stored case of *entry*, None if there is none or it has another *key*."""
+        path = os.path.join(self.path, entry + '.pkl')
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            stored_key, case = pickle.load(f)
+        return case if stored_key == key else None
+
+    def put(self, entry, key, case):
+        """Stores *case* of *entry* under *key*; the old file is replaced only after a complete write."""
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        path = os.path.join(self.path, entry + '.pkl')
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump((key, case), f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, path)
@@ -1,4 +1,6 @@
+import os
 import re
+import json
 import string
 import cPickle
 import numpy as np 
@@ -28,11 +30,26 @@ DEFAULT_MODELS = {
 
 DEFAULT_VECTORIZER = 'models/count12_2019_01_23_14_28_32.pkl'
 
+LOAD_JOBS = 1 # processes loading the corpus in load_whole_dataset/load_test_dataset, 0: one per CPU core
+
+WINDOW_MEMO = 4 # texts of get_timed_text kept per case, the memo is cleared when full
+
 CONFIG_PATH = {
     'preprocessed': 'preproc/02_main/{}.xml.txt',
     'annotations': 'train/{}.xml',
     'conner': 'condtaggeddata/{}.xml.con', # not used (for automatic named entity recognition of clinical terms)
     'test_preprocessed': 'preproctst/02_main/{}.xml.txt',
+    'index': 'preproc/02_index/{}.xml.txt',
+    'test_index': 'preproctst/02_index/{}.xml.txt',
+    'labs': 'preproc/02_labs/{}.xml.txt',
+    'test_labs': 'preproctst/02_labs/{}.xml.txt',
+    'packed': 'preproc/corpus.pack', # optional, made by clitri/packed.py
+    'test_packed': 'preproctst/corpus.pack',
+    'snapshot': 'preproc/snapshot/', # loaded cases, made by load_* with snapshot
+    'test_snapshot': 'preproctst/snapshot/',
+    'label_matrix': 'preproc/labels.npz', # gold labels of 'annotations' as a matrix, see labels.py
+    'test_label_matrix': 'preproctst/labels.npz',
+    'features': 'models/features/', # vectorized training texts, see features.py
 }
 ######################################
 
@@ -61,6 +78,47 @@ def get_description(path):
     texttag = file_struct.find('TEXT')
     return texttag.text
 
+def get_index(path):
+    '''
+    Returns index of records of a patient written by preprocessing (02_index):
+    dict with 'records' - list of [start, end, date] and 'windows'.
+    '''
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def get_labs(path):
+    '''
+    Returns lab table of a patient written by preprocessing (02_labs),
+    list of (record date, analyte, value, offset); offset is the position of
+    the mention in the 02_main text, -1 if unknown.
+    '''
+    with open(path, 'r') as f:
+        return parse_labs(f.read())
+
+def parse_labs(text):
+    '''
+    Returns lab table from its tab separated *text*, see get_labs.
+    Tables of runs without the offset column get offset -1.
+    '''
+    labs = []
+    for line in text.splitlines():
+        row = line.split('\t')
+        date, analyte, value = row[:3]
+        labs.append((date, analyte, float(value), int(row[3]) if len(row) > 3 else -1))
+    return labs
+
+def select_lab_values(labs, analyte, time_splits = None, time_limit = None):
+    '''
+    Values of *analyte* in lab table *labs*. With *time_limit* (days) only values
+    of the records which MedicalCase.get_timed_text keeps from *time_splits*.
+    '''
+    values = [(date, value) for date, name, value, offset in labs if name == analyte]
+    if time_limit is None or time_splits is None or len(time_splits) == 1:
+        return [value for date, value in values]
+    last = time_splits[-1][0]
+    dates = set(ts.strftime('%Y%m%d') for ts, ttext in time_splits if not (last - ts).days > time_limit)
+    return [value for date, value in values if date in dates]
+
 def get_annotations(path):
     """Return a dictionary with all the annotations in the .ann file."""
     annotations = defaultdict(dict)
@@ -83,6 +141,23 @@ def encode_annotations(annotation):
     '''
     return np.array([1 if annotation[x] == 'met' else 0 for x in TAGS_LABELS])
 
+def encode_annotations_matrix(annotations):
+    '''
+    Binarized *annotations*: list of gold dicts or an already encoded matrix.
+    '''
+    if isinstance(annotations, np.ndarray):
+        return annotations
+    return np.array([encode_annotations(ant) for ant in annotations])
+
+def decode_annotations_matrix(annotations):
+    '''
+    Gold dicts of *annotations* (see encode_annotations_matrix).
+    '''
+    if not isinstance(annotations, np.ndarray):
+        return annotations
+    return [dict((tag, MET_LABEL if row[i] else NOTMET_LABEL) for i, tag in enumerate(TAGS_LABELS))
+            for row in annotations]
+
 def __simple_text_cleaning(text):
     '''
     Dummy text cleaning.
@@ -96,11 +171,40 @@ def __simple_text_cleaning(text):
     a = ' '.join([x.strip() for x in a.split(' ') if len(x) > 1 ])
     return a
 
+# --- characters removed by text_cleaning
+_REMOVED = string.punctuation + string.digits
+_REMOVED_TABLE = dict((ord(c), None) for c in _REMOVED)
+
+def text_cleaning(text):
+    """
+    Same output as *__simple_text_cleaning* in one translate and one split:
+    punctuation and digits are removed, words shorter than 2 characters dropped
+    and the words joined by single spaces. Unicode *text* is accepted too.
+    """
+    if isinstance(text, str) and str is bytes:
+        text = text.translate(None, _REMOVED)
+    else:
+        text = text.translate(_REMOVED_TABLE)
+    return ' '.join([x for x in text.split() if len(x) > 1])
+
+def text_cleaning_batch(texts):
+    """
+    Returns list of *texts* cleaned with text_cleaning.
+    """
+    cleaning = text_cleaning
+    return [cleaning(text) for text in texts]
+
 def default_text_preprocessing(text):
     """
     Default preprocessing used in all model and for predictions.
     """
-    return __simple_text_cleaning(text)
+    return text_cleaning(text)
+
+def default_text_preprocessing_batch(texts):
+    """
+    Default preprocessing of a list of texts.
+    """
+    return text_cleaning_batch(texts)
 
 def get_tag_encoding(array, tag):
     """
@@ -147,12 +251,14 @@ def balancing(labels, method = 'under'):
 
 def save_pickle(obj, name):
     """
-    Store to pickle
+    Store to pickle; an existing file is replaced only after a complete write.
     """
     if not name.endswith('pkl'):
         name += '.pkl'
-    with open(name, 'wb') as fid:
+    tmp = name + '.tmp'
+    with open(tmp, 'wb') as fid:
         cPickle.dump(obj, fid)
+    os.rename(tmp, name)
 
 def load_pickle(name):
     """
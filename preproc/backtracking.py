@@ -0,0 +1,256 @@
+import re
+import sys
+import math
+import json
+import argparse
+import multiprocessing
+try:
+    import sre_parse
+    import sre_constants
+except ImportError:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+
+import preprocessing
+from labs import RECORD_DATE
+from records import RECORD, RECORD_START
+from profiling import timer
+
+'''
+Backtracking risk of the preprocessing rules.
+
+Every regular expression of preprocessing.py (rule tables, lexicon rules, the
+re.sub calls of PART 2, negation, lab and record patterns) is run on synthetic
+inputs of growing length: long runs of characters the pattern accepts, with
+or without its literal parts repeated in them. The growth of the runtime is
+fitted as time ~ length^exponent, and rules with an exponent above the limit
+are reported with the input and length where they were the slowest. Every
+rule is timed in a child process: a rule which takes more than the budget on
+some input, or is still running after the timeout, is flagged as well.
+
+    python backtracking.py                      # report
+    python backtracking.py --gate --allow FILE  # exit code 1 for flagged rules not in FILE
+'''
+
+# --- characters repeated in inputs without any literal of the pattern
+BASE_PUMPS = ['a', 'a ', 'a1 ', ' ', '1 . ', 'a\n', 'a :']
+
+class RecordingRe(object):
+    """Stands in for re in markup_text() and records (pattern, flags) of every call."""
+    def __init__(self):
+        self.calls = []
+
+    def sub(self, pattern, repl, string, count = 0, flags = 0):
+        self.calls.append((pattern, flags))
+        return re.sub(pattern, repl, string, count = count, flags = flags)
+
+    def findall(self, pattern, string, flags = 0):
+        self.calls.append((pattern, flags))
+        return re.findall(pattern, string, flags = flags)
+
+    def __getattr__(self, name):
+        return getattr(re, name)
+
+def collect_rules():
+    """Returns list of (source, pattern, flags) of all regular expressions of preprocessing."""
+    rules = []
+    for engine in preprocessing.ENGINES:
+        rules += [(engine.name, rule.pattern, rule.flags) for rule in engine.rules if not rule.literal]
+    rules += [('negation.txt', rule.regex.pattern, rule.regex.flags) for rule in preprocessing.NEGATION.rules]
+    for marker in [preprocessing.CREATININE, preprocessing.HBA1C, preprocessing.HBA1C_WHOLE]:
+        rules.append(('labs', marker.regex.pattern, 0))
+    rules += [('labs', RECORD_DATE.pattern, 0), ('records', RECORD.pattern, 0), ('records', RECORD_START.pattern, 0)]
+    recorder = RecordingRe()
+    saved = preprocessing.markup_re
+    preprocessing.markup_re = recorder
+    try:
+        preprocessing.markup_text(' this is record date 20120304 . \n', None)
+    finally:
+        preprocessing.markup_re = saved
+    rules += [('markup', pattern, flags) for pattern, flags in recorder.calls]
+    unique = []
+    seen = set()
+    for source, pattern, flags in rules:
+        if (pattern, flags) not in seen:
+            seen.add((pattern, flags))
+            unique.append((source, pattern, flags))
+    return unique
+
+def literal_runs(pattern, flags = 0):
+    """Runs of literal characters anywhere in *pattern* (in groups, branches, repeats)."""
+    runs = []
+    def walk(parsed):
+        run = ''
+        for op, av in list(parsed) + [(None, None)]:
+            if op == sre_constants.LITERAL and av < 128:
+                run += chr(av)
+                continue
+            if run.strip():
+                runs.append(run)
+            run = ''
+            if op == sre_constants.SUBPATTERN:
+                walk(av[-1])
+            elif op == sre_constants.BRANCH:
+                for branch in av[1]:
+                    walk(branch)
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+                walk(av[2])
+    walk(sre_parse.parse(pattern, flags))
+    return runs
+
+def pumps(pattern, flags = 0, limit = 6):
+    """Strings repeated to make adversarial inputs for *pattern*."""
+    result = list(BASE_PUMPS)
+    for run in literal_runs(pattern, flags)[:limit]:
+        result += [run + ' ', run + ' a ', run + '1 ']
+    return result
+
+def measure(regex, text, repeats = 2):
+    """Best time of scanning *text* with compiled *regex*."""
+    best = None
+    for i in range(repeats):
+        start = timer()
+        for m in regex.finditer(text):
+            pass
+        seconds = timer() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+def _measure_series(conn, regex, texts, budget):
+    """Sends the time of every text of *texts* to *conn*, stops after a time over *budget*."""
+    for text in texts:
+        seconds = measure(regex, text)
+        conn.send(seconds)
+        if seconds > budget:
+            break
+    conn.close()
+
+def measure_series(regex, texts, budget = 1.0, timeout = 10.0):
+    """
+    Times of compiled *regex* on *texts* measured in a child process, which stops
+    after the first time over *budget*. A measurement still running after
+    *timeout* seconds is killed and ends the series.
+    Returns (times, timed_out), the time of a killed measurement is *timeout*.
+    """
+    receiver, sender = multiprocessing.Pipe(False)
+    process = multiprocessing.Process(target = _measure_series, args = (sender, regex, texts, budget))
+    process.start()
+    sender.close()
+    times = []
+    timed_out = False
+    try:
+        for text in texts:
+            if not receiver.poll(timeout):
+                times.append(timeout)
+                timed_out = True
+                break
+            try:
+                times.append(receiver.recv())
+            except EOFError:
+                raise RuntimeError('measurement of {!r} failed (exit code {})'.format(regex.pattern, process.exitcode))
+            if times[-1] > budget:
+                break
+    finally:
+        if process.is_alive():
+            process.terminate()
+        process.join()
+        receiver.close()
+    return times, timed_out
+
+def exponent(sizes, times, min_time = 1e-4):
+    """Least squares slope of log(time) over log(size), None if there are not enough measurable times."""
+    points = [(math.log(n), math.log(t)) for n, t in zip(sizes, times) if t >= min_time]
+    if len(points) < 2:
+        return None
+    mx = sum(x for x, y in points) / len(points)
+    my = sum(y for x, y in points) / len(points)
+    sxx = sum((x - mx) ** 2 for x, y in points)
+    return sum((x - mx) * (y - my) for x, y in points) / sxx
+
+def analyze(source, pattern, flags, sizes, budget = 1.0, min_time = 1e-4, timeout = 10.0):
+    """
+    Runs rule *pattern* on inputs of *sizes*; returns dict with its worst input.
+    Once an input takes more than *budget* seconds (or *timeout*, see
+    measure_series) the rule is over budget and no further inputs are tried.
+    """
+    regex = re.compile(pattern, flags)
+    worst = None
+    for pump in pumps(pattern, flags):
+        texts = [(pump * (size // len(pump) + 1))[:size] for size in sizes]
+        times, timed_out = measure_series(regex, texts, budget, timeout)
+        result = {'source': source, 'pattern': pattern, 'flags': flags, 'pump': pump,
+                  'sizes': sizes[:len(times)], 'times': times, 'exponent': exponent(sizes, times, min_time),
+                  'timed_out': timed_out, 'over_budget': timed_out or times[-1] > budget}
+        if worst is None or _risk(result) > _risk(worst):
+            worst = result
+        if result['over_budget']:
+            break
+    return worst
+
+def _risk(result):
+    if result['over_budget']:
+        return (float('inf'), result['times'][-1])
+    return (result['exponent'] or 0.0, result['times'][-1])
+
+def is_flagged(result, max_exponent):
+    """Rule of *result* is over budget or its exponent is above *max_exponent*."""
+    return result['over_budget'] or result['exponent'] is not None and result['exponent'] > max_exponent
+
+def run(sizes, max_exponent = 1.5, budget = 1.0, min_time = 1e-4, allowed = (), timeout = 10.0):
+    """
+    Analyses all rules; returns (results, flagged) where flagged are rules
+    over budget or with exponent above *max_exponent* which are not in *allowed* patterns.
+    """
+    results = [analyze(source, pattern, flags, sizes, budget, min_time, timeout)
+               for source, pattern, flags in collect_rules()]
+    results.sort(key = _risk, reverse = True)
+    flagged = [r for r in results if is_flagged(r, max_exponent) and r['pattern'] not in allowed]
+    return results, flagged
+
+def report(results, max_exponent, top = 30):
+    """Text table of the *top* riskiest rules."""
+    lines = ['{:>8} {:>9} {:>8}  {:<16} {:<12} {}'.format('exponent', 'seconds', 'length', 'source', 'input', 'pattern')]
+    for r in results[:top]:
+        mark = '!' if is_flagged(r, max_exponent) else ' '
+        if r['timed_out']:
+            value = 'timeout'
+        elif r['over_budget']:
+            value = 'budget'
+        else:
+            value = '-' if r['exponent'] is None else '{:.2f}'.format(r['exponent'])
+        lines.append('{}{:>7} {:9.4f} {:8d}  {:<16} {:<12} {}'.format(
+            mark, value, r['times'][-1], r['sizes'][-1],
+            r['source'], repr(r['pump'])[:12], r['pattern'].replace('\n', '\\n')))
+    return '\n'.join(lines) + '\n'
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description="Runtime growth of preprocessing rules on adversarial inputs")
+    argparser.add_argument("--sizes", dest="sizes", type = int, nargs = '+', default = [1000, 2000, 4000, 8000],
+                           help="input lengths in characters")
+    argparser.add_argument("--max-exponent", dest="max_exponent", type = float, default = 1.5,
+                           help="rules with time ~ length^exponent above this are flagged")
+    argparser.add_argument("--budget", dest="budget", type = float, default = 1.0,
+                           help="seconds of one input after which a rule is flagged and longer inputs are skipped")
+    argparser.add_argument("--timeout", dest="timeout", type = float, default = 10.0,
+                           help="seconds after which a measurement is killed and its rule flagged")
+    argparser.add_argument("--min-time", dest="min_time", type = float, default = 1e-4,
+                           help="shorter times are too noisy to be fitted")
+    argparser.add_argument("--top", dest="top", type = int, default = 30, help="number of rules in the report")
+    argparser.add_argument("--json", dest="json", default = None, help="write all results to this file")
+    argparser.add_argument("--allow", dest="allow", default = None,
+                           help="file with accepted patterns, one per line ('\\n' for line breaks)")
+    argparser.add_argument("--gate", dest="gate", action="store_true",
+                           help="exit code 1 if a rule not in --allow is flagged")
+    args = argparser.parse_args()
+    allowed = set()
+    if args.allow:
+        with open(args.allow) as f:
+            allowed = set(line.rstrip('\n').replace('\\n', '\n') for line in f if line.strip())
+    results, flagged = run(args.sizes, args.max_exponent, args.budget, args.min_time, allowed, args.timeout)
+    sys.stdout.write(report(results, args.max_exponent, args.top))
+    print('{} rules, {} flagged'.format(len(results), len(flagged)))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent = 1)
+    if args.gate and flagged:
+        sys.exit(1)
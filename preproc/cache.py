@@ -0,0 +1,76 @@
+import os
+import json
+import hashlib
+
+'''
+Keys of already preprocessed documents, used by the incremental mode of
+preprocessing.py. Every stage stores for each output file the key it was made
+with; a key is a hash of everything the output depends on (input document,
+lexicons, code), so an output is rebuilt only when the key changes.
+'''
+
+def hash_key(*parts):
+    """sha1 of string *parts*."""
+    h = hashlib.sha1()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = part.encode('utf-8')
+        h.update(part)
+        h.update(b'\0')
+    return h.hexdigest()
+
+def hash_files(paths):
+    """sha1 of names and contents of files from *paths*."""
+    h = hashlib.sha1()
+    for path in paths:
+        h.update(os.path.basename(path).encode('utf-8'))
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+class StageCache(object):
+    """
+    Manifest with keys of processed documents per stage, stored as json.
+
+    Args:
+      path (str) - manifest file, created on first save
+    """
+    def __init__(self, path):
+        self.path = path
+        self.stages = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.stages = json.load(f)
+
+    def outdated(self, stage, keys, outputs = (), suffix = ''):
+        """
+        Returns names from *keys* (dict name: key) which have to be processed again
+        by *stage*: stored key differs or an output file is missing.
+
+        Args:
+          outputs (list <str>) - folders where the stage writes a file with the name
+          suffix (str) - added to the name by the stage, e.g. '.txt'
+        """
+        stored = self.stages.get(stage, {})
+        return [name for name in sorted(keys)
+                if stored.get(name) != keys[name]
+                or not all(os.path.exists(os.path.join(folder, name + suffix)) for folder in outputs)]
+
+    def update(self, stage, keys):
+        """Records *keys* (dict name: key) as done by *stage*."""
+        self.stages.setdefault(stage, {}).update(keys)
+
+    def retain(self, stage, names):
+        """Forgets keys of *stage* for documents not in *names*."""
+        names = set(names)
+        stored = self.stages.get(stage, {})
+        for name in list(stored):
+            if name not in names:
+                del stored[name]
+
+    def save(self):
+        """Writes the manifest; the old one is replaced only after a complete write."""
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.stages, f, indent = 1, sort_keys = True)
+        os.rename(tmp, self.path)
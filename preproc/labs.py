@@ -0,0 +1,133 @@
+import re
+import bisect
+
+'''
+Lab values of PART 2: creatinine and HbA1c.
+
+Every mention of a lab value is found with one scan of the document. Mentions
+with a value in the marker's range get the marker (HIGHCRT, GLYHMG) in the
+same pass, and all mentions are collected into the lab table of the document,
+rows (record date, analyte, value, offset). The record date is the date of the
+last 'this is record date' before the mention ('' for none), which places the
+value in the records of MedicalCase.time_splits. The markers run in the middle
+of PART 2 and the text still changes after them, so the offset of a mention in
+the final 02_main text is found at the end of PART 2 (locate_mentions).
+
+The markers used to be inserted with doc.replace(item, marked item) for every
+distinct mention with a value in range, which also marks copies of the mention
+that are not matches of their own (inside a longer mention). Such documents are
+marked the old way, so the text stays the same.
+'''
+
+RECORD_DATE = re.compile('this is record date ([0-9]{8})')
+# words of a mention in the final text, with spaces collapsed and markers inserted between them
+MARKERS = '(?: +[A-Z]+)* +'
+
+class LabMarker(object):
+    """
+    Extraction of one lab value pattern.
+
+    Args:
+      analyte (str) - name of the value in the lab table
+      pattern (str) - regular expression of a mention, ending with the value
+      width (int) - number of characters of the value at the end of a mention
+      low (float) - lowest value which is marked
+      high (float) - highest value which is marked, None for no limit
+      before (str) - marker inserted before a marked mention
+      after (str) - marker inserted after a marked mention
+    """
+    def __init__(self, analyte, pattern, width, low, high = None, before = '', after = ''):
+        self.analyte = analyte
+        self.regex = re.compile(pattern)
+        self.width = width
+        self.low = low
+        self.high = high
+        self.before = before
+        self.after = after
+
+    def value(self, match):
+        """Value of mention *match* as text."""
+        return match.group()[-self.width:].strip()
+
+    def marked(self, value):
+        """True if a mention with *value* (str) gets the marker."""
+        value = float(value)
+        if self.high is None:
+            return value > self.low
+        return self.low <= value <= self.high
+
+    def apply(self, doc, labs = None):
+        """
+        Returns *doc* with marked mentions. If *labs* (list) is given,
+        rows (record date, analyte, value, mention) of all mentions are appended
+        to it, see locate_mentions.
+        """
+        matches = list(self.regex.finditer(doc))
+        if not matches:
+            return doc
+        if labs is not None:
+            dates = [(m.start(), m.group(1)) for m in RECORD_DATE.finditer(doc)]
+            starts = [start for start, date in dates]
+            for m in matches:
+                i = bisect.bisect_right(starts, m.start()) - 1
+                labs.append((dates[i][1] if i >= 0 else '', self.analyte, self.value(m), m.group()))
+        marked = dict((m.start(), m.group()) for m in matches if self.marked(self.value(m)))
+        if not marked:
+            return doc
+        if not self._only_matches(doc, matches, marked):
+            for item in set(m.group() for m in matches):
+                if self.marked(item[-self.width:]):
+                    doc = doc.replace(item, self.before + item + self.after)
+            return doc
+        parts = []
+        last = 0
+        for start in sorted(marked):
+            parts.append(doc[last:start])
+            parts.append(self.before + marked[start] + self.after)
+            last = start + len(marked[start])
+        parts.append(doc[last:])
+        return ''.join(parts)
+
+    def _only_matches(self, doc, matches, marked):
+        """
+        True if every occurrence of a marked text in *doc* is one of the *marked*
+        matches (dict start: text). Another occurrence has to overlap a match,
+        so only the surroundings of the matches are searched.
+        """
+        texts = set(marked.values())
+        for m in matches:
+            for text in texts:
+                end = m.end() + len(text) - 1
+                i = doc.find(text, max(0, m.start() - len(text) + 1), end)
+                while i >= 0:
+                    if marked.get(i) != text:
+                        return False
+                    i = doc.find(text, i + 1, end)
+        return True
+
+def locate_mentions(doc, rows):
+    """
+    Returns *rows* (record date, analyte, value, mention) of one LabMarker as lab
+    table rows (record date, analyte, value, offset), where offset is the position
+    of the mention in *doc*, the final text of PART 2. The later steps of PART 2
+    collapse spaces and insert markers (upper case words, also inside mentions
+    marked the old way), so every mention is searched as its words with markers
+    allowed between them, after the previous mention; the offset is -1 if a step
+    changed the mention otherwise.
+    """
+    located = []
+    start = 0
+    for date, analyte, value, mention in rows:
+        words = [re.escape(word) for word in mention.split(' ') if word]
+        m = re.compile(MARKERS.join(words)).search(doc, start)
+        if m:
+            start = m.end()
+        located.append((date, analyte, value, m.start() if m else -1))
+    return located
+
+def write_labs(path, labs):
+    """Writes lab table *labs* to *path*, one tab separated row per line."""
+    f = open(path, 'w')
+    for row in labs:
+        f.write('\t'.join(str(x) for x in row) + '\n')
+    f.close()
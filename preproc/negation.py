@@ -0,0 +1,131 @@
+import re
+import csv
+import bisect
+
+from rules import Rule
+
+'''
+Removal of negated information in PART 2 (the 02_negated step).
+
+Every rule masks the scope of a negation trigger: the text before the trigger
+back to a clause boundary and the text after it up to the end of the sentence.
+Rules are read from a csv lexicon (lexicon/negation.txt) with columns
+
+  section,left,trigger,right,report,mask
+
+  section - heading of the rule's matches in the 02_negated debug output
+  left    - scope before the trigger, a key of LEFT_SCOPES
+  trigger - regular expression of the trigger
+  right   - scope after the trigger, a key of RIGHT_SCOPES
+  report  - 'match' to write matches to the debug output, 'line' to write them
+            without line breaks, empty to not write them
+  mask    - replacement of matches, empty if the rule only reports
+
+Rules are applied in order, each to the result of the previous one. Scopes
+never cross a line break, so the document is split into lines once and the
+triggers of all rules are found with one scan; rules are then applied only to
+the lines containing a trigger, all other lines stay as they are. Lines are
+kept together when a trigger can match across the line break between them
+(a colon followed by a line break and 'none'); masks must not create such
+matches, which holds for masks like 'XXX '.
+'''
+
+LEFT_SCOPES = {
+    '': '',
+    'clause': '[^\n\\.:;,]*',    # back to . , : ; or line start
+    'clause+': '[^\n\\.:;,]+',
+    'phrase': '[^\n\\.:;]*',     # back to . : ; or line start
+}
+
+RIGHT_SCOPES = {
+    '': '',
+    'clause+': '[^\n\\.,]+',     # up to . , or line end
+    'sentence': '[^\n\\.]*',     # up to . or line end
+    'sentence+': '[^\n\\.]+',
+    'sentence50': '[^\n\\.]{0,50}',
+}
+
+class NegationRule(object):
+    """
+    Single row of the negation lexicon.
+    """
+    def __init__(self, section, left, trigger, right, report, mask):
+        self.section = section
+        self.trigger = trigger
+        self.regex = re.compile(LEFT_SCOPES[left] + trigger + RIGHT_SCOPES[right])
+        self.report = report
+        self.mask = mask
+        # triggers which can match a line break join lines
+        charset = Rule(trigger, '').charset
+        self.multiline = charset is None or '\n' in charset
+
+    def matches(self, text):
+        """Matches of the rule in *text* as written to the debug output."""
+        items = [m.group() for m in self.regex.finditer(text)]
+        if self.report == 'line':
+            items = [item.replace('\n', '') for item in items]
+        return items
+
+class NegationScanner(object):
+    """
+    Masks negated information in PART 2 documents.
+
+    Args:
+      path (str) - csv lexicon with the rules, see the module description
+    """
+    def __init__(self, path):
+        self.rules = [NegationRule(*row) for row in csv.reader(open(path))]
+        self.triggers = re.compile('|'.join('(?:%s)' % rule.trigger for rule in self.rules))
+        self.multiline = [re.compile('(?=(%s))' % rule.trigger) for rule in self.rules if rule.multiline]
+
+    def blocks(self, doc):
+        """
+        Splits *doc* at line breaks into blocks which can be processed
+        separately; returns list of (block, True if it contains a trigger).
+        """
+        lines = doc.split('\n')
+        starts = [0]
+        for line in lines[:-1]:
+            starts.append(starts[-1] + len(line) + 1)
+        # lines joined with the next one, their line break is a part of a trigger
+        joined = set()
+        for regex in self.multiline:
+            for m in regex.finditer(doc):
+                i = bisect.bisect_right(starts, m.start(1)) - 1
+                while i + 1 < len(starts) and starts[i+1] <= m.end(1):
+                    joined.add(i)
+                    i += 1
+        active = set(bisect.bisect_right(starts, m.start()) - 1 for m in self.triggers.finditer(doc))
+        blocks = []
+        first = 0
+        for i in range(len(lines)):
+            if i not in joined:
+                blocks.append(('\n'.join(lines[first:i+1]), any(j in active for j in range(first, i + 1))))
+                first = i + 1
+        return blocks
+
+    def apply(self, doc, f = None):
+        """
+        Returns *doc* with negated information masked. If *f* is given,
+        matches of the rules are written to it under their sections.
+        """
+        blocks = self.blocks(doc)
+        reports = [[] for rule in self.rules]
+        result = []
+        for block, active in blocks:
+            if active:
+                for i, rule in enumerate(self.rules):
+                    if f is not None and rule.report:
+                        reports[i].extend(rule.matches(block))
+                    if rule.mask:
+                        block = rule.regex.sub(rule.mask, block)
+            result.append(block)
+        if f is not None:
+            section = None
+            for i, rule in enumerate(self.rules):
+                if rule.section != section:
+                    section = rule.section
+                    f.write('\n\n' + section + '\n\n')
+                for item in reports[i]:
+                    f.write("%s\n" % item)
+        return '\n'.join(result)
@@ -0,0 +1,128 @@
+import csv
+import heapq
+
+'''
+Token normalization of PART 1: abbreviations (lexicon/abbrev.txt) and
+multi-word expressions (lexicon/mwe.txt), and phrase replacement used by PART 2.
+
+A sentence is kept as a string ' tok1 tok2 ... tokn ' and every MWE key is
+replaced with str.replace(' ' + key + ' ', ' ' + value + ' ') in dictionary
+order. The keys present in a sentence are found with one Aho-Corasick scan over
+its words, so only those keys (and keys created by a replacement) are replayed
+in the original order, which gives exactly the same result as trying every key.
+'''
+
+class WordAutomaton(object):
+    """
+    Aho-Corasick automaton over sequences of words.
+
+    Args:
+      keys (list <str>) - space separated word sequences
+    """
+    def __init__(self, keys):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for k, key in enumerate(keys):
+            state = 0
+            for word in key.split(' '):
+                if word not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[state][word] = len(self.goto) - 1
+                state = self.goto[state][word]
+            self.out[state].append((k, len(key.split(' '))))
+        # breadth first construction of failure links, words at depth 1 fail to the root
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for word, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fstate = self.fail[state]
+                while fstate and word not in self.goto[fstate]:
+                    fstate = self.fail[fstate]
+                self.fail[nxt] = self.goto[fstate].get(word, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def search(self, words):
+        """
+        Yields (key index, end, length) for every occurrence of a key
+        in *words*, where words[end - length:end] is the occurrence.
+        """
+        state = 0
+        for i, word in enumerate(words):
+            while state and word not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(word, 0)
+            for k, length in self.out[state]:
+                yield k, i + 1, length
+
+class PhraseReplacer(object):
+    """
+    Replaces space separated phrases in a text, with the same result as
+    text.replace(' ' + key + ' ', ' ' + value + ' ') for all keys in order.
+
+    Args:
+      keys (list <str>) - phrases in the order they are replaced
+      values (list <str>) - replacements of *keys*
+    """
+    def __init__(self, keys, values):
+        self.keys = list(keys)
+        self.patterns = [' ' + key + ' ' for key in self.keys]
+        self.values = [' ' + value + ' ' for value in values]
+        self.automaton = WordAutomaton(self.keys)
+
+    def present_keys(self, text, after = -1):
+        """
+        Indices of keys bigger than *after* which occur in *text*
+        surrounded by spaces.
+        """
+        words = text.split(' ')
+        found = set()
+        for k, end, length in self.automaton.search(words):
+            # key needs a space before its first word and after its last one
+            if k > after and end - length >= 1 and end <= len(words) - 1:
+                found.add(k)
+        return found
+
+    def replace(self, text):
+        """Replaces all phrases in *text*."""
+        todo = list(self.present_keys(text))
+        heapq.heapify(todo)
+        done = set(todo)
+        while todo:
+            k = heapq.heappop(todo)
+            if self.patterns[k] not in text:
+                continue
+            text = text.replace(self.patterns[k], self.values[k])
+            # a replacement may create keys which come later in the order
+            for new in self.present_keys(text, k) - done:
+                done.add(new)
+                heapq.heappush(todo, new)
+        return text
+
+class TokenNormalizer(object):
+    """
+    Replaces abbreviations and multi-word expressions in tokenized sentences.
+
+    Args:
+      abbrev_path (str) - csv file with abbreviation,replacement
+      mwe_path (str) - csv file with expression,replacement
+    """
+    def __init__(self, abbrev_path, mwe_path):
+        self.abbrev = dict(csv.reader(open(abbrev_path)))
+        mwe = dict(csv.reader(open(mwe_path)))
+        # same order in which the dictionary was iterated so far
+        self.mwe = PhraseReplacer(mwe, [mwe[key] for key in mwe])
+
+    def expand_mwe(self, tokenized):
+        """Replaces multi-word expressions in *tokenized* sentence."""
+        return self.mwe.replace(tokenized)
+
+    def normalize(self, tokens):
+        """
+        Returns sentence string ' tok1 tok2 ... ' built from lowercased *tokens*
+        with abbreviations and multi-word expressions replaced.
+        """
+        tokenized = ' ' + ''.join(self.abbrev.get(t, t) + ' ' for t in tokens)
+        return self.expand_mwe(tokenized)
@@ -2,226 +2,433 @@
 import re
 import csv
 import os
-from datetime import datetime
-
-# --- set up spaCy
-import spacy
-parser = spacy.load('en')
-
-# ------------------------------------------------------------------ PART 1
+import sys
+import argparse
+import functools
+import multiprocessing
+
+from rules import RuleEngine, LexiconEngine, literal, regex
+from normalizer import TokenNormalizer, PhraseReplacer
+from negation import NegationScanner
+from labs import LabMarker, locate_mentions, write_labs
+from records import mark_windows, record_index, write_index
+from profiling import Profiler, TimedRe, timer
+from cache import StageCache, hash_key, hash_files
 
 # --- input files
 in_dir = './00_input/'
 
 # --- output files
 out_dir = './01_preprocessed/'
-for f in os.listdir(out_dir):
-    os.remove(os.path.abspath(os.path.join(out_dir, f)))
-
-# --- dictionaries
-dic1 = dict(csv.reader(open('./lexicon/abbrev.txt')))
-dic2 = dict(csv.reader(open('./lexicon/mwe.txt')))
+family = './02_family/'
+allergy = './02_allergy/'
+negated = './02_negated/'
+main = './02_main/'
+recindex = './02_index/'
+labvalues = './02_labs/'
+
+OUTPUT_DIRS = [out_dir, family, allergy, negated, main, recindex, labvalues]
+
+# --- lexicons
+lexicon_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lexicon', '')
+PART1_LEXICONS = ['abbrev.txt', 'mwe.txt']
+PART2_LEXICONS = ['language.txt', 'hrtmed.txt', 'supplements.txt', 'deficiency.txt', 'mental.txt',
+                  'illicit.txt', 'kidmed.txt', 'surgery.txt', 'prevent.txt', 'negation.txt']
+
+# --- keys of processed documents for incremental runs
+cache_file = './preprocessing_cache.json'
+# modules whose code changes the output (not the tools: synthetic, backtracking, profiling)
+STAGE_MODULES = ['preprocessing', 'rules', 'normalizer', 'negation', 'labs', 'records', 'cache']
+
+# --- spaCy pipeline profiles: components disabled when the model is loaded
+# only sentence boundaries and token texts are used, see check_profile()
+spacy_model = 'en'
+SPACY_PROFILES = {
+    'full': [],                                  # all components of the model
+    'parser': ['tagger', 'ner'],                 # sentences from the dependency parser
+    'sentencizer': ['tagger', 'parser', 'ner'],  # rule based sentences, no statistical models
+}
+
+# --- Preprocessor of the current process, set by init_worker()
+worker = None
+
+# --- profiling mode (--timing): Profiler of the current process and re used by markup_text()
+profiler = None
+markup_re = re
+
+def init_worker(profile = 'full', timing = False):
+    """
+    Creates the Preprocessor of the current process with spaCy *profile*.
+    Used as the pool initializer so every worker pays the load cost only once.
+    If *timing*, the process runs in profiling mode (see enable_timing).
+    """
+    global worker
+    worker = Preprocessor(profile)
+    if timing:
+        enable_timing()
+    else:
+        disable_timing()
+
+def enable_timing():
+    """
+    Profiling mode of the current process: rule tables, re.sub calls of PART 2,
+    lexicon components and spaCy are timed by *profiler*.
+    """
+    global profiler, markup_re
+    profiler = Profiler()
+    markup_re = TimedRe(profiler)
+    for engine in ENGINES:
+        engine.profiler = profiler
+
+def disable_timing():
+    """Ends profiling mode of the current process, nothing is timed any more."""
+    global profiler, markup_re
+    profiler = None
+    markup_re = re
+    for engine in ENGINES:
+        engine.profiler = None
+
+def timed(group, name, func, *args):
+    """
+    Returns func(*args); in profiling mode it is timed as rule *name* of *group*
+    on the characters of args[0], a text or a list of tokens (counted joined by spaces).
+    """
+    if profiler is None:
+        return func(*args)
+    text = args[0]
+    chars = len(' '.join(text)) if isinstance(text, list) else len(text)
+    return profiler.timed(group, name, chars, func, *args)
+
+class Timed(object):
+    """
+    Task of a run in profiling mode: calls *func* for a file (or a batch of files)
+    as *stage*, and returns the timings the worker collected for it.
+    """
+    def __init__(self, func, stage):
+        self.func = func
+        self.stage = stage
+
+    def __call__(self, item, **kwargs):
+        start = timer()
+        self.func(item, **kwargs)
+        names = [item] if isinstance(item, str) else item
+        name = names[0] if len(names) == 1 else '{}..{}'.format(names[0], names[-1])
+        if name.endswith('.txt'):
+            name = name[:-len('.txt')]
+        profiler.add_document(name, self.stage, timer() - start)
+        return profiler.pop()
+
+def load_parser(profile = 'full'):
+    """
+    Loads spaCy model *spacy_model* with pipeline *profile* from SPACY_PROFILES.
+    """
+    import spacy
+    nlp = spacy.load(spacy_model, disable = SPACY_PROFILES[profile])
+    if profile == 'sentencizer':
+        nlp.add_pipe(nlp.create_pipe('sentencizer'))
+    return nlp
+
+def clean_output_dirs(keep = ()):
+    """Removes results of the previous run from all output folders (created if missing), except files named in *keep*."""
+    keep = set(keep)
+    for folder in OUTPUT_DIRS:
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        for f in os.listdir(folder):
+            if f not in keep:
+                os.remove(os.path.abspath(os.path.join(folder, f)))
+
+def stage_signature(lexicons):
+    """
+    Hash of preprocessing code (STAGE_MODULES) and *lexicons* a stage depends on;
+    part of the keys of incremental runs.
+    """
+    code_dir = os.path.dirname(os.path.abspath(__file__))
+    sources = [os.path.join(code_dir, name + '.py') for name in STAGE_MODULES]
+    return hash_files(sources + [lexicon_dir + x for x in lexicons])
 
-for file in os.listdir(in_dir):
-    # --- read document
-    f = open(in_dir + file, 'r')
-    doc = f.read()
-    f.close()
+# ------------------------------------------------------------------ PART 1
 
+# --- cleanup rules applied to raw documents, in order
+CLEANUP_RULES = [
     # --- remove XML elements and special characters
-    doc = re.sub('.*CDATA\[', '', doc, flags=re.S)
-    doc = re.sub('\]\]></TEXT>.*', '', doc, flags=re.S)
-    doc = re.sub('<[a-zA-Z]+>', ' ', doc)
-    doc = doc.replace('HEEN&T', 'HEENT')
-    doc = doc.replace('(Stat Lab)', ' ')
-    doc = doc.replace('&nbsp', ' ')
-    doc = doc.replace('&#183;', ' . ')
-    doc = doc.replace('&#224;', ' . ')
-    doc = doc.replace('&#8211;', ' . ')
-    doc = doc.replace('&#8217;', '\'')
-    doc = doc.replace('&#8220;;', '')
-    doc = doc.replace('&#8221;', '')
-    doc = doc.replace('&gt;', ' greater than ')
-    doc = doc.replace('&lt;', ' less than ')
-    doc = doc.replace('>', ' greater than ')
-    doc = doc.replace('<', ' less than ')
-        
+    regex('.*CDATA\[', '', re.S),
+    regex('\]\]></TEXT>.*', '', re.S),
+    regex('<[a-zA-Z]+>', ' '),
+    literal('HEEN&T', 'HEENT'),
+    literal('(Stat Lab)', ' '),
+    literal('&nbsp', ' '),
+    literal('&#183;', ' . '),
+    literal('&#224;', ' . '),
+    literal('&#8211;', ' . '),
+    literal('&#8217;', '\''),
+    literal('&#8220;;', ''),
+    literal('&#8221;', ''),
+    literal('&gt;', ' greater than '),
+    literal('&lt;', ' less than '),
+    literal('>', ' greater than '),
+    literal('<', ' less than '),
+
     # --- gender
-    doc = doc.replace('gentleman', 'male')
-    doc = doc.replace('lady', 'female')
-    
+    literal('gentleman', 'male'),
+    literal('lady', 'female'),
+
     # --- titles so that they don't get confused with other acronyms
-    doc = doc.replace('M.Sc.', '')
-    doc = doc.replace('Ph.D.', '')
-    doc = doc.replace('PhD', '')
-    doc = doc.replace('Jr.', '')
-    doc = doc.replace('JR.', '')
-    
+    literal('M.Sc.', ''),
+    literal('Ph.D.', ''),
+    literal('PhD', ''),
+    literal('Jr.', ''),
+    literal('JR.', ''),
+
     # --- enclytics
-    doc = doc.replace('aren\'t', 'are not')
-    doc = doc.replace('can\'t', 'cannot')
-    doc = doc.replace('couldn\'t', 'could not')
-    doc = doc.replace('didn\'t', 'did not')
-    doc = doc.replace('doesn\'t', 'does not')
-    doc = doc.replace('don\'t', 'do not')
-    doc = doc.replace('hadn\'t', 'had not')
-    doc = doc.replace('hasn\'t', 'has not')
-    doc = doc.replace('haven\'t', 'have not')
-    doc = doc.replace('isn\'t', 'is not')
-    doc = doc.replace('wasn\'t', 'was not')
-    doc = doc.replace('wouldn\'t', 'would not')
-    doc = doc.replace('won\'t', 'will not')
-    doc = doc.replace('con\'t', 'continue')
-    doc = doc.replace('cont\'d', 'continue')
-    doc = doc.replace('\'m', ' am')
-    doc = doc.replace('\'ll', ' will')
-    doc = doc.replace('\'s', '')
-    doc = doc.replace('\'ve', '')
-    doc = doc.replace('\'d', '')
-    doc = doc.replace('\'ed', '')
+    literal('aren\'t', 'are not'),
+    literal('can\'t', 'cannot'),
+    literal('couldn\'t', 'could not'),
+    literal('didn\'t', 'did not'),
+    literal('doesn\'t', 'does not'),
+    literal('don\'t', 'do not'),
+    literal('hadn\'t', 'had not'),
+    literal('hasn\'t', 'has not'),
+    literal('haven\'t', 'have not'),
+    literal('isn\'t', 'is not'),
+    literal('wasn\'t', 'was not'),
+    literal('wouldn\'t', 'would not'),
+    literal('won\'t', 'will not'),
+    literal('con\'t', 'continue'),
+    literal('cont\'d', 'continue'),
+    literal('\'m', ' am'),
+    literal('\'ll', ' will'),
+    literal('\'s', ''),
+    literal('\'ve', ''),
+    literal('\'d', ''),
+    literal('\'ed', ''),
 
     # --- special punctuation
-    doc = re.sub('\sC\\.', ' C ', doc, flags=re.IGNORECASE) # C. diff --> C diff
-    doc = re.sub('\sE\\.', ' E ', doc, flags=re.IGNORECASE) # E. coli --> E coli
-    doc = re.sub('[^\w]vit\\.', ' vit ', doc, flags=re.IGNORECASE) # vit. D --> vit D
-    doc = doc.replace('x. ', 'x ') # fx. of --> fx of
-    doc = re.sub('\sq\\.\s', ' q.', doc, flags=re.IGNORECASE) # q. a.m. --> q.a.m.
-    doc = re.sub('([a-z])\\.([a-z])\\.([a-z])\\.', '\\1\\2\\3', doc, flags=re.IGNORECASE) # q.a.m. --> qam
-    doc = re.sub('([a-z])\\.([a-z])\\.', '\\1\\2', doc, flags=re.IGNORECASE) # q.d. --> qd
-    #doc = re.sub('q\\.(\d)', 'q\\1', doc, flags=re.IGNORECASE) # q.4 --> q4
-    doc = re.sub('\sq\\.\s', ' q ', doc, flags=re.IGNORECASE|re.S) # q.\n --> q
-    doc = re.sub('\sq\\.', ' q ', doc, flags=re.IGNORECASE) # q. --> q
-    doc = re.sub('\sq\s+', ' q ', doc, flags=re.IGNORECASE|re.S) # q\n --> q
-    doc = re.sub('\sh\\.\s', ' h ', doc, flags=re.IGNORECASE) # h. --> h
-    doc = re.sub('(\\.)([a-z])', '. \\2', doc, flags=re.IGNORECASE) # .blah --> . blah
-    doc = doc.replace('.)', '. ') # overzealous numbering
-    doc = doc.replace('ELEM.', 'ELEM ') # elemental
-    doc = doc.replace('TAB.SR', 'TABLET')
-    doc = re.sub('\(\s*S\s*\)', ' ', doc, flags=re.IGNORECASE)
+    regex('\sC\\.', ' C ', re.IGNORECASE), # C. diff --> C diff
+    regex('\sE\\.', ' E ', re.IGNORECASE), # E. coli --> E coli
+    regex('[^\w]vit\\.', ' vit ', re.IGNORECASE), # vit. D --> vit D
+    literal('x. ', 'x '), # fx. of --> fx of
+    regex('\sq\\.\s', ' q.', re.IGNORECASE), # q. a.m. --> q.a.m.
+    regex('([a-z])\\.([a-z])\\.([a-z])\\.', '\\1\\2\\3', re.IGNORECASE), # q.a.m. --> qam
+    regex('([a-z])\\.([a-z])\\.', '\\1\\2', re.IGNORECASE), # q.d. --> qd
+    #regex('q\\.(\d)', 'q\\1', re.IGNORECASE), # q.4 --> q4
+    regex('\sq\\.\s', ' q ', re.IGNORECASE|re.S), # q.\n --> q
+    regex('\sq\\.', ' q ', re.IGNORECASE), # q. --> q
+    regex('\sq\s+', ' q ', re.IGNORECASE|re.S), # q\n --> q
+    regex('\sh\\.\s', ' h ', re.IGNORECASE), # h. --> h
+    regex('(\\.)([a-z])', '. \\2', re.IGNORECASE), # .blah --> . blah
+    literal('.)', '. '), # overzealous numbering
+    literal('ELEM.', 'ELEM '), # elemental
+    literal('TAB.SR', 'TABLET'),
+    regex('\(\s*S\s*\)', ' ', re.IGNORECASE),
 
     # --- record date
-    doc = re.sub('Record date: (\d\d\d\d)-(\d\d)-(\d\d)', '. This is record date \\1\\2\\3 .', doc)
-   
+    regex('Record date: (\d\d\d\d)-(\d\d)-(\d\d)', '. This is record date \\1\\2\\3 .'),
+
     # --- dates
-    doc = re.sub('\s\d\d/\d\d/\d\d\d\d\s', ' ', doc)
-    
-    # --- force sentence spliting where punctuation is not used properly
-    doc = re.sub('\n[0-9]+\\.\s', ' . This is a list item. ', doc) # 1. blah blah
-    doc = re.sub('\n[0-9]+\)\s', ' . This is a list item. ', doc)  # 1) blah blah
-    doc = re.sub('\n-+', ' . This is a list item. ', doc)          # -- blah blah
-
-    doc = doc.replace('(H)', ' ') # lab: high
-    doc = doc.replace('(L)', ' ') # lab: low
-    doc = doc.replace('(T)', ' ') # lab: trace
-    doc = re.sub('QTY:.{0,30} End:', ' . ', doc)
-    doc = re.sub('QTY:.{0,20} Start:', ' . ', doc)
-    doc = re.sub('QTY:.{0,10} Refills:\d*', ' . ', doc)
-    doc = re.sub('take:', 'take ', doc)
-    doc = re.sub('TABLET\s+CR\s+', 'TABLET ', doc)   # controlled release, not creatinine
-    doc = re.sub('CAPSULE\s+CR\s+', 'CAPSULE ', doc) # controlled release, not creatinine
-    doc = re.sub('creatinine\s*:\s*', 'creatinine ', doc, flags=re.IGNORECASE)
-    doc = re.sub('[\s/]PE:', '\nPHYSICAL EXAMINATION:', doc)
-    doc = re.sub('\n([^\n]+): ', '\n . \\1: ', doc)
-    doc = re.sub('\n+', ' ', doc)
-    doc = re.sub('_+', 'NEW RECORD: ', doc)
-    doc = re.sub('--+', ' . ', doc)
-    doc = re.sub('==+', ' . ', doc)
-    doc = re.sub('##+', ' ', doc)
-    doc = re.sub('-', ' ', doc)
-    doc = re.sub('\\*+', '.', doc)
-    doc = re.sub('\\"', '', doc)
-    doc = re.sub('\s+', ' ', doc)
-    doc = re.sub(': ', ': . ', doc)
-    doc = re.sub('~', ' ', doc)
-    doc = re.sub('(\d)([a-z])', '\\1 \\2', doc, flags=re.IGNORECASE)
-#    doc = re.sub('(\d)\-([a-zA-Z])', '\\1 - \\2', doc)
-    doc = re.sub(' yo m ', ' yo male ', doc, flags=re.IGNORECASE)
-    doc = re.sub(' yo f ', ' yo female ', doc, flags=re.IGNORECASE)
-    doc = re.sub('[xX] ray', 'xray', doc)
-#    doc = re.sub('[aA]\-fib', 'afib', doc)
-    doc = re.sub('[aA] fib', 'afib', doc)
-#    doc = re.sub('[vV]\-fib', 'vfib', doc)
-    doc = re.sub('[vV] fib', 'vfib', doc)
-    doc = re.sub('(\\. )*\\.', '.', doc)
-    doc = re.sub('\s+', ' ', doc)
-    doc = doc.replace('CVA tenderness', 'costovertebral angle tenderness')
-    doc = re.sub('(nkda)\\.', '\\1', doc, flags=re.IGNORECASE)
-    doc = re.sub('(nka)\\.', '\\1', doc, flags=re.IGNORECASE)
-    doc = re.sub('(\\. )*\\.', '.', doc)
-    doc = re.sub('\ss\/p\s', ' status post ', doc, flags=re.IGNORECASE)
-    doc = re.sub('\sb\s6\s', ' b6 ', doc, flags=re.IGNORECASE|re.S)
-    doc = re.sub('\sb\s12\s', ' b6 ', doc, flags=re.IGNORECASE|re.S)
-    doc = re.sub('\sb6\/b12\s', ' b6 b12 ', doc, flags=re.IGNORECASE|re.S)
-    doc = re.sub('\sb12\/b6\s', ' b6 b12 ', doc, flags=re.IGNORECASE|re.S)
-    
-    # --- parse document
-    parsedDoc = parser(doc)
-
-    sents = []
-    # the "sents" property returns spans
-    # spans have indices into the original string
-    # where each index value represents a token
-    for span in parsedDoc.sents:
-        # go from the start to the end of each span, returning each token in the sentence
-        # combine each token using join()
-        sent = ''.join(parsedDoc[i].string for i in range(span.start, span.end)).strip()
-        sents.append(sent)
+    regex('\s\d\d/\d\d/\d\d\d\d\s', ' '),
 
+    # --- force sentence spliting where punctuation is not used properly
+    regex('\n[0-9]+\\.\s', ' . This is a list item. '), # 1. blah blah
+    regex('\n[0-9]+\)\s', ' . This is a list item. '),  # 1) blah blah
+    regex('\n-+', ' . This is a list item. '),          # -- blah blah
+
+    literal('(H)', ' '), # lab: high
+    literal('(L)', ' '), # lab: low
+    literal('(T)', ' '), # lab: trace
+    regex('QTY:.{0,30} End:', ' . '),
+    regex('QTY:.{0,20} Start:', ' . '),
+    regex('QTY:.{0,10} Refills:\d*', ' . '),
+    regex('take:', 'take '),
+    regex('TABLET\s+CR\s+', 'TABLET '),   # controlled release, not creatinine
+    regex('CAPSULE\s+CR\s+', 'CAPSULE '), # controlled release, not creatinine
+    regex('creatinine\s*:\s*', 'creatinine ', re.IGNORECASE),
+    regex('[\s/]PE:', '\nPHYSICAL EXAMINATION:'),
+    regex('\n([^\n]+): ', '\n . \\1: '),
+    regex('\n+', ' '),
+    regex('_+', 'NEW RECORD: '),
+    regex('--+', ' . '),
+    regex('==+', ' . '),
+    regex('##+', ' '),
+    regex('-', ' '),
+    regex('\\*+', '.'),
+    regex('\\"', ''),
+    regex('\s+', ' '),
+    regex(': ', ': . '),
+    regex('~', ' '),
+    regex('(\d)([a-z])', '\\1 \\2', re.IGNORECASE),
+#    regex('(\d)\-([a-zA-Z])', '\\1 - \\2'),
+    regex(' yo m ', ' yo male ', re.IGNORECASE),
+    regex(' yo f ', ' yo female ', re.IGNORECASE),
+    regex('[xX] ray', 'xray'),
+#    regex('[aA]\-fib', 'afib'),
+    regex('[aA] fib', 'afib'),
+#    regex('[vV]\-fib', 'vfib'),
+    regex('[vV] fib', 'vfib'),
+    regex('(\\. )*\\.', '.'),
+    regex('\s+', ' '),
+    literal('CVA tenderness', 'costovertebral angle tenderness'),
+    regex('(nkda)\\.', '\\1', re.IGNORECASE),
+    regex('(nka)\\.', '\\1', re.IGNORECASE),
+    regex('(\\. )*\\.', '.'),
+    regex('\ss\/p\s', ' status post ', re.IGNORECASE),
+    regex('\sb\s6\s', ' b6 ', re.IGNORECASE|re.S),
+    regex('\sb\s12\s', ' b6 ', re.IGNORECASE|re.S),
+    regex('\sb6\/b12\s', ' b6 b12 ', re.IGNORECASE|re.S),
+    regex('\sb12\/b6\s', ' b6 b12 ', re.IGNORECASE|re.S),
+]
+
+CLEANUP = RuleEngine(CLEANUP_RULES, name = 'cleanup')
+
+def read_document(file):
+    """Returns raw content of *file* from in_dir."""
+    f = open(in_dir + file, 'r')
+    doc = f.read()
+    f.close()
+    return doc
+
+def clean_document(doc):
+    """
+    PART 1 cleanup of raw XML document *doc* before it is parsed by spaCy.
+    """
+    return CLEANUP.apply(doc)
+
+def write_sentences(file, parsedDoc):
+    """
+    Splits *parsedDoc* into sentences and writes them to out_dir as lines
+    of normalised tokens.
+    """
     f = open(out_dir + file + '.txt','w')
-    for sentence in sents: 
-        sentence = re.sub('\\: \\.', ':', sentence)
-        if sentence not in ['This is a list item.', '.']:
-            parse = parser(sentence)
-            tokenized = ' '
-            for i, token in enumerate(parse):
-                t = token.lower_
-                if t in dic1.keys(): t = dic1[t]
-                tokenized += t + ' '
-            for key in dic2: tokenized = tokenized.replace(' ' + key + ' ',  ' ' + dic2[key] + ' ')
-            #tokenized = tokenized.strip(' ')
-            if tokenized not in ['']: f.write(tokenized+'\n')
+    f.write(worker.sentences_text(parsedDoc))
     f.close()
 
-# ------------------------------------------------------------------ PART 2
+def preprocess_document(file):
+    """
+    PART 1: cleans up *file* from in_dir, splits it into sentences with spaCy
+    and writes normalised tokens to out_dir.
+    """
+    write_sentences(file, worker.parse(read_document(file)))
+
+def preprocess_batch(files, batch_size = 32, n_process = 1):
+    """
+    PART 1 for a list of *files*; documents are parsed in batches with spaCy's pipe.
+
+    Args:
+      files (list <str>) - names of files from in_dir
+      batch_size (int) - number of documents parsed by spaCy at once
+      n_process (int) - number of spaCy processes (only for serial runs)
+    """
+    for file, parsedDoc in parse_batch(files, batch_size, n_process):
+        write_sentences(file, parsedDoc)
+
+def parse_batch(files, batch_size = 32, n_process = 1):
+    """Yields (file, parsed document) for cleaned *files* parsed with spaCy's pipe."""
+    docs = (read_document(file) for file in files)
+    for i, parsedDoc in enumerate(worker.parse_batch(docs, batch_size, n_process)):
+        yield files[i], parsedDoc
 
-# --- input files
-in_dir = './01_preprocessed/'
-
-# --- output files
-
-family = './02_family/'
-for f in os.listdir(family):
-    os.remove(os.path.abspath(os.path.join(family, f)))
-
-allergy = './02_allergy/'
-for f in os.listdir(allergy):
-    os.remove(os.path.abspath(os.path.join(allergy, f)))
-
-negated = './02_negated/'
-for f in os.listdir(negated):
-    os.remove(os.path.abspath(os.path.join(negated, f)))
-
-main = './02_main/'
-for f in os.listdir(main):
-    os.remove(os.path.abspath(os.path.join(main, f)))
-
-twomonths = './02_months_two/'
-for f in os.listdir(twomonths):
-    os.remove(os.path.abspath(os.path.join(twomonths, f)))
-
-threemonths = './02_months_three/'
-for f in os.listdir(threemonths):
-    os.remove(os.path.abspath(os.path.join(threemonths, f)))
+# ------------------------------------------------------------------ PART 2
 
-sixmonths = './02_months_six/'
-for f in os.listdir(sixmonths):
-    os.remove(os.path.abspath(os.path.join(sixmonths, f)))
-    
-for file in os.listdir(in_dir):
+def lexicon_keys(name):
+    """Keys of lexicon *name* in the order in which its dictionary is iterated."""
+    return list(dict(csv.reader(open(lexicon_dir + name))))
+
+def lexicon_rules(name, templates):
+    """
+    Compiles rules made by *templates* (function: key -> list of rules) for all keys
+    of lexicon *name*, in the order of the keys; only the rules of the keys found
+    in a document are applied to it.
+    """
+    return LexiconEngine(lexicon_keys(name), templates, name = name)
+
+def lexicon_phrases(name):
+    """Replacement of the phrases of lexicon *name* (key,value) surrounded by spaces."""
+    dic = dict(csv.reader(open(lexicon_dir + name)))
+    return PhraseReplacer(list(dic), [dic[key] for key in dic])
+
+# --- marker rules of the lexicons, compiled once per process
+LANGUAGE = lexicon_rules('language.txt', lambda key: [
+    regex('('+key+'.{0,10} speak)', 'NOENGL \\1'),
+    regex('(speak.{0,20} '+key+')', 'NOENGL \\1'),
+])
+NEGATION = NegationScanner(lexicon_dir + 'negation.txt')
+HRTMED = lexicon_phrases('hrtmed.txt')
+SUPPLEMENTS = lexicon_rules('supplements.txt', lambda key: [
+    regex('\s('+key+'.{0,50} MED)', ' SPLMNT \\1', re.S),
+    regex('(MED|medication|take|taking|continue|refill)(.{0,50})\s('+key+')', '\\1\\2 SPLMNT \\3', re.S),
+    regex('\s('+key+'.{0,20})\s(supplement|replacement)', ' SPLMNT \\1 \\2', re.S),
+    regex('(supplement.{0,20})\s('+key+')', '\\1 SPLMNT \\2', re.S),
+])
+DEFICIENCY = lexicon_rules('deficiency.txt', lambda key: [regex('('+key+')', '\\1 DFCNCY')])
+MENTAL = lexicon_rules('mental.txt', lambda key: [regex(key, 'MNTCAP ' + key)])
+ILLICIT = lexicon_rules('illicit.txt', lambda key: [regex(key, 'JUNKIE ' + key)])
+KIDMED = lexicon_rules('kidmed.txt', lambda key: [regex(key, key + ' KIDMED')])
+SURGERY = lexicon_rules('surgery.txt', lambda key: [
+    regex('(abdo.{0,15} '+key+')', '\\1 ABDMNL'),
+    regex('(colon.{0,15} '+key+')', '\\1 ABDMNL'),
+    regex('(intestin.{0,15} '+key+')', '\\1 ABDMNL'),
+    regex('(bowel.{0,15} '+key+')', '\\1 ABDMNL'),
+    regex('(ovarian.{0,15} '+key+')', '\\1 ABDMNL'),
+    regex('(hernia.{0,15} '+key+')', '\\1 ABDMNL'),
+    regex('(gall\s?bladder.{0,15} '+key+')', '\\1 ABDMNL'),
+    regex('(biliary.{0,15} '+key+')', '\\1 ABDMNL'),
+])
+PREVENT = lexicon_rules('prevent.txt', lambda key: [
+    regex('('+key+'.{0,50} aspirin)', '\\1 ASPFMI', re.S),
+    regex('(aspirin) (.{0,50}'+key+')', '\\1 ASPFMI \\2', re.S),
+])
+
+# --- rule tables timed in profiling mode
+ENGINES = [CLEANUP, LANGUAGE, SUPPLEMENTS, DEFICIENCY, MENTAL, ILLICIT, KIDMED, SURGERY, PREVENT]
+
+# --- lab values, see labs.py
+CREATININE = LabMarker('creatinine', 'creatinine[\w\s\d]{0,15} \d\\.\d', 3, 1.5, before = ' HIGHCRT ')
+HBA1C = LabMarker('hba1c', 'hba1c[\w\s]{0,20} \d\\.\d', 3, 6.5, 9.5, after = ' GLYHMG ')
+HBA1C_WHOLE = LabMarker('hba1c', 'hba1c[\w\s]{0,20} \d ', 2, 6.5, 9.5, after = 'GLYHMG ')
+
+class NullFile(object):
+    """Stands in for a debug output file which is not written."""
+    def write(self, text):
+        pass
+
+    def close(self):
+        pass
+
+def no_matches(pattern, doc):
+    return []
+
+def debug_file(folder, file):
+    """Opens debug output *file* in *folder*, or a NullFile if *file* is None."""
+    return NullFile() if file is None else open(folder + file, 'w')
+
+def markup_document(file):
+    """
+    PART 2: reads *file* from out_dir, removes family/allergy/negated information,
+    inserts marker tags and writes the results to the 02_* folders.
+    """
     # --- read document
-    f = open(in_dir + file, 'r')
+    f = open(out_dir + file, 'r')
     doc = f.read()
     f.close()
+    labs = []
+    write_main(file, markup_text(doc, file, labs))
+    write_labs(labvalues + file, labs)
+
+def markup_text(doc, file = None, labs = None):
+    """
+    PART 2 on PART 1 output *doc*; returns the text for 02_main.
+    Removed family/allergy/negated fragments are written to the debug folders
+    under name *file*, nothing is written if *file* is None.
+    Rows of the lab table (see labs.py) are appended to *labs* if given.
+    """
+    # --- timed in profiling mode
+    re = markup_re
+
+    # --- debug output only
+    findall = no_matches if file is None else re.findall
+
+    # --- lab mentions of CREATININE, HBA1C and HBA1C_WHOLE, located in the final text
+    mentions = [None] * 3 if labs is None else [[], [], []]
     
     # --- vitamin D
     doc = re.sub('vitamind', 'DDDD', doc)
@@ -234,30 +441,30 @@ for file in os.listdir(in_dir):
     doc = re.sub('calcitol', 'DDDD', doc)
 
     # --- remove information about family members
-    f = open(family + file,'w')
+    f = debug_file(family, file)
 
     f.write('FAMILY HISTORY\n\n')
-    for item in re.findall('family history [^\n]*:\n[^\n\\.]+', doc): f.write("%s\n" % item.replace('\n', ' '))
+    for item in findall('family history [^\n]*:\n[^\n\\.]+', doc): f.write("%s\n" % item.replace('\n', ' '))
     doc = re.sub('family history :\n[^\n\\.]+', 'XXX ', doc, flags=re.S)
-    for item in re.findall('family history \w[^\n\\.]+', doc): f.write("%s\n" % item)
+    for item in findall('family history \w[^\n\\.]+', doc): f.write("%s\n" % item)
     doc = re.sub('family history \w[^\n\\.]+', 'XXX ', doc)
     
     f.write('\n\nFAMILY MEMBER\n\n')
-    for item in re.findall('[^\n\\.:;]+family member[^\n\\.]+', doc): f.write("%s\n" % item)
+    for item in findall('[^\n\\.:;]+family member[^\n\\.]+', doc): f.write("%s\n" % item)
     doc = re.sub('[^\n\\.:;]+family member[^\n\\.]+', 'XXX ', doc)
 
     f.write('\n\nDIED\n\n')
-    for item in re.findall('[^\n\\.:;]+died[^\n\\.]+', doc): f.write("%s\n" % item)
+    for item in findall('[^\n\\.:;]+died[^\n\\.]+', doc): f.write("%s\n" % item)
     doc = re.sub('[^\n\\.:;]+died[^\n\\.]+', 'XXX ', doc)
-    for item in re.findall('[^\n\\.:;]+death[^\n\\.]+', doc): f.write("%s\n" % item)
+    for item in findall('[^\n\\.:;]+death[^\n\\.]+', doc): f.write("%s\n" % item)
     doc = re.sub('[^\n\\.:;]+death[^\n\\.]+', 'XXX ', doc)
-    for item in re.findall('[^\n\\.:;]+passed away[^\n\\.]+', doc): f.write("%s\n" % item)
+    for item in findall('[^\n\\.:;]+passed away[^\n\\.]+', doc): f.write("%s\n" % item)
     doc = re.sub('[^\n\\.:;]+passed away[^\n\\.]+', 'XXX ', doc)
 
     f.close()
 
     # --- remove allergy information
-    f = open(allergy + file,'w')
+    f = debug_file(allergy, file)
 
     doc = re.sub('(no known drug allergies)', '\\1 .\n', doc)
     doc = re.sub('(no known allergies)', '\\1 .\n', doc)
@@ -267,153 +474,23 @@ for file in os.listdir(in_dir):
     doc = re.sub(' allergies ?\/ \n', ' allergies : ', doc, flags=re.S)
     doc = re.sub('(allergies : )\n', '\\1', doc, flags=re.S)
     doc = re.sub('(adverse reactions? : )\n', '\\1', doc, flags=re.S)
-    for item in re.findall(' allerg[^\n\\.]+', doc): f.write("%s\n" % item)
+    for item in findall(' allerg[^\n\\.]+', doc): f.write("%s\n" % item)
     doc = re.sub(' allerg[^\n\\.]+', ' XXX ', doc)
-    for item in re.findall('adverse reaction[^\n\\.]+', doc): f.write("%s\n" % item)
+    for item in findall('adverse reaction[^\n\\.]+', doc): f.write("%s\n" % item)
     doc = re.sub(' adverse reaction[^\n\\.]+', ' XXX ', doc)
     
     f.close()
 
     # --- speaks English?
-    dic = dict(csv.reader(open('./lexicon/language.txt')))
-    for key in dic:
-        doc = re.sub('('+key+'.{0,10} speak)', 'NOENGL \\1', doc)
-        doc = re.sub('(speak.{0,20} '+key+')', 'NOENGL \\1', doc)
+    doc = LANGUAGE.apply(doc)
 
     doc = re.sub('(not) (speak.{0,20} english)', 'NOENGL njet \\2', doc)
     doc = re.sub('(english.{0,10}) (not)', 'NOENGL \\1 njet', doc)
     doc = re.sub('interpreter', 'NOENGL interpreter', doc)
     
     # --- remove negated information
-    f = open(negated + file,'w')
-
-    f.write('\n\n: NO\n\n')
-    for item in re.findall('[^\n\\.:;,]+:\s*none', doc): f.write("%s\n" % item.replace('\n', ''))
-    doc = re.sub('[^\n\\.:;,]+:\s+none', 'XXX ', doc)
-    for item in re.findall('[^\n\\.:;,]+:\s*negative', doc): f.write("%s\n" % item.replace('\n', ''))
-    doc = re.sub('[^\n\\.:;,]+:\s+negative', 'XXX ', doc)
-    for item in re.findall('[^\n\\.:;,]+:\s*no [^\n\\.]*', doc): f.write("%s\n" % item.replace('\n', ''))
-    doc = re.sub('[^\n\\.:;,]+:\s*no [^\n\\.]*', 'XXX ', doc)
-
-    for item in re.findall('[^\n\\.:;,]+:\s+denies[^\n\\.]+', doc): f.write("%s\n" % item.replace('\n', ''))
-    doc = re.sub('[^\n\\.:;,]+:\s+denies[^\n\\.]+', 'XXX ', doc)
-    for item in re.findall('[^\n\\.:;,]+:\s+unremarkable[^\n\\.]+', doc): f.write("%s\n" % item.replace('\n', ''))
-    doc = re.sub('[^\n\\.:;,]+:\s+unremarkable[^\n\\.]+', 'XXX ', doc)
-    
-    f.write('\n\nRULE OUT\n\n')
-    for item in re.findall('[^\n\\.:;]*rule[sd]? out[^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('[^\n\\.:;]*rule[sd]? out[^\n\\.]+', 'XXX ', doc)
-
-    f.write('\n\nRULE SOMETHING OUT\n\n')
-    for item in re.findall('[^\n\\.:;]*rule[sd]? \w+ out[^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('[^\n\\.:;]*rule[sd]? \w+ out[^\n\\.]+', 'XXX ', doc)
-
-    f.write('\n\nDENIES\n\n')
-    for item in re.findall('[^\n\\.:;,]*denie[sd]? [^\n\\.]*', doc): f.write("%s\n" % item)
-    doc = re.sub('[^\n\\.:;,]*denie[sd]? [^\n\\.]*', 'XXX ', doc)
-    for item in re.findall('[^\n\\.:;,]*deny.{0,3} [^\n\\.]*', doc): f.write("%s\n" % item)
-    doc = re.sub('[^\n\\.:;,]*deny.{0,3} [^\n\\.]*', 'XXX ', doc)
-
-    f.write('\n\nCANNOT SEE\n\n')
-    for item in re.findall('[^\n\\.:;]*cannot see[^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('[^\n\\.:;]*cannot see[^\n\\.]+', 'XXX ', doc)
-
-    f.write('\n\nUNLIKELY\n\n')
-    for item in re.findall('[^\n\\.:;]*unlikely [^\n\\.]*', doc): f.write("%s\n" % item)
-    doc = re.sub('[^\n\\.:;]*unlikely [^\n\\.]*', 'XXX ', doc)
-    
-    f.write('\n\nNEGATIVE FOR\n\n')
-    for item in re.findall('[^\n\\.:;]*negative for [^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('[^\n\\.:;]*negative for [^\n\\.]+', 'XXX ', doc)
-
-    f.write('\n\nNEITHER\n\n')
-    for item in re.findall('[^\n\\.:;,]*neither [^\n\\.,]+', doc): f.write("%s\n" % item)
-    doc = re.sub('[^\n\\.:;,]*neither [^\n\\.,]+', 'XXX ', doc)
-
-    f.write('\n\nNOR\n\n')
-    for item in re.findall('[^\n\\.:;,]* nor [^\n\\.,]+', doc): f.write("%s\n" % item)
-    doc = re.sub('[^\n\\.:;,]* nor [^\n\\.,]+', 'XXX ', doc)
-
-    f.write('\n\nNOT APPEAR\n\n')
-    for item in re.findall('[^\n\\.:;,]*not appear[^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('[^\n\\.:;,]*not appear[^\n\\.]+', 'XXX ', doc)
-
-    f.write('\n\nNOT KNOWN TO\n\n')
-    for item in re.findall('[^\n\\.:;,]*not known to[^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('[^\n\\.:;,]*not known to[^\n\\.]+', 'XXX ', doc)
-
-    f.write('\n\nNOT APPRECIATE\n\n')
-    for item in re.findall('[^\n\\.:;,]*not appreciate[^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('[^\n\\.:;,]*not appreciate[^\n\\.]+', 'XXX ', doc)
-
-    f.write('\n\nNOT COMPLAIN\n\n')
-    for item in re.findall('[^\n\\.:;,]*not complain[^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('[^\n\\.:;,]*not complain[^\n\\.]+', 'XXX ', doc)
-
-    f.write('\n\nNOT DEMONSTRATE\n\n')
-    for item in re.findall('[^\n\\.:;,]+not demonstrate[^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('[^\n\\.:;,]+not demonstrate[^\n\\.]+', 'XXX ', doc)
-
-    f.write('\n\nNOT EXHIBIT\n\n')
-    for item in re.findall('[^\n\\.:;,]*not exhibit[^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('[^\n\\.:;,]*not exhibit[^\n\\.]+', 'XXX ', doc)
-
-    f.write('\n\nNOT FEEL\n\n')
-    for item in re.findall('[^\n\\.:;,]*not feel[^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('[^\n\\.:;,]*not feel[^\n\\.]+', 'XXX ', doc)
-    for item in re.findall('[^\n\\.:;,]*not felt [^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('[^\n\\.:;,]*not felt [^\n\\.]+', 'XXX ', doc)
-
-    f.write('\n\nNOT REVIEWED\n\n')
-    for item in re.findall('[^\n\\.:;,]*not reviewed[^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('[^\n\\.:;,]*not reviewed[^\n\\.]+', 'XXX ', doc)
-
-    f.write('\n\nNOT HAVE\n\n')
-    for item in re.findall('[^\n\\.:;,]*not have [^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('[^\n\\.:;,]*not have [^\n\\.]+', 'XXX ', doc)
-    for item in re.findall('[^\n\\.:;,]*not had [^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('[^\n\\.:;,]*not had [^\n\\.]+', 'XXX ', doc)
-    for item in re.findall('[^\n\\.:;,]*never had [^\n\\.]+', doc): f.write("%s\n" % item)
-
-    f.write('\n\nDOES NOT\n\n')
-    for item in re.findall('does not [^\n\\.]{0,50}', doc): f.write("%s\n" % item)
-    doc = re.sub('does not [^\n\\.]{0,50}', 'XXX ', doc)
-    for item in re.findall('did not see[^\n\\.]{0,50}', doc): f.write("%s\n" % item)
-    doc = re.sub('did not see[^\n\\.]{0,50}', 'XXX ', doc)
-    for item in re.findall('did not show[^\n\\.]{0,50}', doc): f.write("%s\n" % item)
-    doc = re.sub('did not show[^\n\\.]{0,50}', 'XXX ', doc)
-    for item in re.findall('did not reveal[^\n\\.]{0,50}', doc): f.write("%s\n" % item)
-    doc = re.sub('did not reveal[^\n\\.]{0,50}', 'XXX ', doc)
-    for item in re.findall('did not experience[^\n\\.]{0,50}', doc): f.write("%s\n" % item)
-    doc = re.sub('did not experience[^\n\\.]{0,50}', 'XXX ', doc)
-    for item in re.findall('did not take[^\n\\.]{0,50}', doc): f.write("%s\n" % item)
-    doc = re.sub('did not take[^\n\\.]{0,50}', 'XXX ', doc)
-
-    f.write('\n\nNO\n\n')
-    for item in re.findall('\sno [^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('\sno [^\n\\.]+', ' XXX ', doc)
-
-    f.write('\n\nWITHOUT\n\n')
-    doc = re.sub(' w\/o ', ' without ', doc)
-    for item in re.findall('without any[^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('without any[^\n\\.]+', 'XXX ', doc)
-    for item in re.findall('without evidence[^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('without evidence[^\n\\.]+', 'XXX ', doc)
-    for item in re.findall('without indication[^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('without indication[^\n\\.]+', 'XXX ', doc)
-    for item in re.findall('without sign[^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('without sign[^\n\\.]+', 'XXX ', doc)
-    for item in re.findall('without[^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('without[^\n\\.]+', 'XXX ', doc)
-
-    f.write('\n\nFREE OF\n\n')
-    for item in re.findall('free of [^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('free of [^\n\\.]+', 'XXX ', doc)
-    for item in re.findall('absence of [^\n\\.]+', doc): f.write("%s\n" % item)
-    doc = re.sub('absence of [^\n\\.]+', 'XXX ', doc)
-    doc = doc.replace(' pain free ', ' XXX ')
-    doc = doc.replace(' symptom free ', ' XXX ')
-    
+    f = debug_file(negated, file)
+    doc = timed('negation.txt', 'scanner', NEGATION.apply, doc, None if file is None else f)
     f.close()
 
     # --- medication prescription MEDRX
@@ -504,8 +581,7 @@ for file in os.listdir(in_dir):
    
     # --- heart medications
     doc = re.sub('\s\w+nitrate', ' nitrate', doc)
-    dic = dict(csv.reader(open('./lexicon/hrtmed.txt')))
-    for key in dic: doc = doc.replace(' ' + key + ' ',  ' ' + dic[key] + ' ')
+    doc = timed('hrtmed.txt', 'phrases', HRTMED.replace, doc)
     doc = re.sub('\s\w+statin\s', ' statin ', doc)
     doc = re.sub('\sstatins\s', ' statin ', doc)
 
@@ -524,12 +600,7 @@ for file in os.listdir(in_dir):
     doc = re.sub(' (DDDD\s.{0,10})\s(ca)[^\w]+', ' \\1 calcium ', doc, flags=re.S)
 
     doc = re.sub('\w+cobalamin', 'cobalamin', doc)
-    dic = dict(csv.reader(open('./lexicon/supplements.txt')))
-    for key in dic:
-        doc = re.sub('\s('+key+'.{0,50} MED)', ' SPLMNT \\1', doc, flags=re.S)
-        doc = re.sub('(MED|medication|take|taking|continue|refill)(.{0,50})\s('+key+')', '\\1\\2 SPLMNT \\3', doc, flags=re.S)
-        doc = re.sub('\s('+key+'.{0,20})\s(supplement|replacement)', ' SPLMNT \\1 \\2', doc, flags=re.S)
-        doc = re.sub('(supplement.{0,20})\s('+key+')', '\\1 SPLMNT \\2', doc, flags=re.S)
+    doc = SUPPLEMENTS.apply(doc)
     
     doc = re.sub('(\w*vitamins?)', 'SPLMNT \\1', doc)
     doc = re.sub('(minerals)', 'SPLMNT \\1', doc)
@@ -544,8 +615,7 @@ for file in os.listdir(in_dir):
     
     for counter in range(0,3): doc = doc.replace('SPLMNT SPLMNT', 'SPLMNT')
 
-    dic = dict(csv.reader(open('./lexicon/deficiency.txt')))
-    for key in dic: doc = re.sub('('+key+')', '\\1 DFCNCY', doc)
+    doc = DEFICIENCY.apply(doc)
 
     # --- heart treatments
     doc = re.sub('(angioplast\w*)', 'HRTTRT \\1', doc)
@@ -610,8 +680,7 @@ for file in os.listdir(in_dir):
     doc = re.sub('creatinine\s\\.\s+(\d\\.\d\s\\.)', 'creatinine \\1', doc)
     doc = re.sub('(creatinine)(\s?\(\s?)(\d\\.\d)(\d?\s?\)\s)', '\\1 \\3 ', doc)
     doc = re.sub('\s*/\s*creatinine\s+\d+\s*/\s*', ' creatinine ', doc, flags=re.S) # bun/cre b/c --> bun cre c
-    for item in set(re.findall('creatinine[\w\s\d]{0,15} \d\\.\d', doc)):
-        if (float(item[-3:]) > 1.5): doc = doc.replace(item, ' HIGHCRT ' + item)
+    doc = timed('labs', 'creatinine', CREATININE.apply, doc, mentions[0])
     doc = re.sub(' +', ' ', doc)
     for counter in range(0,3): doc = doc.replace('HIGHCRT HIGHCRT', 'HIGHCRT')
     
@@ -632,26 +701,19 @@ for file in os.listdir(in_dir):
     doc = re.sub('(hba1c)(\s?\(\s?)(\d\\.\d)(\d?\s?\)\s)', '\\1 \\3 ', doc)
     doc = re.sub('hba1c\s?=\s?', 'hba1c ', doc)
     doc = re.sub('(hba1c)(\s+\\.\s+)(\d\\.\d)', '\\1 \\3', doc, flags=re.S)
-    for item in set(re.findall('hba1c[\w\s]{0,20} \d\\.\d', doc)):
-        hba1c = float(item[-3:])
-        if (6.5 <= hba1c and hba1c <= 9.5): doc = doc.replace(item, item + ' GLYHMG ')
+    doc = timed('labs', 'hba1c', HBA1C.apply, doc, mentions[1])
 #    for item in set(re.findall('hba1c \\( \d\\.\d', doc)):
 #        hba1c = float(item[-3:])
 #        if (6.5 <= hba1c and hba1c <= 9.5): doc = doc.replace(item, item + ' GLYHMG ')
-    for item in set(re.findall('hba1c[\w\s]{0,20} \d ', doc)):
-        hba1c = float(item[-2:])
-        if (6.5 <= hba1c and hba1c <= 9.5): doc = doc.replace(item, item + 'GLYHMG ')
+    doc = timed('labs', 'hba1c whole', HBA1C_WHOLE.apply, doc, mentions[2])
 
     # --- can make decisions?
-    dic = dict(csv.reader(open('./lexicon/mental.txt')))
-    for key in dic:
-        doc = re.sub(key, 'MNTCAP ' + key, doc)
+    doc = MENTAL.apply(doc)
 
     doc = re.sub('non MNTCAP', 'non', doc)
     
     # --- illicit drugs?
-    dic = dict(csv.reader(open('./lexicon/illicit.txt')))
-    for key in dic: doc = re.sub(key, 'JUNKIE ' + key, doc)
+    doc = ILLICIT.apply(doc)
 
     doc = re.sub(' no JUNKIE', ' no', doc)
     doc = re.sub('JUNKIE(.{0,20}negative)', 'XXX', doc)
@@ -710,8 +772,7 @@ for file in os.listdir(in_dir):
     doc = re.sub('(nephrotic syndrome)', '\\1 KIDDAM', doc)
     doc = re.sub('(nephrosclerosis)', '\\1 KIDDAM', doc)
     doc = re.sub('(nephropathy)', '\\1 KIDDAM', doc)
-    dic = dict(csv.reader(open('./lexicon/kidmed.txt')))
-    for key in dic: doc = re.sub(key, key + ' KIDMED', doc)
+    doc = KIDMED.apply(doc)
     
     # --- diabetic complications
     doc = re.sub('(diabet.{0,60} \w+pathy)', '\\1 DMCMPL', doc)
@@ -781,16 +842,7 @@ for file in os.listdir(in_dir):
     doc = re.sub('(small intestinal obstruction\w*)', '\\1 ABDMNL', doc)
     doc = re.sub('(obstruction.{0,10} small bowel)', '\\1 ABDMNL', doc)
     doc = re.sub('(obstruction.{0,10} small intestine)', '\\1 ABDMNL', doc)
-    dic = dict(csv.reader(open('./lexicon/surgery.txt')))
-    for key in dic:
-        doc = re.sub('(abdo.{0,15} '+key+')', '\\1 ABDMNL', doc)
-        doc = re.sub('(colon.{0,15} '+key+')', '\\1 ABDMNL', doc)
-        doc = re.sub('(intestin.{0,15} '+key+')', '\\1 ABDMNL', doc)
-        doc = re.sub('(bowel.{0,15} '+key+')', '\\1 ABDMNL', doc)
-        doc = re.sub('(ovarian.{0,15} '+key+')', '\\1 ABDMNL', doc)
-        doc = re.sub('(hernia.{0,15} '+key+')', '\\1 ABDMNL', doc)
-        doc = re.sub('(gall\s?bladder.{0,15} '+key+')', '\\1 ABDMNL', doc)
-        doc = re.sub('(biliary.{0,15} '+key+')', '\\1 ABDMNL', doc)
+    doc = SURGERY.apply(doc)
     for counter in range(0,3): doc = doc.replace('ABDMNL ABDMNL', 'ABDMNL')
 
     doc = re.sub('(headache.{0,50}) aspirin', '\\1 XXX', doc, flags=re.S)
@@ -811,53 +863,345 @@ for file in os.listdir(in_dir):
     doc = re.sub('aspirin (.{0,50}cough)', 'XXX \\1', doc, flags=re.S)
     doc = re.sub('not take aspirin', 'XXX', doc)
     
-    dic = dict(csv.reader(open('./lexicon/prevent.txt')))
-    for key in dic:
-        doc = re.sub('('+key+'.{0,50} aspirin)', '\\1 ASPFMI', doc, flags=re.S)
-        doc = re.sub('(aspirin) (.{0,50}'+key+')', '\\1 ASPFMI \\2', doc, flags=re.S)
+    doc = PREVENT.apply(doc)
     for counter in range(0,5): doc = doc.replace('ASPFMI ASPFMI', 'ASPFMI')
 
     # --- separate poorly tokenized tags
     doc = re.sub('([a-z])([A-Z]+)', '\\1 \\2', doc)
     doc = re.sub('([A-Z]+)([a-z])', '\\1 \\2', doc)
-        
-    days = 0
-    previous = datetime(2000,1,1)
-    for item in reversed(re.findall(' this is record date \d\d\d\d\d\d\d\d \\. ', doc)):
-        current = datetime(int(item[21:25]), int(item[25:27]), int(item[27:29]))
-        difference = (previous - current).days
-        if (difference > 0): days = days + difference
-        if (days <= 61): 
-            doc = doc.replace(item, ' record within 6 months . \n' + item)
-            doc = doc.replace(item, ' record within 3 months . \n' + item)
-            doc = doc.replace(item, ' record within 2 months . \n' + item)
-        elif (days <= 92): 
-            doc = doc.replace(item, ' record within 6 months . \n' + item)
-            doc = doc.replace(item, ' record within 3 months . \n' + item)
-        elif (days <= 183): 
-            doc = doc.replace(item, ' record within 6 months . \n' + item)
-        previous = current
+
+    # --- records of the last 6, 3 and 2 months
+    doc = timed('records', 'windows', mark_windows, doc)
 
     doc = re.sub(' +', ' ', doc)
 
+    # --- offsets of the lab mentions in the final text
+    if labs is not None:
+        for rows in mentions:
+            labs.extend(locate_mentions(doc, rows))
+    return doc
+
+def write_main(file, doc):
+    """
+    Writes PART 2 output *doc* to 02_main and the index of its records and
+    time windows (see records.py) to 02_index.
+    """
     f = open(main + file,'w')
     f.write(doc)
     f.close()
-
-    cut = doc.find(' record within 6 months')
-    if (cut >= 0): doc = doc[cut:]
-    f = open(sixmonths + file,'w')
-    f.write(doc)
-    f.close()
-
-    cut = doc.find(' record within 3 months')
-    if (cut >= 0): doc = doc[cut:]
-    f = open(threemonths + file,'w')
-    f.write(doc)
-    f.close()
-    
-    cut = doc.find(' record within 2 months')
-    if (cut >= 0): doc = doc[cut:]
-    f = open(twomonths + file,'w')
-    f.write(doc)
-    f.close()
+    write_index(recindex + file, record_index(doc))
+
+# ------------------------------------------------------------------ PART 1 + PART 2
+
+class Preprocessor(object):
+    """
+    Preprocessing of single documents in memory. Holds the spaCy parser (loaded
+    on first use), the token normalizer and the compiled cleanup rules, so other
+    modules can preprocess a new record without running the whole script:
+
+        from preprocessing import Preprocessor
+        text = Preprocessor().preprocess_document(raw_xml)
+
+    Args:
+      profile (str) - spaCy pipeline profile from SPACY_PROFILES
+    """
+    def __init__(self, profile = 'full'):
+        self.profile = profile
+        self.cleanup = CLEANUP
+        self.normalizer = TokenNormalizer(lexicon_dir + 'abbrev.txt', lexicon_dir + 'mwe.txt')
+        self._parser = None
+
+    @property
+    def parser(self):
+        """spaCy parser, loaded on first use."""
+        if self._parser is None:
+            self._parser = load_parser(self.profile)
+        return self._parser
+
+    def parse(self, raw_xml):
+        """PART 1 cleanup of *raw_xml* parsed with spaCy."""
+        return timed('spacy', 'parse', self.parser, self.cleanup.apply(raw_xml))
+
+    def parse_batch(self, raw_xmls, batch_size = 32, n_process = 1):
+        """Yields cleaned *raw_xmls* parsed in batches with spaCy's pipe."""
+        docs = (self.cleanup.apply(raw_xml) for raw_xml in raw_xmls)
+        options = {'batch_size': batch_size}
+        if n_process > 1:
+            options['n_process'] = n_process
+        parsedDocs = self.parser.pipe(docs, **options)
+        while True:
+            start = timer()
+            try:
+                parsedDoc = next(parsedDocs)
+            except StopIteration:
+                return
+            if profiler is not None:
+                profiler.add('spacy', 'pipe', timer() - start, len(parsedDoc.text))
+            yield parsedDoc
+
+    def sentence_tokens(self, span, sentence):
+        """
+        Returns lowercased tokens of *sentence*, which is the text of *span*
+        with ': .' turned into ':'.
+
+        Tokens of the document parse are reused instead of parsing the sentence
+        again. spaCy tokenizes every whitespace separated chunk on its own, so this
+        is only done when the sentence starts and ends on a chunk boundary and every
+        removed '.' was a chunk by itself; otherwise the sentence is re-tokenized.
+        """
+        text = span.doc.text
+        tokens = [token for token in span]
+        while tokens and not tokens[0].text.strip():
+            tokens.pop(0)
+        while tokens and not tokens[-1].text.strip():
+            tokens.pop()
+        if not tokens:
+            return [token.lower_ for token in self.parser.tokenizer(sentence)]
+        start = tokens[0].idx
+        end = tokens[-1].idx + len(tokens[-1].text)
+        if (start > 0 and not text[start-1].isspace()) or (end < len(text) and not text[end].isspace()):
+            return [token.lower_ for token in self.parser.tokenizer(sentence)]
+        lowered = []
+        dropped = 0
+        i = 0
+        while i < len(tokens):
+            lowered.append(tokens[i].lower_)
+            if (tokens[i].text.endswith(':') and tokens[i].whitespace_ == ' ' and i + 1 < len(tokens)
+                    and tokens[i+1].text == '.' and (tokens[i+1].whitespace_ or i + 2 == len(tokens))):
+                dropped += 1
+                i += 1
+            i += 1
+        if dropped != text[start:end].count(': .'):
+            return [token.lower_ for token in self.parser.tokenizer(sentence)]
+        return lowered
+
+    def sentences_text(self, parsedDoc):
+        """
+        Returns PART 1 output for *parsedDoc*: its sentences as lines of normalised tokens.
+        """
+        sents = []
+        # the "sents" property returns spans
+        # spans have indices into the original string
+        # where each index value represents a token
+        for span in parsedDoc.sents:
+            # go from the start to the end of each span, returning each token in the sentence
+            # combine each token using join()
+            sent = ''.join(parsedDoc[i].string for i in range(span.start, span.end)).strip()
+            sents.append((span, sent))
+
+        lines = []
+        for span, sentence in sents:
+            sentence = re.sub('\\: \\.', ':', sentence)
+            if sentence not in ['This is a list item.', '.']:
+                tokenized = timed('normalizer', 'sentence', self.normalizer.normalize, self.sentence_tokens(span, sentence))
+                #tokenized = tokenized.strip(' ')
+                if tokenized not in ['']: lines.append(tokenized+'\n')
+        # same str as written to out_dir and read back by PART 2
+        return str(''.join(lines))
+
+    def markup_text(self, doc, file = None, labs = None):
+        """PART 2 on PART 1 output *doc*, see markup_text()."""
+        return markup_text(doc, file, labs)
+
+    def preprocess_document(self, raw_xml, labs = None):
+        """
+        Returns the 02_main text of PART 1 and PART 2 for record *raw_xml*
+        (content of a file in PatientMatching format).
+        Rows of its lab table are appended to *labs* if given.
+        """
+        return self.markup_text(self.sentences_text(self.parse(raw_xml)), labs = labs)
+
+    def preprocess_documents(self, raw_xmls, batch_size = 32):
+        """preprocess_document for a list of records parsed in batches; returns list of texts."""
+        return [self.markup_text(self.sentences_text(parsedDoc))
+                for parsedDoc in self.parse_batch(raw_xmls, batch_size)]
+
+def stream_document(file, debug = False):
+    """
+    PART 1 and PART 2 of *file* from in_dir without intermediate files;
+    only 02_main, 02_index and 02_labs are written, unless *debug* when all folders are written.
+    """
+    finish_stream(file, worker.parse(read_document(file)), debug)
+
+def stream_batch(files, batch_size = 32, n_process = 1, debug = False):
+    """stream_document for a list of *files* parsed in batches with spaCy's pipe."""
+    for file, parsedDoc in parse_batch(files, batch_size, n_process):
+        finish_stream(file, parsedDoc, debug)
+
+def finish_stream(file, parsedDoc, debug):
+    name = file + '.txt'
+    doc = worker.sentences_text(parsedDoc)
+    if debug:
+        f = open(out_dir + name, 'w')
+        f.write(doc)
+        f.close()
+    labs = []
+    write_main(name, markup_text(doc, name if debug else None, labs))
+    write_labs(labvalues + name, labs)
+
+def run(jobs = 1, chunksize = 8, batch_size = 0, n_process = 1, incremental = False, stream = False, debug = False,
+        profile = 'full', timing = None):
+    """
+    Runs PART 1 and PART 2 over all documents from in_dir.
+
+    Args:
+      jobs (int) - number of worker processes, 0 means one per CPU core
+      chunksize (int) - number of documents sent to a worker at once
+      batch_size (int) - if > 0, PART 1 parses documents in batches with spaCy's pipe
+      n_process (int) - number of spaCy processes for batched parsing in a serial run
+      incremental (bool) - process only new or changed documents (see cache_file)
+      stream (bool) - keep documents in memory between PART 1 and PART 2, write only 02_main, 02_index and 02_labs
+      debug (bool) - in *stream* mode write also 01_preprocessed and the other 02_* folders
+      profile (str) - spaCy pipeline profile from SPACY_PROFILES
+      timing (str) - profiling mode, the report is written to *timing*.txt and *timing*.json
+    Every document is processed independently, so the output does not
+    depend on the number of workers.
+    """
+    if jobs == 0:
+        jobs = multiprocessing.cpu_count()
+    print('cleanup: ' + CLEANUP.report())
+    files = sorted(os.listdir(in_dir))
+    outputs = [main, recindex, labvalues] if stream and not debug else OUTPUT_DIRS
+    if incremental:
+        # PART 1 output depends on the input document, PART 2 output on PART 1 output
+        cache = StageCache(cache_file)
+        signature1 = stage_signature(PART1_LEXICONS) + spacy_version() + profile
+        signature2 = stage_signature(PART2_LEXICONS)
+        keys1, keys2 = {}, {}
+        for file in files:
+            with open(in_dir + file, 'rb') as f:
+                keys1[file] = hash_key(signature1, f.read())
+            keys2[file + '.txt'] = hash_key(signature2, keys1[file])
+        clean_output_dirs(keep = keys2)
+        cache.retain('part1', keys1)
+        cache.retain('part2', keys2)
+        part1_files = cache.outdated('part1', keys1, [out_dir], '.txt')
+        part2_files = cache.outdated('part2', keys2, outputs)
+        stream_files = [name[:-len('.txt')] for name in part2_files]
+        print('incremental: {} of {} documents changed'.format(len(part2_files), len(files)))
+    else:
+        clean_output_dirs()
+        part1_files = stream_files = files
+        part2_files = None
+    # --- (document function, batch function) of every stage
+    tasks = {
+        'part1': (preprocess_document, preprocess_batch),
+        'part2': (markup_document, None),
+        'stream': (functools.partial(stream_document, debug = debug), functools.partial(stream_batch, debug = debug)),
+    }
+    if timing:
+        for stage, funcs in tasks.items():
+            tasks[stage] = tuple(Timed(func, stage) if func else None for func in funcs)
+    pool = None
+    if jobs == 1:
+        init_worker(profile, bool(timing))
+    else:
+        pool = multiprocessing.Pool(jobs, initializer = init_worker, initargs = (profile, bool(timing)))
+    results = []
+    try:
+        if stream:
+            results += parse_all(pool, stream_files, tasks['stream'][0], tasks['stream'][1], chunksize, batch_size, n_process)
+            if incremental:
+                cache.update('part2', dict((file, keys2[file]) for file in part2_files))
+                cache.save()
+            return
+        results += parse_all(pool, part1_files, tasks['part1'][0], tasks['part1'][1], chunksize, batch_size, n_process)
+        if incremental:
+            cache.update('part1', dict((file, keys1[file]) for file in part1_files))
+            cache.save()
+        else:
+            part2_files = sorted(os.listdir(out_dir))
+        results += parallel_map(pool, tasks['part2'][0], part2_files, chunksize)
+        if incremental:
+            cache.update('part2', dict((file, keys2[file]) for file in part2_files))
+            cache.save()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        else:
+            disable_timing()
+        if timing:
+            report = Profiler()
+            for stats in results:
+                report.merge(stats)
+            report.save(timing)
+            print('timing report: {}.txt, {}.json'.format(timing, timing))
+
+def parse_all(pool, files, document_func, batch_func, chunksize, batch_size, n_process):
+    """
+    Calls *document_func* for every file, or *batch_func* for batches of files
+    if *batch_size* > 0, in the *pool* if given. Returns list of their results.
+    """
+    if batch_size > 0 and pool is None:
+        return [batch_func(files, batch_size = batch_size, n_process = n_process)]
+    elif batch_size > 0:
+        batches = [files[i:i+batch_size] for i in range(0, len(files), batch_size)]
+        return pool.map(functools.partial(batch_func, batch_size = batch_size), batches, 1)
+    else:
+        return parallel_map(pool, document_func, files, chunksize)
+
+def parallel_map(pool, func, items, chunksize):
+    """Calls *func* for all *items*, in the *pool* if given; returns list of results."""
+    if pool is None:
+        return [func(item) for item in items]
+    return pool.map(func, items, chunksize)
+
+def check_profile(profile, reference = 'full'):
+    """
+    Compares sentence boundaries of spaCy *profile* with *reference* profile
+    on all cleaned documents from in_dir.
+    Returns list of files where the boundaries differ.
+    """
+    nlp = load_parser(profile)
+    nlp_ref = load_parser(reference)
+    different = []
+    for file in sorted(os.listdir(in_dir)):
+        doc = clean_document(read_document(file))
+        sents = [(span.start, span.end) for span in nlp(doc).sents]
+        sents_ref = [(span.start, span.end) for span in nlp_ref(doc).sents]
+        if sents != sents_ref:
+            different.append(file)
+            print('{}: {} sentences, {} in {}'.format(file, len(sents), len(sents_ref), reference))
+    return different
+
+def spacy_version():
+    """
+    Versions of spaCy and of model *spacy_model* (language, name and version from
+    its meta) which parse documents in PART 1. Only the vocabulary of the model is
+    loaded to read the meta.
+    """
+    import spacy
+    meta = spacy.load(spacy_model, disable = SPACY_PROFILES['sentencizer']).meta
+    return ' '.join([spacy.__version__, meta.get('lang', ''), meta.get('name', ''), meta.get('version', '')])
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description="Preprocessing of raw records from " + in_dir)
+    argparser.add_argument("-j", "--jobs", dest="jobs", type = int, default = 1,
+                           help="number of worker processes (0 - one per CPU core)")
+    argparser.add_argument("--chunksize", dest="chunksize", type = int, default = 8,
+                           help="number of documents handed to a worker at once")
+    argparser.add_argument("-b", "--batch-size", dest="batch_size", type = int, default = 0,
+                           help="parse documents in batches of this size with spaCy pipe (0 - one by one)")
+    argparser.add_argument("--n-process", dest="n_process", type = int, default = 1,
+                           help="number of spaCy processes used by pipe when --jobs is 1")
+    argparser.add_argument("-i", "--incremental", dest="incremental", action="store_true",
+                           help="process only new or changed documents, remove outputs of deleted ones")
+    argparser.add_argument("-s", "--stream", dest="stream", action="store_true",
+                           help="keep documents in memory between PART 1 and PART 2 and write only 02_main, 02_index and 02_labs")
+    argparser.add_argument("--debug-stages", dest="debug", action="store_true",
+                           help="with --stream write also 01_preprocessed, 02_family, 02_allergy and 02_negated")
+    argparser.add_argument("-p", "--spacy-profile", dest="profile", default='full', choices=sorted(SPACY_PROFILES),
+                           help="spaCy components to load: full model, parser only or rule based sentencizer "
+                                "(splits only at punctuation, sentences may differ, see --check-profile)")
+    argparser.add_argument("--check-profile", dest="check_profile", default=None, choices=sorted(SPACY_PROFILES),
+                           help="only compare sentence boundaries of this profile with --spacy-profile on in_dir")
+    argparser.add_argument("--timing", dest="timing", default=None, metavar="REPORT",
+                           help="time rules, lexicon groups, spaCy and documents; write REPORT.txt and REPORT.json")
+    args = argparser.parse_args()
+    if args.check_profile:
+        different = check_profile(args.check_profile, args.profile)
+        print('{} documents with different sentence boundaries'.format(len(different)))
+        sys.exit(1 if different else 0)
+    run(args.jobs, args.chunksize, args.batch_size, args.n_process, args.incremental, args.stream, args.debug,
+        args.profile, args.timing)
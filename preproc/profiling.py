@@ -0,0 +1,128 @@
+import re
+import json
+import time
+
+'''
+Opt-in profiling of preprocessing (preprocessing.py --timing REPORT).
+
+Every rule pass of the rule engines, every re.sub of PART 2, the lexicon
+components and spaCy are timed with the number of calls and characters they
+processed; documents are timed per stage. Worker processes collect their own
+timings and hand them back with every finished task, see Profiler.pop() and
+Profiler.merge(). The report is written as REPORT.txt (hottest rules, groups
+and slowest documents) and REPORT.json (all entries).
+'''
+
+timer = getattr(time, 'perf_counter', time.time)
+
+class Profiler(object):
+    """
+    Timings of rules and documents.
+
+    Rules are kept under (group, name): group is a rule table or component
+    (e.g. 'cleanup', 'supplements.txt', 'markup', 'spacy'), name a rule or pass.
+    """
+    def __init__(self):
+        self.rules = {}      # (group, name): [seconds, calls, chars]
+        self.documents = {}  # name: {stage: seconds}
+
+    def add(self, group, name, seconds, chars = 0):
+        """Adds one call of rule *name* from *group*."""
+        entry = self.rules.setdefault((group, name), [0.0, 0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+        entry[2] += chars
+
+    def timed(self, group, name, chars, func, *args, **kwargs):
+        """Returns func(*args, **kwargs), timed as a call of rule *name* on *chars* characters."""
+        start = timer()
+        result = func(*args, **kwargs)
+        self.add(group, name, timer() - start, chars)
+        return result
+
+    def add_document(self, name, stage, seconds):
+        """Adds time of *stage* ('part1', 'part2', 'stream') of document *name*."""
+        stages = self.documents.setdefault(name, {})
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+    def pop(self):
+        """Returns timings collected so far (a picklable dict) and starts again."""
+        stats = {'rules': [list(key) + value for key, value in self.rules.items()],
+                 'documents': self.documents}
+        self.rules = {}
+        self.documents = {}
+        return stats
+
+    def merge(self, stats):
+        """Adds timings *stats* returned by pop() of another profiler."""
+        for group, name, seconds, calls, chars in stats['rules']:
+            entry = self.rules.setdefault((group, name), [0.0, 0, 0])
+            entry[0] += seconds
+            entry[1] += calls
+            entry[2] += chars
+        for name, stages in stats['documents'].items():
+            for stage, seconds in stages.items():
+                self.add_document(name, stage, seconds)
+
+    def groups(self):
+        """Returns {group: [seconds, calls, chars]} summed over rules of each group."""
+        groups = {}
+        for (group, name), (seconds, calls, chars) in self.rules.items():
+            entry = groups.setdefault(group, [0.0, 0, 0])
+            entry[0] += seconds
+            entry[1] += calls
+            entry[2] += chars
+        return groups
+
+    def report(self, top = 30):
+        """Text report of the *top* hottest rules, all groups and the *top* slowest documents."""
+        lines = ['hottest rules', '{:>10} {:>9} {:>12}  {:<18} {}'.format('seconds', 'calls', 'chars', 'group', 'rule')]
+        rules = sorted(self.rules.items(), key = lambda item: -item[1][0])
+        for (group, name), (seconds, calls, chars) in rules[:top]:
+            lines.append('{:10.3f} {:9d} {:12d}  {:<18} {}'.format(seconds, calls, chars, group, _short(name)))
+        lines += ['', 'groups', '{:>10} {:>9} {:>12}  {}'.format('seconds', 'calls', 'chars', 'group')]
+        for group, (seconds, calls, chars) in sorted(self.groups().items(), key = lambda item: -item[1][0]):
+            lines.append('{:10.3f} {:9d} {:12d}  {}'.format(seconds, calls, chars, group))
+        lines += ['', 'slowest documents', '{:>10}  {:<24} {}'.format('seconds', 'document', 'stages')]
+        documents = sorted(self.documents.items(), key = lambda item: -sum(item[1].values()))
+        for name, stages in documents[:top]:
+            lines.append('{:10.3f}  {:<24} {}'.format(sum(stages.values()), name,
+                         ' '.join('{}={:.3f}'.format(stage, stages[stage]) for stage in sorted(stages))))
+        return '\n'.join(lines) + '\n'
+
+    def save(self, path, top = 30):
+        """Writes report() to *path*.txt and all timings to *path*.json."""
+        with open(path + '.txt', 'w') as f:
+            f.write(self.report(top))
+        rules = [{'group': group, 'rule': name, 'seconds': seconds, 'calls': calls, 'chars': chars}
+                 for (group, name), (seconds, calls, chars) in self.rules.items()]
+        rules.sort(key = lambda rule: -rule['seconds'])
+        documents = [{'document': name, 'seconds': sum(stages.values()), 'stages': stages}
+                     for name, stages in self.documents.items()]
+        documents.sort(key = lambda document: -document['seconds'])
+        with open(path + '.json', 'w') as f:
+            json.dump({'rules': rules, 'documents': documents}, f, indent = 1, sort_keys = True)
+
+class TimedRe(object):
+    """
+    Stands in for the re module in PART 2: sub() and findall() are timed
+    under their pattern, everything else is taken from re.
+    """
+    def __init__(self, profiler, group = 'markup'):
+        self.profiler = profiler
+        self.group = group
+
+    def sub(self, pattern, repl, string, count = 0, flags = 0):
+        return self.profiler.timed(self.group, pattern, len(string), re.sub, pattern, repl, string,
+                                   count = count, flags = flags)
+
+    def findall(self, pattern, string, flags = 0):
+        return self.profiler.timed(self.group, pattern, len(string), re.findall, pattern, string, flags = flags)
+
+    def __getattr__(self, name):
+        return getattr(re, name)
+
+def _short(name, width = 80):
+    """Rule *name* on one line of at most *width* characters."""
+    name = name.replace('\n', '\\n')
+    return name if len(name) <= width else name[:width - 3] + '...'
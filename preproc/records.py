@@ -0,0 +1,110 @@
+import re
+import json
+from datetime import datetime
+
+'''
+Records of PART 2 output and their time windows.
+
+Every record of a document starts with 'this is record date YYYYMMDD'. Records
+of the last 6, 3 and 2 months are marked in the text with ' record within N
+months'; instead of copies of the text from these markers on, 02_index keeps
+for every document a json index into its 02_main text:
+
+  records - [start, end, date] of every record, the offsets of the match of
+            'this is record date[ \\n:].' (as read by clitri) and the first
+            8 digits within 40 characters from its start ('' if none)
+  windows - {"6": offset, "3": offset, "2": offset}, start of the text of the
+            last N months (where the 02_months_* copies started)
+'''
+
+RECORD = re.compile(' this is record date [0-9]{8} \\. ')
+RECORD_START = re.compile('this is record date[ \n:].')
+RECORD_DATE = re.compile('[0-9]{8}')
+
+# --- months of a window and the longest time (days) from the last record in it
+WINDOWS = [(6, 183), (3, 92), (2, 61)]
+
+def window_markers(days):
+    """Markers inserted before a record *days* before the last one."""
+    return [' record within {} months . \n'.format(months) for months, limit in WINDOWS if days <= limit]
+
+def mark_windows(doc):
+    """
+    Inserts ' record within N months' markers before the records of *doc*.
+
+    Markers were inserted with doc.replace(record, marker + record), so every copy
+    of a record date gets the markers of all records with that date. The same is
+    done in one pass when the copies are exactly the records found, otherwise the
+    replacements are repeated.
+    """
+    matches = list(RECORD.finditer(doc))
+    steps = []
+    days = 0
+    previous = datetime(2000,1,1)
+    for m in reversed(matches):
+        item = m.group()
+        current = datetime(int(item[21:25]), int(item[25:27]), int(item[27:29]))
+        difference = (previous - current).days
+        if (difference > 0): days = days + difference
+        steps.append((item, window_markers(days)))
+        previous = current
+    prefixes = {}
+    for item, markers in steps:
+        if markers:
+            prefixes[item] = prefixes.get(item, '') + ''.join(markers)
+    if not prefixes:
+        return doc
+    positions = _replaced_positions(doc, matches, prefixes)
+    if positions is None:
+        for item, markers in steps:
+            for marker in markers:
+                doc = doc.replace(item, marker + item)
+        return doc
+    parts = []
+    last = 0
+    for start, item in positions:
+        parts.append(doc[last:start])
+        parts.append(prefixes[item])
+        last = start
+    parts.append(doc[last:])
+    return ''.join(parts)
+
+def _replaced_positions(doc, matches, prefixes):
+    """
+    Sorted (start, item) of all copies of items from *prefixes* which doc.replace
+    finds, None if they are not exactly the *matches* or overlap each other.
+    """
+    positions = []
+    for item in prefixes:
+        found = []
+        i = doc.find(item)
+        while i >= 0:
+            found.append(i)
+            i = doc.find(item, i + len(item))
+        if found != [m.start() for m in matches if m.group() == item]:
+            return None
+        positions.extend((start, item) for start in found)
+    positions.sort()
+    for (start, item), (nxt, other) in zip(positions, positions[1:]):
+        if start + len(item) > nxt:
+            return None
+    return positions
+
+def record_index(doc):
+    """Returns the index (see module description) of 02_main text *doc*."""
+    records = []
+    for m in RECORD_START.finditer(doc):
+        dates = RECORD_DATE.findall(doc[m.start():m.start()+40].replace('\n', ' '))
+        records.append([m.start(), m.end(), dates[0] if dates else ''])
+    windows = {}
+    start = 0
+    for months, limit in WINDOWS:
+        cut = doc.find(' record within {} months'.format(months), start)
+        if (cut >= 0): start = cut
+        windows[str(months)] = start
+    return {'records': records, 'windows': windows}
+
+def write_index(path, index):
+    """Writes record *index* to *path* as json."""
+    with open(path, 'w') as f:
+        json.dump(index, f, sort_keys = True)
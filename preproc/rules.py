@@ -0,0 +1,489 @@
+import re
+try:
+    import sre_parse
+    import sre_constants
+except ImportError:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+
+'''
+Rule engine for the preprocessing cascades.
+
+A rule table is a list of Rule objects which are applied one after another,
+exactly like a sequence of doc.replace / re.sub calls. All patterns are compiled
+once and consecutive rules which cannot interact are merged into one pass over
+the document (a single alternation regex).
+
+A regex rule is skipped without scanning the document when a literal part of
+its pattern (Rule.required) does not occur in it.
+
+Two rules (earlier *a*, later *b*) are merged only if the result can not depend
+on their order:
+  - literal rules: *b* can not overlap *a*'s pattern or *a*'s replacement and
+    *a* does not delete text (so no new *b* match can be glued together),
+  - regex rules: no character can be matched by both patterns, *b* can not match
+    any character of *a*'s replacement, *a* does not delete text and neither
+    pattern uses anchors, lookarounds, backreferences or can match empty text.
+
+Lexicon tables (LexiconEngine) repeat the same rule templates for every key of
+a lexicon. The keys present in a document are found with one scan and only
+their rules are applied, so the cost of a document does not grow with the
+number of keys.
+'''
+
+# marker for non-ASCII characters in character sets
+NONASCII = None
+ASCII = frozenset(chr(x) for x in range(128))
+ANYCHAR = ASCII | frozenset([NONASCII])
+
+# named groups of a merged regex pass (Python 2 supports at most 100)
+MAX_PASS_RULES = 99
+
+CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: frozenset('0123456789') | frozenset([NONASCII]),
+    sre_constants.CATEGORY_SPACE: frozenset(' \t\n\r\f\v') | frozenset([NONASCII]),
+    sre_constants.CATEGORY_WORD: frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_') | frozenset([NONASCII]),
+}
+
+class Rule(object):
+    """
+    Single replacement rule.
+
+    Args:
+      pattern (str) - literal text or regular expression
+      replacement (str) - replacement (may use group references for regex rules)
+      flags (int) - re flags of regex rules
+      literal (bool) - True for plain string replacement (doc.replace)
+      name (str) - name of the rule used in reports, default: pattern
+    """
+    def __init__(self, pattern, replacement, flags = 0, literal = False, name = None):
+        self.pattern = pattern
+        self.replacement = replacement
+        self.flags = flags
+        self.name = name or pattern
+        self.regex = re.compile(re.escape(pattern) if literal else pattern, flags)
+        self.static = literal or '\\' not in replacement
+        self.literal = literal
+        self.required = ()
+        if not literal:
+            text = self._literal_text()
+            if text is not None:
+                # regex without special characters, e.g. 'take:' or '(dementia)',
+                # every match is the same text
+                self.pattern = text
+                self.replacement = self.regex.match(text).expand(replacement)
+                self.literal = self.static = True
+            elif not self.regex.flags & re.IGNORECASE:
+                self.required = _required_literals(sre_parse.parse(pattern, flags))
+        self.charset = self._charset()
+
+    def _literal_text(self):
+        """The only text the pattern can match, None if there are more."""
+        if self.flags or self.regex.flags & re.IGNORECASE:
+            return None
+        ops = _sequence(sre_parse.parse(self.pattern, self.flags))
+        if not ops or not all(op == sre_constants.LITERAL and av < 128 for op, av in ops):
+            return None
+        return ''.join(chr(av) for op, av in ops)
+
+    def _charset(self):
+        """
+        Set of characters that can be a part of a match, None if the
+        pattern can not be analysed (anchors, lookarounds etc.).
+        """
+        if self.literal:
+            return _literal_chars(self.pattern)
+        parsed = sre_parse.parse(self.pattern, self.flags)
+        if parsed.getwidth()[0] == 0:
+            return None
+        chars = _pattern_chars(parsed)
+        if chars is not None and self.flags & re.IGNORECASE:
+            chars = chars | frozenset(c.swapcase() for c in chars if c is not NONASCII)
+            if chars & frozenset('kKsS'):
+                # unicode case folding: KELVIN SIGN, LONG S
+                chars = chars | frozenset([NONASCII])
+        return chars
+
+    def replacement_chars(self):
+        """Set of characters that the replacement can put into a document."""
+        chars = _literal_chars(self.replacement)
+        if not self.static:
+            chars = chars | (self.charset or ANYCHAR)
+        return chars
+
+    def matches_possible(self, doc):
+        """False if the rule can not match *doc* as some required text is missing."""
+        for text in self.required:
+            if text not in doc:
+                return False
+        return True
+
+    def apply(self, doc):
+        """Applies the rule to *doc*."""
+        if self.literal:
+            return doc.replace(self.pattern, self.replacement)
+        if not self.matches_possible(doc):
+            return doc
+        return self.regex.sub(self.replacement, doc)
+
+    def __repr__(self):
+        return "Rule(%r, %r)" % (self.pattern, self.replacement)
+
+def literal(pattern, replacement, name = None):
+    """Rule equivalent to doc.replace(pattern, replacement)."""
+    return Rule(pattern, replacement, literal = True, name = name)
+
+def regex(pattern, replacement, flags = 0, name = None):
+    """Rule equivalent to re.sub(pattern, replacement, doc, flags=flags)."""
+    return Rule(pattern, replacement, flags, name = name)
+
+def _literal_chars(text):
+    chars = set()
+    for c in text:
+        chars.add(c if c in ASCII else NONASCII)
+    return frozenset(chars)
+
+def _sequence(parsed):
+    """Top level items of *parsed* with the content of plain groups spliced in."""
+    ops = []
+    for op, av in parsed:
+        if op == sre_constants.SUBPATTERN and not (len(av) == 4 and (av[1] or av[2])):
+            ops.extend(_sequence(av[-1]))
+        else:
+            ops.append((op, av))
+    return ops
+
+def _required_literals(parsed):
+    """Runs of literal characters which are a part of every match of *parsed*."""
+    runs = []
+    run = ''
+    for op, av in _sequence(parsed) + [(None, None)]:
+        if op == sre_constants.LITERAL and av < 128:
+            run += chr(av)
+        elif run:
+            runs.append(run)
+            run = ''
+    return tuple(runs)
+
+def _pattern_chars(parsed):
+    chars = set()
+    for op, av in parsed:
+        if op == sre_constants.LITERAL:
+            chars |= _literal_chars(chr(av) if av < 128 else u'\x80')
+        elif op in (sre_constants.NOT_LITERAL, sre_constants.ANY):
+            return ANYCHAR
+        elif op == sre_constants.IN:
+            for iop, iav in av:
+                if iop == sre_constants.LITERAL:
+                    chars |= _literal_chars(chr(iav) if iav < 128 else u'\x80')
+                elif iop == sre_constants.RANGE:
+                    lo, hi = iav
+                    chars |= frozenset(chr(x) for x in range(lo, min(hi, 127) + 1))
+                    if hi > 127:
+                        chars.add(NONASCII)
+                elif iop == sre_constants.CATEGORY and iav in CATEGORIES:
+                    chars |= CATEGORIES[iav]
+                else:
+                    return ANYCHAR
+        elif op == sre_constants.BRANCH:
+            for branch in av[1]:
+                sub = _pattern_chars(branch)
+                if sub is None:
+                    return None
+                chars |= sub
+        elif op == sre_constants.SUBPATTERN:
+            sub = _pattern_chars(av[-1])
+            if sub is None:
+                return None
+            chars |= sub
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            sub = _pattern_chars(av[2])
+            if sub is None:
+                return None
+            chars |= sub
+        else:
+            # anchors, lookarounds, backreferences
+            return None
+    return frozenset(chars)
+
+def _literals_overlap(a, b):
+    """True if literal strings *a* and *b* can share a position in a text."""
+    for k in range(1 - len(b), len(a)):
+        lo, hi = max(0, k), min(len(a), k + len(b))
+        if a[lo:hi] == b[lo-k:hi-k]:
+            return True
+    return False
+
+def independent(first, second):
+    """
+    True if applying rule *first* and then *second* gives the same result
+    as applying both of them in a single pass.
+    """
+    if not first.replacement:
+        return False
+    if first.literal and second.literal:
+        return not (_literals_overlap(first.pattern, second.pattern)
+                    or _literals_overlap(first.replacement, second.pattern))
+    if first.flags != second.flags or first.charset is None or second.charset is None:
+        return False
+    return not (first.charset & second.charset or first.replacement_chars() & second.charset)
+
+def _fits(group, rule):
+    """True if *rule* can be added to a merged pass of *group*."""
+    return rule.literal and all(r.literal for r in group) or len(group) < MAX_PASS_RULES
+
+class RulePass(object):
+    """
+    One pass over a document applying a group of mutually independent rules.
+    """
+    def __init__(self, rules):
+        self.rules = rules
+        self.literals = None
+        if len(rules) == 1:
+            self.regex = None
+        elif all(rule.literal for rule in rules):
+            # patterns can not overlap, so the matched text identifies the rule
+            self.literals = dict((rule.pattern, rule.replacement) for rule in rules)
+            self.regex = re.compile('|'.join(re.escape(rule.pattern) for rule in rules))
+        else:
+            self.regex = re.compile('|'.join('(?P<r%d>%s)' % (i, rule.regex.pattern)
+                                             for i, rule in enumerate(rules)), rules[0].flags)
+
+    def _replace_literal(self, match):
+        return self.literals[match.group()]
+
+    def _replace(self, match):
+        rule = self.rules[int(match.lastgroup[1:])]
+        if rule.static:
+            return rule.replacement
+        return rule.regex.match(match.string, match.start()).expand(rule.replacement)
+
+    def apply(self, doc):
+        """Applies the pass to *doc*."""
+        if self.regex is None:
+            return self.rules[0].apply(doc)
+        if self.literals is not None:
+            return self.regex.sub(self._replace_literal, doc)
+        if not any(rule.matches_possible(doc) for rule in self.rules):
+            return doc
+        return self.regex.sub(self._replace, doc)
+
+    @property
+    def name(self):
+        return ' | '.join(rule.name for rule in self.rules)
+
+class RuleEngine(object):
+    """
+    Compiled rule table.
+
+    Args:
+      rules (list <Rule>) - rules in the order they should be applied
+      merge (bool) - if False every rule is a separate pass
+      name (str) - name of the table in profiling reports
+    """
+    def __init__(self, rules, merge = True, name = 'rules'):
+        self.rules = list(rules)
+        self.name = name
+        # profiling.Profiler which times every pass, None when not profiling
+        self.profiler = None
+        groups = []
+        for rule in self.rules:
+            if merge and groups and _fits(groups[-1], rule) and all(independent(r, rule) for r in groups[-1]):
+                groups[-1].append(rule)
+            else:
+                groups.append([rule])
+        self.passes = [RulePass(group) for group in groups]
+
+    def apply(self, doc):
+        """Applies all rules to *doc*."""
+        if self.profiler is not None:
+            for rpass in self.passes:
+                doc = self.profiler.timed(self.name, rpass.name, len(doc), rpass.apply, doc)
+            return doc
+        for rpass in self.passes:
+            doc = rpass.apply(doc)
+        return doc
+
+    @property
+    def eliminated(self):
+        """Number of passes over a document saved by merging rules."""
+        return len(self.rules) - len(self.passes)
+
+    def report(self):
+        return '{} rules in {} passes ({} eliminated)'.format(len(self.rules), len(self.passes), self.eliminated)
+
+class KeyScanner(object):
+    """
+    Finds which of the literal *keys* occur in a text with one regex scan.
+
+    The keys are compiled into a trie shaped regex which is tried at every
+    position of the text and matches the longest key starting there; all keys
+    which are prefixes of that key start there as well. Empty keys are never found.
+    """
+    def __init__(self, keys):
+        self.index = {}
+        for k, key in enumerate(keys):
+            if key:
+                self.index.setdefault(key, []).append(k)
+        self.prefixes = dict((key, [key[:i] for i in range(1, len(key) + 1) if key[:i] in self.index])
+                             for key in self.index)
+        self.regex = re.compile(_trie_pattern(self.index)) if self.index else None
+
+    def find(self, text):
+        """Set of indices of the keys which occur in *text*."""
+        found = set()
+        if self.regex is None:
+            return found
+        keys = set()
+        # the search skips positions where no key can start by the first characters of the keys
+        match = self.regex.search(text)
+        while match:
+            keys.add(match.group())
+            match = self.regex.search(text, match.start() + 1)
+        for key in keys:
+            for prefix in self.prefixes[key]:
+                found.update(self.index[prefix])
+        return found
+
+def _trie_pattern(keys):
+    """Regex matching the longest of *keys* (non-empty literals) at a position."""
+    trie = {}
+    for key in keys:
+        node = trie
+        for c in key:
+            node = node.setdefault(c, {})
+        node[''] = {}
+    return _node_pattern(trie)
+
+def _node_pattern(node):
+    branches = [re.escape(c) + _node_pattern(node[c]) for c in sorted(node) if c]
+    if not branches:
+        return ''
+    pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    if '' in node:
+        # greedy: the longer keys are tried first
+        pattern = '(?:' + pattern + ')?'
+    return pattern
+
+def _contains(rule, text):
+    """True if every match of *rule* contains literal *text*."""
+    if rule.literal:
+        return text in rule.pattern
+    return any(text in run for run in rule.required)
+
+def _created_keys(rule, keys):
+    """
+    Indices of *keys* which *rule* can create in a text, None if it can create any.
+
+    A replacement made of literal text and references to top level groups which
+    keep the matched text in its order (adjacent groups stay adjacent, the first
+    and the last group touch the text around the match) can only create keys
+    overlapping its literal text.
+    """
+    if rule.static:
+        literals = [rule.replacement] if rule.replacement else []
+        pieces = literals
+        items = []
+    else:
+        parts = re.split(r'\\(\d+)', rule.replacement)
+        literals = [part for part in parts[::2] if part]
+        if any('\\' in part for part in literals):
+            return None
+        # group numbers of the top level items of the pattern
+        items = [av[0] if op == sre_constants.SUBPATTERN else None
+                 for op, av in sre_parse.parse(rule.pattern, rule.flags)]
+        pieces = []
+        for i, part in enumerate(parts):
+            if i % 2 and int(part) not in items:
+                return None
+            if i % 2:
+                pieces.append(items.index(int(part)))
+            elif part:
+                pieces.append(part)
+    if not pieces:
+        return None
+    # the text before the match is item -1, the text after it item len(items)
+    bounds = [-1] + pieces + [len(items)]
+    for a, b in zip(bounds, bounds[1:]):
+        if isinstance(a, int) and isinstance(b, int) and b != a + 1:
+            return None
+    return set(k for k, key in enumerate(keys) if key and any(_literals_overlap(text, key) for text in literals))
+
+class LexiconEngine(RuleEngine):
+    """
+    Rule table made of the same *templates* for every key of a lexicon, with the
+    same result as applying all rules in the order of the keys.
+
+    The keys present in a document are found with one KeyScanner scan and only
+    their rules are applied. When the rules of a key change the document, the
+    later keys their replacements can create (see _created_keys) are looked up
+    again, or all later keys if the replacements can create any text. Rules of a
+    key are applied to every document if one of them does not contain the key
+    as literal text (e.g. a key with regex syntax).
+
+    Args:
+      keys (list <str>) - keys of the lexicon in the order their rules are applied
+      templates (function) - key -> list of Rule
+      merge (bool) - if False every rule of a key is a separate pass
+      name (str) - name of the table in profiling reports
+    """
+    def __init__(self, keys, templates, merge = True, name = 'rules'):
+        self.keys = list(keys)
+        self.name = name
+        self.engines = [RuleEngine(templates(key), merge, name) for key in self.keys]
+        self.rules = [rule for engine in self.engines for rule in engine.rules]
+        self.passes = [rpass for engine in self.engines for rpass in engine.passes]
+        self.always = set(k for k, key in enumerate(self.keys)
+                          if not key or not all(_contains(rule, key) for rule in self.engines[k].rules))
+        self.scanner = KeyScanner([key if k not in self.always else '' for k, key in enumerate(self.keys)])
+        # later keys which the rules of each key can create, None for any
+        self.created = []
+        for k, engine in enumerate(self.engines):
+            created = set()
+            for rule in engine.rules:
+                keys = _created_keys(rule, self.keys)
+                if keys is None:
+                    created = None
+                    break
+                created |= keys
+            self.created.append(None if created is None else sorted(j for j in created if j > k))
+        self.profiler = None
+
+    @property
+    def profiler(self):
+        return self._profiler
+
+    @profiler.setter
+    def profiler(self, profiler):
+        self._profiler = profiler
+        for engine in self.engines:
+            engine.profiler = profiler
+
+    def present_keys(self, doc, after = -1):
+        """Indices of keys bigger than *after* whose rules can match *doc*."""
+        if self.profiler is not None:
+            found = self.profiler.timed(self.name, 'key scan', len(doc), self.scanner.find, doc)
+        else:
+            found = self.scanner.find(doc)
+        return set(k for k in found | self.always if k > after)
+
+    def apply(self, doc):
+        """Applies the rules of the keys present in *doc*."""
+        todo = sorted(self.present_keys(doc), reverse = True)
+        while todo:
+            k = todo.pop()
+            new = self.engines[k].apply(doc)
+            if new == doc:
+                continue
+            doc = new
+            if self.created[k] is None:
+                todo = sorted(self.present_keys(doc, k), reverse = True)
+            else:
+                found = [j for j in self.created[k] if j not in todo and self.keys[j] in doc]
+                if found:
+                    todo = sorted(todo + found, reverse = True)
+        return doc
+
+    def report(self):
+        return '{} rules of {} keys in {} passes ({} eliminated), applied only for keys found by one scan'.format(
+            len(self.rules), len(self.keys), len(self.passes), self.eliminated)
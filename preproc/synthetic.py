@@ -0,0 +1,171 @@
+import os
+import csv
+import random
+import argparse
+from datetime import datetime, timedelta
+
+'''
+Synthetic corpus in the PatientMatching format (n2c2 2018 track 1) for
+throughput and memory tests without access to real records.
+
+Every patient is a file <id>.xml with its records in <TEXT> (CDATA, each record
+starting with 'Record date: YYYY-MM-DD') and criteria in <TAGS>, so the files
+can be used as 00_input of preprocessing.py and as annotations of clitri
+(train/). Sentences are made from templates filled with keys of the lexicons in
+lexicon/ (medications, supplements, diseases, negations, family history, lab
+values). The output depends only on the options and the seed (for one Python
+version, as the random module differs between Python 2 and 3).
+
+    python synthetic.py --patients 10000 --records 2 6 --spacing 7 120 --length 100 400 --out 00_input
+'''
+
+lexicon_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lexicon', '')
+
+TAGS = ['ABDOMINAL', 'ADVANCED-CAD', 'ALCOHOL-ABUSE', 'ASP-FOR-MI', 'CREATININE', 'DIETSUPP-2MOS', 'DRUG-ABUSE',
+        'ENGLISH', 'HBA1C', 'KETO-1YR', 'MAJOR-DIABETES', 'MAKES-DECISIONS', 'MI-6MOS']
+
+RECORD_SEPARATOR = '\n\n' + '*' * 100 + '\n\n'
+
+NEGATIONS = ['Denies', 'No', 'Negative for', 'No evidence of', 'Rule out', 'Without', 'Patient does not have']
+RELATIVES = ['Mother', 'Father', 'Sister', 'Brother', 'Grandmother', 'Uncle']
+SUBJECTS = ['Patient', 'She', 'He', 'The patient', 'Pt']
+FILLER = ['reports', 'stable', 'today', 'follow up', 'continues', 'well', 'with', 'and', 'the', 'in', 'clinic',
+          'improved', 'since', 'last', 'visit', 'plan', 'discussed', 'exam', 'normal', 'history', 'of']
+FREQUENCIES = ['po qd', 'po bid', 'daily', 'twice a day', 'q am', 'prn', 'tid']
+
+def lexicon_keys(name):
+    """Keys (first column) of lexicon *name*."""
+    return [row[0] for row in csv.reader(open(lexicon_dir + name)) if row]
+
+class Vocabulary(object):
+    """Words of the sentence templates, read from the lexicons."""
+    def __init__(self):
+        self.medications = [key for key in lexicon_keys('hrtmed.txt') if key.islower()]
+        self.supplements = lexicon_keys('supplements.txt')
+        self.conditions = lexicon_keys('deficiency.txt') + lexicon_keys('mental.txt') + lexicon_keys('kidmed.txt')
+        self.drugs = lexicon_keys('illicit.txt')
+        self.languages = lexicon_keys('language.txt')
+        self.procedures = lexicon_keys('surgery.txt')
+        self.abbreviations = [key for key in lexicon_keys('abbrev.txt') if key.isalpha()]
+
+class PatientGenerator(object):
+    """
+    Generates patients of a synthetic corpus.
+
+    Args:
+      seed (int) - seed of the corpus, patient *i* depends only on it and *i*
+      records (tuple <int>) - min and max number of records of a patient
+      spacing (tuple <int>) - min and max days between records
+      length (tuple <int>) - min and max number of words of a record
+      met_rate (float) - probability of 'met' for criteria not decided by lab values
+      start (datetime) - earliest first record date
+    """
+    def __init__(self, seed = 0, records = (1, 5), spacing = (14, 180), length = (100, 400), met_rate = 0.3,
+                 start = datetime(2060, 1, 1)):
+        self.seed = seed
+        self.records = records
+        self.spacing = spacing
+        self.length = length
+        self.met_rate = met_rate
+        self.start = start
+        self.vocabulary = Vocabulary()
+
+    def sentence(self, rng, labs):
+        """Random sentence; lab values are appended to *labs* (dict analyte: list)."""
+        v = self.vocabulary
+        kind = rng.randint(0, 9)
+        if kind == 0:
+            value = round(rng.uniform(0.5, 3.0), 1)
+            labs.setdefault('creatinine', []).append(value)
+            return 'Creatinine {:.1f} mg/dl.'.format(value)
+        if kind == 1:
+            value = round(rng.uniform(5.0, 11.0), 1)
+            labs.setdefault('hba1c', []).append(value)
+            return 'HbA1c {:.1f} %.'.format(value)
+        if kind == 2:
+            return '{} {} mg {}.'.format(rng.choice(v.medications), rng.choice([25, 50, 81, 100, 500]),
+                                         rng.choice(FREQUENCIES))
+        if kind == 3:
+            return '{} {} {}.'.format(rng.choice(SUBJECTS), rng.choice(['takes', 'continues', 'started']),
+                                      rng.choice(v.supplements))
+        if kind == 4:
+            return '{} {}.'.format(rng.choice(NEGATIONS), rng.choice(v.conditions + v.drugs))
+        if kind == 5:
+            return 'Family history: {} with {}.'.format(rng.choice(RELATIVES), rng.choice(v.conditions))
+        if kind == 6:
+            return 'Status post {} {} in {}.'.format(rng.choice(['abdominal', 'bowel', 'hernia']),
+                                                     rng.choice(v.procedures), rng.randint(1990, 2059))
+        if kind == 7:
+            return '{} speaks {}.'.format(rng.choice(SUBJECTS), rng.choice(v.languages + ['english'] * 5))
+        words = [rng.choice(FILLER + v.abbreviations) for i in range(rng.randint(4, 14))]
+        return ' '.join(words).capitalize() + '.'
+
+    def record(self, rng, date, labs):
+        """Text of a record written on *date* (datetime)."""
+        words = rng.randint(*self.length)
+        lines = ['Record date: {}'.format(date.strftime('%Y-%m-%d')), '']
+        count = 0
+        while count < words:
+            sentence = self.sentence(rng, labs)
+            count += len(sentence.split())
+            lines.append(sentence)
+        return '\n'.join(lines) + '\n'
+
+    def tags(self, rng, labs):
+        """Criteria of a patient; CREATININE and HBA1C follow the lab values."""
+        met = dict((tag, rng.random() < self.met_rate) for tag in TAGS)
+        met['CREATININE'] = any(x > 1.5 for x in labs.get('creatinine', []))
+        met['HBA1C'] = any(6.5 <= x <= 9.5 for x in labs.get('hba1c', []))
+        return met
+
+    def patient(self, i):
+        """Returns content of the xml file of patient *i*."""
+        rng = random.Random(self.seed * 1000003 + i)
+        date = self.start + timedelta(days = rng.randint(0, 3650))
+        labs = {}
+        records = []
+        for r in range(rng.randint(*self.records)):
+            if r:
+                date += timedelta(days = rng.randint(*self.spacing))
+            records.append(self.record(rng, date, labs))
+        met = self.tags(rng, labs)
+        lines = ['<?xml version="1.0" encoding="UTF-8" ?>', '<PatientMatching>',
+                 '<TEXT><![CDATA[', '', RECORD_SEPARATOR.join(records) + ']]></TEXT>', '<TAGS>']
+        lines += ['<{} met="{}" />'.format(tag, 'met' if met[tag] else 'not met') for tag in TAGS]
+        lines += ['</TAGS>', '</PatientMatching>', '']
+        return '\n'.join(lines)
+
+def generate(out, patients, first = 100, **options):
+    """
+    Writes *patients* files <id>.xml (ids from *first*) to folder *out*;
+    *options* are arguments of PatientGenerator. Returns number of bytes written.
+    """
+    if not os.path.isdir(out):
+        os.makedirs(out)
+    generator = PatientGenerator(**options)
+    size = 0
+    for i in range(patients):
+        content = generator.patient(i)
+        with open(os.path.join(out, '{}.xml'.format(first + i)), 'w') as f:
+            f.write(content)
+        size += len(content)
+    return size
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description="Writes a synthetic PatientMatching corpus")
+    argparser.add_argument("-n", "--patients", dest="patients", type = int, default = 100, help="number of patients")
+    argparser.add_argument("-o", "--out", dest="out", default = './00_input/', help="output folder")
+    argparser.add_argument("--first", dest="first", type = int, default = 100, help="id of the first patient")
+    argparser.add_argument("--seed", dest="seed", type = int, default = 0, help="seed of the corpus")
+    argparser.add_argument("--records", dest="records", type = int, nargs = 2, default = [1, 5], metavar = ('MIN', 'MAX'),
+                           help="number of records of a patient")
+    argparser.add_argument("--spacing", dest="spacing", type = int, nargs = 2, default = [14, 180], metavar = ('MIN', 'MAX'),
+                           help="days between records")
+    argparser.add_argument("--length", dest="length", type = int, nargs = 2, default = [100, 400], metavar = ('MIN', 'MAX'),
+                           help="words of a record")
+    argparser.add_argument("--met-rate", dest="met_rate", type = float, default = 0.3,
+                           help="probability of 'met' for criteria other than CREATININE and HBA1C")
+    args = argparser.parse_args()
+    size = generate(args.out, args.patients, args.first, seed = args.seed, records = tuple(args.records),
+                    spacing = tuple(args.spacing), length = tuple(args.length), met_rate = args.met_rate)
+    print('{} patients, {:.1f} MB written to {}'.format(args.patients, size / 1e6, args.out))
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# preproc/ and clitri/ are run as scripts from their folders and import their modules by name,
+# the evaluation scripts are in the root folder
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'preproc'), os.path.join(ROOT, 'clitri'), ROOT]
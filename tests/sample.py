@@ -0,0 +1,105 @@
+import os
+import re
+
+import labs as labs_module
+import records
+import synthetic
+import preprocessing
+
+'''
+Sample data of the regression tests: patients of the synthetic corpus
+(preproc/synthetic.py) and an approximation of their PART 1 output, made
+without spaCy: the cleanup rules, punctuation split off and one sentence
+per line, lowercased. Parser stands in for spaCy in runs of the pipeline.
+'''
+
+def patients(n = 40, seed = 7, **options):
+    """Contents of the xml files of *n* synthetic patients."""
+    settings = dict(records = (1, 6), spacing = (7, 200), length = (10, 40))
+    settings.update(options)
+    generator = synthetic.PatientGenerator(seed = seed, **settings)
+    return [generator.patient(i) for i in range(n)]
+
+def part1_text(raw_xml):
+    """PART 1 like text of *raw_xml*: sentences of lowercased tokens, one per line."""
+    text = preprocessing.CLEANUP.apply(raw_xml)
+    text = re.sub(r'([,:;()=]|\.(?!\d))', r' \1 ', text).lower()
+    # lines are ' tok1 tok2 ... \n' as written by the normalizer
+    return ''.join(' ' + ' '.join(sentence.split()) + ' . \n' for sentence in text.split(' . ') if sentence.strip())
+
+def part1_documents(n = 40, seed = 7, **options):
+    """part1_text of *n* synthetic patients."""
+    return [part1_text(raw_xml) for raw_xml in patients(n, seed, **options)]
+
+def write_corpus(root, paths, n = 20, seed = 7):
+    """
+    Writes *n* synthetic patients below folder *root* as clitri reads them:
+    annotations and 02_main, 02_index and 02_labs files at the 'annotations',
+    'preprocessed', 'index' and 'labs' templates of *paths* (CONFIG_PATH).
+    Returns the patient names.
+    """
+    names = []
+    for i, raw_xml in enumerate(patients(n, seed)):
+        name = str(100 + i)
+        labs = []
+        text = preprocessing.markup_text(part1_text(raw_xml), None, labs)
+        for key, write in [('annotations', lambda path: _write(path, raw_xml)),
+                           ('preprocessed', lambda path: _write(path, text)),
+                           ('index', lambda path: records.write_index(path, records.record_index(text))),
+                           ('labs', lambda path: labs_module.write_labs(path, labs))]:
+            path = os.path.join(root, paths[key].format(name))
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            write(path)
+        names.append(name)
+    return names
+
+def _write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+# --- stand-in for the spaCy parser: whitespace separated tokens, a sentence ends with a '.' token
+class Token(object):
+    def __init__(self, text, idx, whitespace):
+        self.text = text
+        self.idx = idx
+        self.whitespace_ = whitespace
+        self.lower_ = text.lower()
+        self.string = text + whitespace
+
+class Span(object):
+    def __init__(self, doc, start, end):
+        self.doc = doc
+        self.start = start
+        self.end = end
+
+    def __iter__(self):
+        return iter(self.doc.tokens[self.start:self.end])
+
+class Doc(object):
+    def __init__(self, text):
+        self.text = text
+        self.tokens = [Token(m.group(), m.start(), text[m.end():m.end()+1].replace('\n', ' '))
+                       for m in re.finditer('\S+', text)]
+
+    def __getitem__(self, i):
+        return self.tokens[i]
+
+    @property
+    def sents(self):
+        start = 0
+        for i, token in enumerate(self.tokens):
+            if token.text == '.' or i == len(self.tokens) - 1:
+                yield Span(self, start, i + 1)
+                start = i + 1
+
+class Parser(object):
+    def __call__(self, text):
+        return Doc(text)
+
+    def tokenizer(self, text):
+        return Doc(text).tokens
+
+    def pipe(self, texts, batch_size = 32, n_process = 1):
+        for text in texts:
+            yield Doc(text)
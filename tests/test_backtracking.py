@@ -0,0 +1,32 @@
+import re
+
+import backtracking
+import preprocessing
+
+def test_linear_rule_not_flagged():
+    result = backtracking.analyze('test', 'creatinine\\s*:\\s*', 0, [2000, 4000, 8000], timeout = 5.0)
+    assert not result['over_budget'] and not backtracking.is_flagged(result, 1.5)
+
+def test_quadratic_rule_flagged():
+    # every start position scans the rest of the line
+    result = backtracking.analyze('test', '[^\\n]*x', 0, [1000, 2000, 4000, 8000], timeout = 5.0)
+    assert result['exponent'] > 1.5 and backtracking.is_flagged(result, 1.5)
+
+def test_timeout_flags_rule():
+    regex = re.compile('(a|aa)+b')
+    times, timed_out = backtracking.measure_series(regex, ['a' * 10, 'a' * 60], budget = 100.0, timeout = 0.5)
+    assert timed_out and times[-1] == 0.5 and len(times) == 2
+    result = backtracking.analyze('test', '(a|aa)+b', 0, [10, 60], budget = 100.0, timeout = 0.5)
+    assert result['timed_out'] and result['over_budget'] and backtracking.is_flagged(result, 1.5)
+    assert result['pump'] == 'a' and result['sizes'] == [10, 60]
+
+def test_budget_stops_series():
+    times, timed_out = backtracking.measure_series(re.compile('(a|aa)+b'), ['a' * n for n in [10, 28, 60]],
+                                                   budget = 0.01, timeout = 5.0)
+    assert not timed_out and len(times) == 2 and times[-1] > 0.01
+
+def test_all_rules_collected():
+    patterns = set(pattern for source, pattern, flags in backtracking.collect_rules())
+    assert all(rule.pattern in patterns for rule in preprocessing.CLEANUP_RULES if not rule.literal)
+    assert all(rule.regex.pattern in patterns for rule in preprocessing.NEGATION.rules)
+    assert '[^\n\\.:;]+family member[^\n\\.]+' in patterns
@@ -0,0 +1,37 @@
+import re
+import random
+import string
+
+import pytest
+
+import preprocessing
+from sample import part1_documents
+
+utils = pytest.importorskip('utils')
+benchmark_cleaning = pytest.importorskip('benchmark_cleaning')
+
+# --- __simple_text_cleaning of utils.py (baseline code, str.translate of Python 3 in the second branch)
+def old_text_cleaning(text):
+    a = ' '.join([x.strip() for x in text.split('\n') if len(x) > 0 ])
+    if str is bytes:
+        a = a.translate(None, string.punctuation)
+    else:
+        a = a.translate(dict((ord(c), None) for c in string.punctuation))
+    a = re.sub( '\s+', ' ', a ).strip()
+    a = re.sub(r'[0-9]+', '', a).strip()
+    a = ' '.join([x.strip() for x in a.split(' ') if len(x) > 1 ])
+    return a
+
+def texts():
+    """02_main like texts of the sample, generated records and random printable text."""
+    rng = random.Random(8)
+    docs = [preprocessing.markup_text(doc) for doc in part1_documents(30)]
+    docs += benchmark_cleaning.generated_records(20, 2000)
+    docs += [''.join(rng.choice(string.printable) for i in range(rng.randint(0, 300))) for trial in range(500)]
+    return docs + ['', ' ', 'a', 'a b', '1.5 mg/dl', 'x.y', "don't"]
+
+def test_cleaning_equals_baseline():
+    docs = texts()
+    for doc in docs:
+        assert utils.text_cleaning(doc) == old_text_cleaning(doc)
+    assert utils.default_text_preprocessing_batch(docs) == [old_text_cleaning(doc) for doc in docs]
@@ -0,0 +1,67 @@
+import os
+import time
+
+import pytest
+
+from sample import part1_documents
+
+scipy_sparse = pytest.importorskip('scipy.sparse')
+features = pytest.importorskip('features')
+utils = pytest.importorskip('utils')
+
+class WordCounter(object):
+    """Picklable stand-in for the trained vectorizers: counts of a fixed vocabulary."""
+    def __init__(self, vocabulary):
+        self.vocabulary = dict((word, i) for i, word in enumerate(vocabulary))
+        self.calls = 0
+
+    def transform(self, texts):
+        self.calls += 1
+        rows, cols, values = [], [], []
+        for i, text in enumerate(texts):
+            for word in text.split():
+                if word in self.vocabulary:
+                    rows.append(i)
+                    cols.append(self.vocabulary[word])
+                    values.append(1.0)
+        return scipy_sparse.coo_matrix((values, (rows, cols)), shape = (len(texts), len(self.vocabulary)))
+
+TEXTS = part1_documents(30)
+
+@pytest.fixture
+def vectorizer(tmpdir):
+    vocabulary = sorted(set(' '.join(TEXTS).split()))[::3]
+    path = str(tmpdir.join('tfidf.pkl'))
+    utils.save_pickle(WordCounter(vocabulary), path)
+    return path
+
+def same(a, b):
+    return a.shape == b.shape and (a != b).nnz == 0
+
+def test_cache_equals_transform(tmpdir, vectorizer):
+    direct = utils.load_pickle(vectorizer).transform(TEXTS).tocsr()
+    folder = str(tmpdir.join('features'))
+    cache = features.FeatureCache(folder)
+    first = cache.transform(vectorizer, TEXTS)
+    assert same(first, direct)
+    # memory, then disk in a new cache (another process or run)
+    assert cache.transform(vectorizer, TEXTS) is first
+    assert cache.vectorizer(vectorizer).calls == 1
+    other = features.FeatureCache(folder)
+    assert same(other.transform(vectorizer, TEXTS), direct)
+    assert vectorizer not in other.vectorizers
+    assert len(os.listdir(folder)) == 1
+
+def test_changed_texts_and_vectorizer(tmpdir, vectorizer):
+    folder = str(tmpdir.join('features'))
+    cache = features.FeatureCache(folder)
+    cache.transform(vectorizer, TEXTS)
+    window = [text[len(text) // 2:] for text in TEXTS]
+    assert same(cache.transform(vectorizer, window, 30), utils.load_pickle(vectorizer).transform(window))
+    assert len(os.listdir(folder)) == 2
+    # a retrained vectorizer gives a new file
+    time.sleep(0.01)
+    utils.save_pickle(WordCounter(['creatinine', 'hba1c']), vectorizer)
+    fresh = features.FeatureCache(folder)
+    assert same(fresh.transform(vectorizer, TEXTS), utils.load_pickle(vectorizer).transform(TEXTS))
+    assert len(os.listdir(folder)) == 3
@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import types
+import shutil
+
+import pytest
+
+import preprocessing
+from sample import patients, Parser
+
+def test_stage_signature_ignores_tools(tmpdir, monkeypatch):
+    """Only modules which change the output are part of the keys of incremental runs."""
+    code_dir = os.path.dirname(os.path.abspath(preprocessing.__file__))
+    copy = tmpdir.mkdir('preproc')
+    for name in preprocessing.STAGE_MODULES + ['synthetic', 'backtracking', 'profiling']:
+        shutil.copy(os.path.join(code_dir, name + '.py'), str(copy))
+    monkeypatch.setattr(preprocessing, '__file__', str(copy.join('preprocessing.py')))
+    signature = preprocessing.stage_signature(preprocessing.PART1_LEXICONS)
+    for name in ['synthetic', 'backtracking', 'profiling']:
+        copy.join(name + '.py').write('\n# edited\n', mode = 'a')
+    assert preprocessing.stage_signature(preprocessing.PART1_LEXICONS) == signature
+    copy.join('rules.py').write('\n# edited\n', mode = 'a')
+    assert preprocessing.stage_signature(preprocessing.PART1_LEXICONS) != signature
+
+@pytest.fixture
+def processed(tmpdir, monkeypatch):
+    """
+    Input folder with 6 patients in *tmpdir*; preprocessing runs serially with the
+    stand-in parser. Returns the list of files PART 1 and PART 2 processed.
+    """
+    monkeypatch.chdir(str(tmpdir))
+    os.makedirs(preprocessing.in_dir)
+    for i, raw_xml in enumerate(patients(6)):
+        write(preprocessing.in_dir + '{}.xml'.format(100 + i), raw_xml)
+    parser = Parser()
+    monkeypatch.setattr(preprocessing, 'load_parser', lambda profile = 'full': parser)
+    monkeypatch.setattr(preprocessing, 'spacy_version', lambda: 'stand-in 1')
+    processed = []
+    for stage in ['preprocess_document', 'markup_document']:
+        func = getattr(preprocessing, stage)
+        monkeypatch.setattr(preprocessing, stage, lambda file, func = func: processed.append(file) or func(file))
+    return processed
+
+def write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+def outputs():
+    """Contents of the files of all output folders, by folder and name."""
+    return dict((folder, dict((name, open(folder + name).read()) for name in sorted(os.listdir(folder))))
+                for folder in preprocessing.OUTPUT_DIRS)
+
+def changed(before, after):
+    """(folder, name) of files which differ between *before* and *after* outputs()."""
+    return sorted((folder, name) for folder in before for name in set(before[folder]) | set(after[folder])
+                  if before[folder].get(name) != after[folder].get(name))
+
+def test_unchanged_documents_not_processed(processed):
+    preprocessing.run(incremental = True)
+    first = outputs()
+    assert len(processed) == 12 and all(len(first[folder]) == 6 for folder in preprocessing.OUTPUT_DIRS)
+    del processed[:]
+    preprocessing.run(incremental = True)
+    assert processed == [] and outputs() == first
+
+def test_changed_document_processed(processed):
+    preprocessing.run(incremental = True)
+    before = outputs()
+    raw_xml = preprocessing.read_document('103.xml')
+    write(preprocessing.in_dir + '103.xml', raw_xml.replace(']]></TEXT>', 'Creatinine 2.4 mg/dl today.\n]]></TEXT>'))
+    del processed[:]
+    preprocessing.run(incremental = True)
+    assert processed == ['103.xml', '103.xml.txt']
+    files = changed(before, outputs())
+    assert set(name for folder, name in files) == set(['103.xml.txt'])
+    assert set([preprocessing.out_dir, preprocessing.main, preprocessing.labvalues]) <= set(folder for folder, name in files)
+
+def test_deleted_document_removed(processed):
+    preprocessing.run(incremental = True)
+    before = outputs()
+    os.remove(preprocessing.in_dir + '102.xml')
+    preprocessing.run(incremental = True)
+    after = outputs()
+    assert changed(before, after) == sorted((folder, '102.xml.txt') for folder in preprocessing.OUTPUT_DIRS)
+    assert all('102.xml.txt' not in after[folder] for folder in preprocessing.OUTPUT_DIRS)
+    assert sorted(json.load(open(preprocessing.cache_file))['part2']) == ['{}.xml.txt'.format(100 + i)
+                                                                         for i in [0, 1, 3, 4, 5]]
+
+def test_incremental_equals_full_run(processed):
+    preprocessing.run(incremental = True)
+    raw_xml = preprocessing.read_document('101.xml')
+    write(preprocessing.in_dir + '101.xml', raw_xml.replace('Record date:', 'No known drug allergies.\nRecord date:'))
+    os.remove(preprocessing.in_dir + '104.xml')
+    write(preprocessing.in_dir + '106.xml', raw_xml)
+    preprocessing.run(incremental = True)
+    incremental = outputs()
+    preprocessing.run()
+    assert outputs() == incremental
+
+def test_model_version_in_key(monkeypatch):
+    spacy = types.ModuleType('spacy')
+    spacy.__version__ = '2.0.18'
+    model = types.ModuleType('model')
+    model.meta = {'lang': 'en', 'name': 'core_web_sm', 'version': '2.0.0'}
+    spacy.load = lambda name, disable = (): model
+    monkeypatch.setitem(sys.modules, 'spacy', spacy)
+    version = preprocessing.spacy_version()
+    model.meta['version'] = '2.1.0'
+    assert preprocessing.spacy_version() != version
+    model.meta['name'] = 'core_web_md'
+    assert len(set([version, preprocessing.spacy_version()])) == 2
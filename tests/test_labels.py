@@ -0,0 +1,54 @@
+import os
+import random
+import time
+
+import pytest
+
+from sample import patients
+
+labels = pytest.importorskip('labels')
+iaa = pytest.importorskip('iaa')
+from utils import TAGS_LABELS
+
+def write_folders(root, n = 40):
+    """Gold annotations of *n* synthetic patients and predictions with some labels flipped."""
+    gold, predicted = os.path.join(root, 'gold'), os.path.join(root, 'predicted')
+    os.makedirs(gold)
+    os.makedirs(predicted)
+    rng = random.Random(4)
+    for i, raw_xml in enumerate(patients(n, records = (1, 2), length = (10, 20))):
+        lines = raw_xml.split('\n')
+        for j, line in enumerate(lines):
+            if line.startswith('<') and 'met="' in line and rng.random() < 0.3:
+                lines[j] = line.replace('"met"', '"x"').replace('"not met"', '"met"').replace('"x"', '"not met"')
+        for folder, content in [(gold, raw_xml), (predicted, '\n'.join(lines))]:
+            with open(os.path.join(folder, '{}.xml'.format(100 + i)), 'w') as f:
+                f.write(content)
+    return gold, predicted
+
+def test_score_equals_iaa(tmpdir):
+    gold, predicted = write_folders(str(tmpdir))
+    files = sorted(os.listdir(gold))
+    matrix = labels.LabelMatrix.from_folder(gold)
+    prediction = labels.LabelMatrix.from_folder(predicted)
+    scores = matrix.score(prediction.matrix, prediction.ids)
+    for tag, key in [('Overall', None)] + [(tag, tag) for tag in TAGS_LABELS]:
+        micro = iaa.MultipleEvaluator(gold, predicted, 1, files, key).scores['tags']['micro']
+        assert scores[tag] == pytest.approx((micro['precision'], micro['recall'], micro['f1']))
+
+def test_load_labels(tmpdir):
+    gold, predicted = write_folders(str(tmpdir), 10)
+    path = str(tmpdir.join('labels.npz'))
+    built = labels.load_labels(gold, path)
+    loaded = labels.load_labels(gold, path)
+    assert loaded.ids == built.ids and (loaded.matrix == built.matrix).all()
+    assert loaded.column('CREATININE').tolist() == [
+        1 if labels.get_annotations(os.path.join(gold, name + '.xml'))['CREATININE'] == 'met' else 0
+        for name in built.ids]
+    # a changed annotation file rebuilds the matrix
+    time.sleep(0.01)
+    with open(os.path.join(gold, '105.xml'), 'w') as f:
+        f.write(open(os.path.join(predicted, '105.xml')).read())
+    changed = labels.load_labels(gold, path)
+    assert (changed.matrix == labels.LabelMatrix.from_folder(gold).matrix).all()
+    assert (changed.matrix != built.matrix).any()
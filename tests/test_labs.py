@@ -0,0 +1,89 @@
+import re
+
+import pytest
+
+import preprocessing
+from sample import part1_documents
+
+# --- markers of preprocessing.py before the lab table (baseline code)
+def old_creatinine(doc):
+    for item in set(re.findall('creatinine[\w\s\d]{0,15} \d\\.\d', doc)):
+        if (float(item[-3:]) > 1.5): doc = doc.replace(item, ' HIGHCRT ' + item)
+    return doc
+
+def old_hba1c(doc):
+    for item in set(re.findall('hba1c[\w\s]{0,20} \d\\.\d', doc)):
+        hba1c = float(item[-3:])
+        if (6.5 <= hba1c and hba1c <= 9.5): doc = doc.replace(item, item + ' GLYHMG ')
+    for item in set(re.findall('hba1c[\w\s]{0,20} \d ', doc)):
+        hba1c = float(item[-2:])
+        if (6.5 <= hba1c and hba1c <= 9.5): doc = doc.replace(item, item + 'GLYHMG ')
+    return doc
+
+def new_hba1c(doc, labs = None):
+    return preprocessing.HBA1C_WHOLE.apply(preprocessing.HBA1C.apply(doc, labs), labs)
+
+DOCUMENTS = part1_documents(60) + [
+    'creatinine was creatinine 2.3 . creatinine 2.3 x\n',
+    'this is record date 20120304 . hba1c 7 and hba1c 7.1 , hba1c was 9.6 . hba1c 8 hba1c 8\n',
+]
+
+@pytest.mark.parametrize('doc', DOCUMENTS)
+def test_markers_equal_baseline(doc):
+    assert preprocessing.CREATININE.apply(doc, []) == old_creatinine(doc)
+    assert new_hba1c(doc, []) == old_hba1c(doc)
+
+def test_lab_table_has_every_mention():
+    for doc in DOCUMENTS:
+        labs = []
+        preprocessing.CREATININE.apply(doc, labs)
+        mentions = [m.group() for m in re.finditer('creatinine[\w\s\d]{0,15} \d\\.\d', doc)]
+        assert [(value, mention) for date, analyte, value, mention in labs] == [(m[-3:], m) for m in mentions]
+
+def test_lab_table_dates():
+    labs = []
+    text = preprocessing.markup_text('creatinine 1.7 .\nthis is record date 20120304 .\ncreatinine 2.1 .\n'
+                                     'this is record date 20130506 .\nhba1c 7.2 .\ncreatinine 2.1 .\n', None, labs)
+    assert labs == [('', 'creatinine', '1.7', text.index('creatinine 1.7')),
+                    ('20120304', 'creatinine', '2.1', text.index('creatinine 2.1')),
+                    ('20130506', 'creatinine', '2.1', text.rindex('creatinine 2.1')),
+                    ('20130506', 'hba1c', '7.2', text.index('hba1c 7.2'))]
+
+def test_offsets_in_main_text():
+    markers = dict((analyte, [marker.regex for marker in [preprocessing.CREATININE, preprocessing.HBA1C,
+                                                          preprocessing.HBA1C_WHOLE] if marker.analyte == analyte])
+                   for analyte in ['creatinine', 'hba1c'])
+    count = 0
+    for doc in DOCUMENTS + part1_documents(200, seed = 3):
+        labs = []
+        text = preprocessing.markup_text(doc, None, labs)
+        for date, analyte, value, offset in labs:
+            # the mention starts at the offset, with the value at its end once the markers are removed
+            assert offset >= 0 and text.startswith(analyte, offset)
+            rest = re.sub(' [A-Z]+(?= )', '', text[offset:offset+200])
+            assert any(regex.match(rest) and regex.match(rest).group().strip().endswith(value)
+                       for regex in markers[analyte])
+            count += 1
+    assert count > 1000
+
+@pytest.mark.parametrize('time_limit', [None, 30, 62, 186, 366])
+def test_decisions_equal_markers(time_limit):
+    """
+    Lab values of the records in a time window decide as the markers in the
+    text of the window: CREATININE (value above 1.5) and HBA1C (6.5 to 9.5).
+    """
+    medicalcase = pytest.importorskip('medicalcase')
+    for i, doc in enumerate(part1_documents(200)):
+        labs = []
+        text = preprocessing.markup_text(doc, None, labs)
+        mc = medicalcase.MedicalCase(str(i), text = text,
+                                     labs = [(date, analyte, float(value), offset)
+                                             for date, analyte, value, offset in labs])
+        txt = mc.get_timed_text(time_limit)
+        assert any(x > 1.5 for x in mc.lab_values('creatinine', time_limit)) == ('HIGHCRT' in txt)
+        assert any(6.5 <= x <= 9.5 for x in mc.lab_values('hba1c', time_limit)) == ('GLYHMG' in txt)
+
+def test_old_lab_tables():
+    utils = pytest.importorskip('utils')
+    assert utils.parse_labs('20120304\tcreatinine\t1.7\t15\n\thba1c\t7\n') == [
+        ('20120304', 'creatinine', 1.7, 15), ('', 'hba1c', 7.0, -1)]
@@ -0,0 +1,38 @@
+import pytest
+
+from sample import write_corpus
+
+medicalcase = pytest.importorskip('medicalcase')
+
+@pytest.fixture
+def corpus(tmpdir, monkeypatch):
+    names = write_corpus(str(tmpdir), medicalcase.CONFIG_PATH, 12)
+    monkeypatch.chdir(str(tmpdir))
+    return names
+
+def by_name(cases):
+    return dict((mc.name, mc) for mc in cases)
+
+@pytest.mark.parametrize('keep_clean_text', [True, False])
+def test_lazy_equals_eager(corpus, keep_clean_text):
+    eager = by_name(medicalcase.load_whole_dataset())
+    lazy = by_name(medicalcase.load_whole_dataset(lazy = True, keep_clean_text = keep_clean_text))
+    assert sorted(lazy) == sorted(eager) == sorted(corpus)
+    for name, mc in lazy.items():
+        assert mc._text is medicalcase._PENDING and mc._time_splits is medicalcase._PENDING
+        assert mc._gold is medicalcase._PENDING
+        assert mc.gold == eager[name].gold
+        assert mc.text == eager[name].text
+        assert mc._clean_text is not None
+        assert mc.time_splits == eager[name].time_splits
+        assert (mc._clean_text is None) == (not keep_clean_text)
+        assert mc.clean_text == eager[name].clean_text
+        for limit in [None, 62, 366]:
+            assert mc.get_timed_text(limit) == eager[name].get_timed_text(limit)
+
+def test_dropped_clean_text(corpus):
+    eager = by_name(medicalcase.load_whole_dataset())
+    for name, mc in by_name(medicalcase.load_whole_dataset(lazy = True)).items():
+        mc.drop_clean_text()
+        assert mc._clean_text is None
+        assert mc.text == eager[name].text and mc.time_splits == eager[name].time_splits
@@ -0,0 +1,114 @@
+import os
+import re
+import csv
+import random
+
+import pytest
+
+import preprocessing
+from sample import part1_documents
+
+# --- lexicon markers of PART 2 before the compiled rule tables (baseline code)
+def lexicon(name):
+    return dict(csv.reader(open(preprocessing.lexicon_dir + name)))
+
+def old_language(doc):
+    dic = lexicon('language.txt')
+    for key in dic:
+        doc = re.sub('('+key+'.{0,10} speak)', 'NOENGL \\1', doc)
+        doc = re.sub('(speak.{0,20} '+key+')', 'NOENGL \\1', doc)
+    return doc
+
+def old_hrtmed(doc):
+    dic = lexicon('hrtmed.txt')
+    for key in dic: doc = doc.replace(' ' + key + ' ',  ' ' + dic[key] + ' ')
+    return doc
+
+def old_supplements(doc):
+    dic = lexicon('supplements.txt')
+    for key in dic:
+        doc = re.sub('\s('+key+'.{0,50} MED)', ' SPLMNT \\1', doc, flags=re.S)
+        doc = re.sub('(MED|medication|take|taking|continue|refill)(.{0,50})\s('+key+')', '\\1\\2 SPLMNT \\3', doc, flags=re.S)
+        doc = re.sub('\s('+key+'.{0,20})\s(supplement|replacement)', ' SPLMNT \\1 \\2', doc, flags=re.S)
+        doc = re.sub('(supplement.{0,20})\s('+key+')', '\\1 SPLMNT \\2', doc, flags=re.S)
+    return doc
+
+def old_deficiency(doc):
+    dic = lexicon('deficiency.txt')
+    for key in dic: doc = re.sub('('+key+')', '\\1 DFCNCY', doc)
+    return doc
+
+def old_mental(doc):
+    dic = lexicon('mental.txt')
+    for key in dic:
+        doc = re.sub(key, 'MNTCAP ' + key, doc)
+    return doc
+
+def old_illicit(doc):
+    dic = lexicon('illicit.txt')
+    for key in dic: doc = re.sub(key, 'JUNKIE ' + key, doc)
+    return doc
+
+def old_kidmed(doc):
+    dic = lexicon('kidmed.txt')
+    for key in dic: doc = re.sub(key, key + ' KIDMED', doc)
+    return doc
+
+def old_surgery(doc):
+    dic = lexicon('surgery.txt')
+    for key in dic:
+        doc = re.sub('(abdo.{0,15} '+key+')', '\\1 ABDMNL', doc)
+        doc = re.sub('(colon.{0,15} '+key+')', '\\1 ABDMNL', doc)
+        doc = re.sub('(intestin.{0,15} '+key+')', '\\1 ABDMNL', doc)
+        doc = re.sub('(bowel.{0,15} '+key+')', '\\1 ABDMNL', doc)
+        doc = re.sub('(ovarian.{0,15} '+key+')', '\\1 ABDMNL', doc)
+        doc = re.sub('(hernia.{0,15} '+key+')', '\\1 ABDMNL', doc)
+        doc = re.sub('(gall\s?bladder.{0,15} '+key+')', '\\1 ABDMNL', doc)
+        doc = re.sub('(biliary.{0,15} '+key+')', '\\1 ABDMNL', doc)
+    return doc
+
+def old_prevent(doc):
+    dic = lexicon('prevent.txt')
+    for key in dic:
+        doc = re.sub('('+key+'.{0,50} aspirin)', '\\1 ASPFMI', doc, flags=re.S)
+        doc = re.sub('(aspirin) (.{0,50}'+key+')', '\\1 ASPFMI \\2', doc, flags=re.S)
+    return doc
+
+OLD = {
+    'LANGUAGE': old_language,
+    'SUPPLEMENTS': old_supplements,
+    'DEFICIENCY': old_deficiency,
+    'MENTAL': old_mental,
+    'ILLICIT': old_illicit,
+    'KIDMED': old_kidmed,
+    'SURGERY': old_surgery,
+    'PREVENT': old_prevent,
+}
+
+WORDS = ['MED', 'medication', 'take', 'taking', 'continue', 'refill', 'supplement', 'replacement', 'speak', 'speaks',
+         'english', 'not', 'no', 'aspirin', 'abdo', 'colon', 'intestine', 'bowel', 'ovarian', 'hernia', 'gall bladder',
+         'biliary', 'x', '.', '\n', 'mg', 'po', 'qd', 'the', 'and']
+
+def documents():
+    """Sample texts and random texts made of the lexicon keys and the words around them."""
+    words = list(WORDS)
+    for name in os.listdir(preprocessing.lexicon_dir):
+        if name not in ['abbrev.txt', 'mwe.txt', 'negation.txt']:
+            words.extend(row[0] for row in csv.reader(open(preprocessing.lexicon_dir + name)) if row)
+    rng = random.Random(9)
+    docs = part1_documents(30)
+    for trial in range(300):
+        docs.append(' ' + ' '.join(rng.choice(words) for i in range(rng.randint(1, 40))) + ' \n')
+    return docs
+
+DOCUMENTS = documents()
+
+@pytest.mark.parametrize('name', sorted(OLD))
+def test_lexicon_rules_equal_baseline(name):
+    engine = getattr(preprocessing, name)
+    for doc in DOCUMENTS:
+        assert engine.apply(doc) == OLD[name](doc)
+
+def test_hrtmed_equals_baseline():
+    for doc in DOCUMENTS:
+        assert preprocessing.HRTMED.replace(doc) == old_hrtmed(doc)
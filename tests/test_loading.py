@@ -0,0 +1,66 @@
+import os
+import shutil
+
+import pytest
+
+from sample import write_corpus
+
+medicalcase = pytest.importorskip('medicalcase')
+packed = pytest.importorskip('packed')
+
+def same(a, b):
+    return [x.name for x in a] == [y.name for y in b] and all(
+        x.clean_text == y.clean_text and x.text == y.text and x.time_splits == y.time_splits and x.gold == y.gold
+        and x.labs == y.labs and x.index == y.index for x, y in zip(a, b))
+
+@pytest.fixture
+def corpus(tmpdir, monkeypatch):
+    names = write_corpus(str(tmpdir), medicalcase.CONFIG_PATH, 12)
+    monkeypatch.chdir(str(tmpdir))
+    return names
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_packed_equals_files(corpus, compress):
+    assert packed.pack_corpus('preproc', 'corpus.pack', compress) == len(corpus)
+    loaded = medicalcase.load_whole_dataset()
+    # the pack is read instead of the files
+    shutil.rmtree('preproc')
+    assert same(medicalcase.load_whole_dataset(packed = 'corpus.pack'), loaded)
+    assert same(medicalcase.load_whole_dataset(packed = 'corpus.pack', lazy = True), loaded)
+
+@pytest.mark.parametrize('jobs', [2, 3])
+def test_pool_equals_serial(corpus, jobs):
+    loaded = medicalcase.load_whole_dataset(jobs = 1)
+    assert same(medicalcase.load_whole_dataset(jobs = jobs), loaded)
+    assert same(medicalcase.load_whole_dataset(jobs = jobs, lazy = True), loaded)
+
+def test_pool_reports_failures(corpus):
+    for name in [corpus[7], corpus[2]]:
+        os.remove(medicalcase.CONFIG_PATH['preprocessed'].format(name))
+    serial = medicalcase.load_whole_dataset(jobs = 1, skip_errors = True)
+    pooled = medicalcase.load_whole_dataset(jobs = 3, skip_errors = True)
+    assert same(pooled, serial) and len(serial) == len(corpus) - 2
+    with pytest.raises(ValueError) as error:
+        medicalcase.load_whole_dataset(jobs = 3)
+    message = str(error.value)
+    assert message.index(corpus[2] + ':') < message.index(corpus[7] + ':')
+
+@pytest.mark.parametrize('chunk_size', [1000, 5])
+def test_compact_equals_cases(corpus, chunk_size):
+    cases = medicalcase.load_whole_dataset()
+    options = dict(lazy = False, keep_clean_text = True)
+    tasks = [(mc.name, medicalcase.CONFIG_PATH['annotations'].format(mc.name), False, options) for mc in cases]
+    compact = medicalcase.load_compact(tasks, keep_clean_text = True, chunk_size = chunk_size)
+    assert len(compact) == len(cases)
+    scores = {'creatinine': 1, 'HIGHCRT': 5, 'hba1c': 2}
+    for view, mc in zip(compact, cases):
+        assert (view.name, view.text, view.clean_text, view.gold, view.labs) == (mc.name, mc.text, mc.clean_text,
+                                                                               mc.gold, mc.labs)
+        assert view.time_splits == mc.time_splits
+        for limit in [None, 62, 366]:
+            assert view.get_timed_text(limit) == mc.get_timed_text(limit)
+            assert view.lab_values('creatinine', limit) == mc.lab_values('creatinine', limit)
+        assert view.meaningfulness(scores) == mc.meaningfulness(scores)
+        view.annots['CREATININE'] = mc.annots['CREATININE'] = 'met'
+        assert dict(view.annots.items()) == dict(mc.annots.items())
+    assert compact.case(cases[3].name).name == cases[3].name
@@ -0,0 +1,172 @@
+import random
+import re
+
+import preprocessing
+from sample import part1_documents
+
+class Output(object):
+    """File-like object collecting the debug output."""
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def getvalue(self):
+        return ''.join(self.parts)
+
+# --- removal of negated information of preprocessing.py before NegationScanner (baseline code)
+def old_negation(doc, f):
+    f.write('\n\n: NO\n\n')
+    for item in re.findall('[^\n\\.:;,]+:\s*none', doc): f.write("%s\n" % item.replace('\n', ''))
+    doc = re.sub('[^\n\\.:;,]+:\s+none', 'XXX ', doc)
+    for item in re.findall('[^\n\\.:;,]+:\s*negative', doc): f.write("%s\n" % item.replace('\n', ''))
+    doc = re.sub('[^\n\\.:;,]+:\s+negative', 'XXX ', doc)
+    for item in re.findall('[^\n\\.:;,]+:\s*no [^\n\\.]*', doc): f.write("%s\n" % item.replace('\n', ''))
+    doc = re.sub('[^\n\\.:;,]+:\s*no [^\n\\.]*', 'XXX ', doc)
+
+    for item in re.findall('[^\n\\.:;,]+:\s+denies[^\n\\.]+', doc): f.write("%s\n" % item.replace('\n', ''))
+    doc = re.sub('[^\n\\.:;,]+:\s+denies[^\n\\.]+', 'XXX ', doc)
+    for item in re.findall('[^\n\\.:;,]+:\s+unremarkable[^\n\\.]+', doc): f.write("%s\n" % item.replace('\n', ''))
+    doc = re.sub('[^\n\\.:;,]+:\s+unremarkable[^\n\\.]+', 'XXX ', doc)
+
+    f.write('\n\nRULE OUT\n\n')
+    for item in re.findall('[^\n\\.:;]*rule[sd]? out[^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('[^\n\\.:;]*rule[sd]? out[^\n\\.]+', 'XXX ', doc)
+
+    f.write('\n\nRULE SOMETHING OUT\n\n')
+    for item in re.findall('[^\n\\.:;]*rule[sd]? \w+ out[^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('[^\n\\.:;]*rule[sd]? \w+ out[^\n\\.]+', 'XXX ', doc)
+
+    f.write('\n\nDENIES\n\n')
+    for item in re.findall('[^\n\\.:;,]*denie[sd]? [^\n\\.]*', doc): f.write("%s\n" % item)
+    doc = re.sub('[^\n\\.:;,]*denie[sd]? [^\n\\.]*', 'XXX ', doc)
+    for item in re.findall('[^\n\\.:;,]*deny.{0,3} [^\n\\.]*', doc): f.write("%s\n" % item)
+    doc = re.sub('[^\n\\.:;,]*deny.{0,3} [^\n\\.]*', 'XXX ', doc)
+
+    f.write('\n\nCANNOT SEE\n\n')
+    for item in re.findall('[^\n\\.:;]*cannot see[^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('[^\n\\.:;]*cannot see[^\n\\.]+', 'XXX ', doc)
+
+    f.write('\n\nUNLIKELY\n\n')
+    for item in re.findall('[^\n\\.:;]*unlikely [^\n\\.]*', doc): f.write("%s\n" % item)
+    doc = re.sub('[^\n\\.:;]*unlikely [^\n\\.]*', 'XXX ', doc)
+
+    f.write('\n\nNEGATIVE FOR\n\n')
+    for item in re.findall('[^\n\\.:;]*negative for [^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('[^\n\\.:;]*negative for [^\n\\.]+', 'XXX ', doc)
+
+    f.write('\n\nNEITHER\n\n')
+    for item in re.findall('[^\n\\.:;,]*neither [^\n\\.,]+', doc): f.write("%s\n" % item)
+    doc = re.sub('[^\n\\.:;,]*neither [^\n\\.,]+', 'XXX ', doc)
+
+    f.write('\n\nNOR\n\n')
+    for item in re.findall('[^\n\\.:;,]* nor [^\n\\.,]+', doc): f.write("%s\n" % item)
+    doc = re.sub('[^\n\\.:;,]* nor [^\n\\.,]+', 'XXX ', doc)
+
+    f.write('\n\nNOT APPEAR\n\n')
+    for item in re.findall('[^\n\\.:;,]*not appear[^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('[^\n\\.:;,]*not appear[^\n\\.]+', 'XXX ', doc)
+
+    f.write('\n\nNOT KNOWN TO\n\n')
+    for item in re.findall('[^\n\\.:;,]*not known to[^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('[^\n\\.:;,]*not known to[^\n\\.]+', 'XXX ', doc)
+
+    f.write('\n\nNOT APPRECIATE\n\n')
+    for item in re.findall('[^\n\\.:;,]*not appreciate[^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('[^\n\\.:;,]*not appreciate[^\n\\.]+', 'XXX ', doc)
+
+    f.write('\n\nNOT COMPLAIN\n\n')
+    for item in re.findall('[^\n\\.:;,]*not complain[^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('[^\n\\.:;,]*not complain[^\n\\.]+', 'XXX ', doc)
+
+    f.write('\n\nNOT DEMONSTRATE\n\n')
+    for item in re.findall('[^\n\\.:;,]+not demonstrate[^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('[^\n\\.:;,]+not demonstrate[^\n\\.]+', 'XXX ', doc)
+
+    f.write('\n\nNOT EXHIBIT\n\n')
+    for item in re.findall('[^\n\\.:;,]*not exhibit[^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('[^\n\\.:;,]*not exhibit[^\n\\.]+', 'XXX ', doc)
+
+    f.write('\n\nNOT FEEL\n\n')
+    for item in re.findall('[^\n\\.:;,]*not feel[^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('[^\n\\.:;,]*not feel[^\n\\.]+', 'XXX ', doc)
+    for item in re.findall('[^\n\\.:;,]*not felt [^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('[^\n\\.:;,]*not felt [^\n\\.]+', 'XXX ', doc)
+
+    f.write('\n\nNOT REVIEWED\n\n')
+    for item in re.findall('[^\n\\.:;,]*not reviewed[^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('[^\n\\.:;,]*not reviewed[^\n\\.]+', 'XXX ', doc)
+
+    f.write('\n\nNOT HAVE\n\n')
+    for item in re.findall('[^\n\\.:;,]*not have [^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('[^\n\\.:;,]*not have [^\n\\.]+', 'XXX ', doc)
+    for item in re.findall('[^\n\\.:;,]*not had [^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('[^\n\\.:;,]*not had [^\n\\.]+', 'XXX ', doc)
+    for item in re.findall('[^\n\\.:;,]*never had [^\n\\.]+', doc): f.write("%s\n" % item)
+
+    f.write('\n\nDOES NOT\n\n')
+    for item in re.findall('does not [^\n\\.]{0,50}', doc): f.write("%s\n" % item)
+    doc = re.sub('does not [^\n\\.]{0,50}', 'XXX ', doc)
+    for item in re.findall('did not see[^\n\\.]{0,50}', doc): f.write("%s\n" % item)
+    doc = re.sub('did not see[^\n\\.]{0,50}', 'XXX ', doc)
+    for item in re.findall('did not show[^\n\\.]{0,50}', doc): f.write("%s\n" % item)
+    doc = re.sub('did not show[^\n\\.]{0,50}', 'XXX ', doc)
+    for item in re.findall('did not reveal[^\n\\.]{0,50}', doc): f.write("%s\n" % item)
+    doc = re.sub('did not reveal[^\n\\.]{0,50}', 'XXX ', doc)
+    for item in re.findall('did not experience[^\n\\.]{0,50}', doc): f.write("%s\n" % item)
+    doc = re.sub('did not experience[^\n\\.]{0,50}', 'XXX ', doc)
+    for item in re.findall('did not take[^\n\\.]{0,50}', doc): f.write("%s\n" % item)
+    doc = re.sub('did not take[^\n\\.]{0,50}', 'XXX ', doc)
+
+    f.write('\n\nNO\n\n')
+    for item in re.findall('\sno [^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('\sno [^\n\\.]+', ' XXX ', doc)
+
+    f.write('\n\nWITHOUT\n\n')
+    doc = re.sub(' w\/o ', ' without ', doc)
+    for item in re.findall('without any[^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('without any[^\n\\.]+', 'XXX ', doc)
+    for item in re.findall('without evidence[^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('without evidence[^\n\\.]+', 'XXX ', doc)
+    for item in re.findall('without indication[^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('without indication[^\n\\.]+', 'XXX ', doc)
+    for item in re.findall('without sign[^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('without sign[^\n\\.]+', 'XXX ', doc)
+    for item in re.findall('without[^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('without[^\n\\.]+', 'XXX ', doc)
+
+    f.write('\n\nFREE OF\n\n')
+    for item in re.findall('free of [^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('free of [^\n\\.]+', 'XXX ', doc)
+    for item in re.findall('absence of [^\n\\.]+', doc): f.write("%s\n" % item)
+    doc = re.sub('absence of [^\n\\.]+', 'XXX ', doc)
+    doc = doc.replace(' pain free ', ' XXX ')
+    doc = doc.replace(' symptom free ', ' XXX ')
+    return doc
+
+WORDS = ['rule out', 'rules out', 'ruled x out', 'denies', 'denied', 'deny', 'denying', 'cannot see', 'unlikely',
+         'negative for', 'neither', 'nor', 'not appear', 'not known to', 'not appreciate', 'not complain',
+         'not demonstrate', 'not exhibit', 'not feel', 'not felt', 'not reviewed', 'not have', 'not had', 'never had',
+         'does not', 'did not see', 'did not take', 'no', 'w/o', 'without', 'without any', 'free of', 'absence of',
+         'pain free', 'symptom free', ':', ';', ',', '.', ': \n', ':\n', 'none', 'negative', 'unremarkable',
+         'chest pain', 'creatinine 2.3', 'this is record date 20120304 .', 'x:', 'aspirin', 'heart']
+
+def fragments(n = 1000):
+    """Random documents made of the triggers and scope boundaries of the negation rules."""
+    rng = random.Random(5)
+    docs = []
+    for trial in range(n):
+        words = [rng.choice(WORDS) for i in range(rng.randint(0, 60))]
+        docs.append(' ' + ''.join(word + rng.choice([' ', ' ', ' ', '  ', ' \n ', '']) for word in words) + ' \n')
+    return docs
+
+def test_negation_equals_baseline():
+    for doc in part1_documents(60) + fragments():
+        old, new = Output(), Output()
+        assert preprocessing.NEGATION.apply(doc, new) == old_negation(doc, old)
+        assert new.getvalue() == old.getvalue()
+
+def test_negation_without_output():
+    for doc in fragments(300):
+        assert preprocessing.NEGATION.apply(doc) == old_negation(doc, Output())
@@ -0,0 +1,41 @@
+import csv
+import random
+
+import preprocessing
+from normalizer import TokenNormalizer
+from sample import part1_documents
+
+ABBREV = preprocessing.lexicon_dir + 'abbrev.txt'
+MWE = preprocessing.lexicon_dir + 'mwe.txt'
+
+# --- token normalization of write_sentences before the automaton (baseline code)
+def old_normalize(tokens, dic1, dic2):
+    tokenized = ' '
+    for t in tokens:
+        if t in dic1.keys(): t = dic1[t]
+        tokenized += t + ' '
+    for key in dic2: tokenized = tokenized.replace(' ' + key + ' ',  ' ' + dic2[key] + ' ')
+    return tokenized
+
+def lexicon_words(*paths):
+    """Words of the keys and values of the lexicons at *paths*."""
+    words = []
+    for path in paths:
+        for row in csv.reader(open(path)):
+            for phrase in row:
+                words.extend(phrase.split(' '))
+    return words
+
+def sentences(words, n, seed):
+    """*n* random token lists made of *words*."""
+    rng = random.Random(seed)
+    return [[rng.choice(words) for i in range(rng.randint(1, 30))] for trial in range(n)]
+
+def test_normalizer_equals_baseline():
+    dic1 = dict(csv.reader(open(ABBREV)))
+    dic2 = dict(csv.reader(open(MWE)))
+    normalizer = TokenNormalizer(ABBREV, MWE)
+    tokens = [line.split() for doc in part1_documents(30) for line in doc.split('\n')]
+    tokens += sentences(lexicon_words(ABBREV, MWE) + ['.', ',', 'the', 'and'], 3000, 1)
+    for sentence in tokens:
+        assert normalizer.normalize(sentence) == old_normalize(sentence, dic1, dic2)
@@ -0,0 +1,126 @@
+import os
+import re
+import csv
+import json
+
+import pytest
+
+import preprocessing
+from sample import patients
+
+pytest.importorskip('spacy')
+
+def outputs(folders):
+    """Contents of all files of *folders*, by folder and name."""
+    return dict((folder, dict((name, open(os.path.join(folder, name)).read()) for name in sorted(os.listdir(folder))))
+                for folder in folders)
+
+@pytest.fixture
+def input_dir(tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    os.makedirs(preprocessing.in_dir)
+    for i, raw_xml in enumerate(patients(12)):
+        with open(os.path.join(preprocessing.in_dir, '{}.xml'.format(100 + i)), 'w') as f:
+            f.write(raw_xml)
+    return tmpdir
+
+@pytest.mark.parametrize('options', [dict(jobs = 3), dict(jobs = 2, chunksize = 1), dict(jobs = 2, batch_size = 4)])
+def test_pool_equals_serial(input_dir, options):
+    preprocessing.run(jobs = 1)
+    serial = outputs(preprocessing.OUTPUT_DIRS)
+    preprocessing.run(**options)
+    assert outputs(preprocessing.OUTPUT_DIRS) == serial
+    assert len(serial[preprocessing.main]) == 12
+
+@pytest.mark.parametrize('options', [dict(jobs = 1), dict(jobs = 2), dict(jobs = 2, debug = True)])
+def test_stream_equals_serial(input_dir, options):
+    preprocessing.run(jobs = 1)
+    serial = outputs(preprocessing.OUTPUT_DIRS)
+    for folder in preprocessing.OUTPUT_DIRS:
+        for name in os.listdir(folder):
+            os.remove(os.path.join(folder, name))
+    preprocessing.run(stream = True, **options)
+    streamed = outputs(preprocessing.OUTPUT_DIRS)
+    written = [folder for folder in preprocessing.OUTPUT_DIRS if streamed[folder]]
+    if options.get('debug'):
+        assert written == preprocessing.OUTPUT_DIRS
+    else:
+        assert written == [preprocessing.main, preprocessing.recindex, preprocessing.labvalues]
+    assert dict((folder, streamed[folder]) for folder in written) == dict((folder, serial[folder]) for folder in written)
+
+def test_preprocessor_equals_run(input_dir):
+    preprocessing.run(jobs = 1)
+    written = outputs([preprocessing.main])[preprocessing.main]
+    files = sorted(os.listdir(preprocessing.in_dir))
+    raw_xmls = [preprocessing.read_document(file) for file in files]
+    expected = [written[file + '.txt'] for file in files]
+    preprocessor = preprocessing.Preprocessor()
+    assert [preprocessor.preprocess_document(raw_xml) for raw_xml in raw_xmls] == expected
+    assert preprocessor.preprocess_documents(raw_xmls, batch_size = 5) == expected
+
+@pytest.mark.parametrize('options', [dict(jobs = 2), dict(jobs = 2, batch_size = 4), dict(jobs = 2, stream = True)])
+def test_timing_keeps_output(input_dir, options):
+    preprocessing.run(jobs = 1)
+    serial = outputs(preprocessing.OUTPUT_DIRS)
+    preprocessing.run(timing = 'timing', **options)
+    folders = [preprocessing.main, preprocessing.recindex, preprocessing.labvalues]
+    assert outputs(folders) == dict((folder, serial[folder]) for folder in folders)
+    timings = json.load(open('timing.json'))
+    groups = set(rule['group'] for rule in timings['rules'])
+    assert set(['cleanup', 'negation.txt', 'spacy']) <= groups
+    # every pass of the cleanup rules once per document (some passes have the same name)
+    names = [rpass.name for rpass in preprocessing.CLEANUP.passes]
+    calls = dict((rule['rule'], rule['calls']) for rule in timings['rules'] if rule['group'] == 'cleanup')
+    assert calls == dict((name, 12 * names.count(name)) for name in names)
+    assert os.path.exists('timing.txt')
+
+# --- PART 1 sentences of preprocessing.py before the tokens of the document parse were reused (baseline code)
+def old_sentences_text(parser, dic1, dic2, parsedDoc):
+    sents = []
+    for span in parsedDoc.sents:
+        sent = ''.join(parsedDoc[i].string for i in range(span.start, span.end)).strip()
+        sents.append(sent)
+    lines = []
+    for sentence in sents:
+        sentence = re.sub('\\: \\.', ':', sentence)
+        if sentence not in ['This is a list item.', '.']:
+            parse = parser(sentence)
+            tokenized = ' '
+            for i, token in enumerate(parse):
+                t = token.lower_
+                if t in dic1.keys(): t = dic1[t]
+                tokenized += t + ' '
+            for key in dic2: tokenized = tokenized.replace(' ' + key + ' ',  ' ' + dic2[key] + ' ')
+            if tokenized not in ['']: lines.append(tokenized+'\n')
+    return ''.join(lines)
+
+def test_sentences_equal_baseline():
+    preprocessor = preprocessing.Preprocessor()
+    dic1 = preprocessor.normalizer.abbrev
+    dic2 = dict(csv.reader(open(preprocessing.lexicon_dir + 'mwe.txt')))
+    raw_xmls = patients(30) + [
+        '<TEXT><![CDATA[Record date: 2091-03-04\nHx: . none. BP 120/80 : . ok.\n1. aspirin]]></TEXT>']
+    for raw_xml in raw_xmls:
+        parsedDoc = preprocessor.parse(raw_xml)
+        assert preprocessor.sentences_text(parsedDoc) == old_sentences_text(preprocessor.parser, dic1, dic2, parsedDoc)
+
+@pytest.fixture
+def model():
+    try:
+        preprocessing.load_parser()
+    except (IOError, OSError):
+        pytest.skip('spaCy model {} not installed'.format(preprocessing.spacy_model))
+
+@pytest.mark.parametrize('profile', ['sentencizer', 'parser'])
+def test_profile_sentences_equal_full(input_dir, model, profile):
+    with open(os.path.join(preprocessing.in_dir, '200.xml'), 'w') as f:
+        f.write('<TEXT><![CDATA[Record date: 2091-03-04\nHx: . none. BP 120/80 : . ok.\n1. aspirin\n'
+                '2. lisinopril 10 mg daily\nFamily history: mother with DM. Pt. seen by Dr. Smith.]]></TEXT>')
+    assert preprocessing.check_profile(profile) == []
+
+def test_parser_profile_equals_full(input_dir):
+    preprocessing.run(jobs = 1)
+    full = outputs(preprocessing.OUTPUT_DIRS)
+    assert preprocessing.check_profile('parser') == []
+    preprocessing.run(jobs = 2, profile = 'parser')
+    assert outputs(preprocessing.OUTPUT_DIRS) == full
@@ -0,0 +1,73 @@
+import re
+from datetime import datetime, timedelta
+
+import pytest
+
+import preprocessing
+import records
+from sample import part1_documents
+
+# --- window markers and 02_months_* copies of preprocessing.py before 02_index (baseline code)
+def old_mark_windows(doc):
+    days = 0
+    previous = datetime(2000,1,1)
+    for item in reversed(re.findall(' this is record date \d\d\d\d\d\d\d\d \\. ', doc)):
+        current = datetime(int(item[21:25]), int(item[25:27]), int(item[27:29]))
+        difference = (previous - current).days
+        if (difference > 0): days = days + difference
+        if (days <= 61):
+            doc = doc.replace(item, ' record within 6 months . \n' + item)
+            doc = doc.replace(item, ' record within 3 months . \n' + item)
+            doc = doc.replace(item, ' record within 2 months . \n' + item)
+        elif (days <= 92):
+            doc = doc.replace(item, ' record within 6 months . \n' + item)
+            doc = doc.replace(item, ' record within 3 months . \n' + item)
+        elif (days <= 183):
+            doc = doc.replace(item, ' record within 6 months . \n' + item)
+        previous = current
+    return doc
+
+def old_months(doc):
+    copies = {}
+    for months in ['6', '3', '2']:
+        cut = doc.find(' record within {} months'.format(months))
+        if (cut >= 0): doc = doc[cut:]
+        copies[months] = doc
+    return copies
+
+def documents():
+    docs = part1_documents(60)
+    # records on the same day and out of date order repeat record dates
+    docs += part1_documents(20, seed = 11, spacing = (0, 2))
+    for doc in part1_documents(10, seed = 5):
+        parts = doc.split('this is record date')
+        docs.append(parts[0] + ''.join('this is record date' + part for part in reversed(parts[1:])))
+    # records at the limits of the windows
+    last = datetime(2061, 6, 1)
+    for days in [61, 62, 92, 93, 183, 184]:
+        dates = [last - timedelta(days = days + 1), last - timedelta(days = days), last]
+        docs.append(''.join(' this is record date {} . \n creatinine 1.{} . \n'.format(date.strftime('%Y%m%d'), i)
+                            for i, date in enumerate(dates)))
+    return docs
+
+DOCUMENTS = documents()
+
+def test_markers_equal_baseline():
+    for doc in DOCUMENTS:
+        assert records.mark_windows(doc) == old_mark_windows(doc)
+
+def test_windows_equal_month_copies():
+    for doc in DOCUMENTS:
+        text = preprocessing.markup_text(doc)
+        windows = records.record_index(text)['windows']
+        for months, copy in old_months(text).items():
+            assert text[windows[months]:] == copy
+
+def test_time_splits_from_index():
+    medicalcase = pytest.importorskip('medicalcase')
+    for i, doc in enumerate(DOCUMENTS):
+        text = preprocessing.markup_text(doc)
+        scanned = medicalcase.MedicalCase(str(i), text = text)
+        indexed = medicalcase.MedicalCase(str(i), text = text, index = records.record_index(text))
+        assert indexed._record_cuts() == scanned._record_cuts()
+        assert indexed.time_splits == scanned.time_splits
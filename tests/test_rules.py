@@ -0,0 +1,241 @@
+import random
+import re
+
+import pytest
+
+import preprocessing
+from rules import RuleEngine, LexiconEngine, KeyScanner, regex
+from profiling import Profiler
+from sample import part1_documents, patients
+
+# --- PART 1 cleanup of preprocessing.py before the rule engine (baseline code)
+def old_clean_document(doc):
+    # --- remove XML elements and special characters
+    doc = re.sub('.*CDATA\[', '', doc, flags=re.S)
+    doc = re.sub('\]\]></TEXT>.*', '', doc, flags=re.S)
+    doc = re.sub('<[a-zA-Z]+>', ' ', doc)
+    doc = doc.replace('HEEN&T', 'HEENT')
+    doc = doc.replace('(Stat Lab)', ' ')
+    doc = doc.replace('&nbsp', ' ')
+    doc = doc.replace('&#183;', ' . ')
+    doc = doc.replace('&#224;', ' . ')
+    doc = doc.replace('&#8211;', ' . ')
+    doc = doc.replace('&#8217;', '\'')
+    doc = doc.replace('&#8220;;', '')
+    doc = doc.replace('&#8221;', '')
+    doc = doc.replace('&gt;', ' greater than ')
+    doc = doc.replace('&lt;', ' less than ')
+    doc = doc.replace('>', ' greater than ')
+    doc = doc.replace('<', ' less than ')
+
+    # --- gender
+    doc = doc.replace('gentleman', 'male')
+    doc = doc.replace('lady', 'female')
+
+    # --- titles so that they don't get confused with other acronyms
+    doc = doc.replace('M.Sc.', '')
+    doc = doc.replace('Ph.D.', '')
+    doc = doc.replace('PhD', '')
+    doc = doc.replace('Jr.', '')
+    doc = doc.replace('JR.', '')
+
+    # --- enclytics
+    doc = doc.replace('aren\'t', 'are not')
+    doc = doc.replace('can\'t', 'cannot')
+    doc = doc.replace('couldn\'t', 'could not')
+    doc = doc.replace('didn\'t', 'did not')
+    doc = doc.replace('doesn\'t', 'does not')
+    doc = doc.replace('don\'t', 'do not')
+    doc = doc.replace('hadn\'t', 'had not')
+    doc = doc.replace('hasn\'t', 'has not')
+    doc = doc.replace('haven\'t', 'have not')
+    doc = doc.replace('isn\'t', 'is not')
+    doc = doc.replace('wasn\'t', 'was not')
+    doc = doc.replace('wouldn\'t', 'would not')
+    doc = doc.replace('won\'t', 'will not')
+    doc = doc.replace('con\'t', 'continue')
+    doc = doc.replace('cont\'d', 'continue')
+    doc = doc.replace('\'m', ' am')
+    doc = doc.replace('\'ll', ' will')
+    doc = doc.replace('\'s', '')
+    doc = doc.replace('\'ve', '')
+    doc = doc.replace('\'d', '')
+    doc = doc.replace('\'ed', '')
+
+    # --- special punctuation
+    doc = re.sub('\sC\\.', ' C ', doc, flags=re.IGNORECASE) # C. diff --> C diff
+    doc = re.sub('\sE\\.', ' E ', doc, flags=re.IGNORECASE) # E. coli --> E coli
+    doc = re.sub('[^\w]vit\\.', ' vit ', doc, flags=re.IGNORECASE) # vit. D --> vit D
+    doc = doc.replace('x. ', 'x ') # fx. of --> fx of
+    doc = re.sub('\sq\\.\s', ' q.', doc, flags=re.IGNORECASE) # q. a.m. --> q.a.m.
+    doc = re.sub('([a-z])\\.([a-z])\\.([a-z])\\.', '\\1\\2\\3', doc, flags=re.IGNORECASE) # q.a.m. --> qam
+    doc = re.sub('([a-z])\\.([a-z])\\.', '\\1\\2', doc, flags=re.IGNORECASE) # q.d. --> qd
+    #doc = re.sub('q\\.(\d)', 'q\\1', doc, flags=re.IGNORECASE) # q.4 --> q4
+    doc = re.sub('\sq\\.\s', ' q ', doc, flags=re.IGNORECASE|re.S) # q.\n --> q
+    doc = re.sub('\sq\\.', ' q ', doc, flags=re.IGNORECASE) # q. --> q
+    doc = re.sub('\sq\s+', ' q ', doc, flags=re.IGNORECASE|re.S) # q\n --> q
+    doc = re.sub('\sh\\.\s', ' h ', doc, flags=re.IGNORECASE) # h. --> h
+    doc = re.sub('(\\.)([a-z])', '. \\2', doc, flags=re.IGNORECASE) # .blah --> . blah
+    doc = doc.replace('.)', '. ') # overzealous numbering
+    doc = doc.replace('ELEM.', 'ELEM ') # elemental
+    doc = doc.replace('TAB.SR', 'TABLET')
+    doc = re.sub('\(\s*S\s*\)', ' ', doc, flags=re.IGNORECASE)
+
+    # --- record date
+    doc = re.sub('Record date: (\d\d\d\d)-(\d\d)-(\d\d)', '. This is record date \\1\\2\\3 .', doc)
+
+    # --- dates
+    doc = re.sub('\s\d\d/\d\d/\d\d\d\d\s', ' ', doc)
+
+    # --- force sentence spliting where punctuation is not used properly
+    doc = re.sub('\n[0-9]+\\.\s', ' . This is a list item. ', doc) # 1. blah blah
+    doc = re.sub('\n[0-9]+\)\s', ' . This is a list item. ', doc)  # 1) blah blah
+    doc = re.sub('\n-+', ' . This is a list item. ', doc)          # -- blah blah
+
+    doc = doc.replace('(H)', ' ') # lab: high
+    doc = doc.replace('(L)', ' ') # lab: low
+    doc = doc.replace('(T)', ' ') # lab: trace
+    doc = re.sub('QTY:.{0,30} End:', ' . ', doc)
+    doc = re.sub('QTY:.{0,20} Start:', ' . ', doc)
+    doc = re.sub('QTY:.{0,10} Refills:\d*', ' . ', doc)
+    doc = re.sub('take:', 'take ', doc)
+    doc = re.sub('TABLET\s+CR\s+', 'TABLET ', doc)   # controlled release, not creatinine
+    doc = re.sub('CAPSULE\s+CR\s+', 'CAPSULE ', doc) # controlled release, not creatinine
+    doc = re.sub('creatinine\s*:\s*', 'creatinine ', doc, flags=re.IGNORECASE)
+    doc = re.sub('[\s/]PE:', '\nPHYSICAL EXAMINATION:', doc)
+    doc = re.sub('\n([^\n]+): ', '\n . \\1: ', doc)
+    doc = re.sub('\n+', ' ', doc)
+    doc = re.sub('_+', 'NEW RECORD: ', doc)
+    doc = re.sub('--+', ' . ', doc)
+    doc = re.sub('==+', ' . ', doc)
+    doc = re.sub('##+', ' ', doc)
+    doc = re.sub('-', ' ', doc)
+    doc = re.sub('\\*+', '.', doc)
+    doc = re.sub('\\"', '', doc)
+    doc = re.sub('\s+', ' ', doc)
+    doc = re.sub(': ', ': . ', doc)
+    doc = re.sub('~', ' ', doc)
+    doc = re.sub('(\d)([a-z])', '\\1 \\2', doc, flags=re.IGNORECASE)
+#    doc = re.sub('(\d)\-([a-zA-Z])', '\\1 - \\2', doc)
+    doc = re.sub(' yo m ', ' yo male ', doc, flags=re.IGNORECASE)
+    doc = re.sub(' yo f ', ' yo female ', doc, flags=re.IGNORECASE)
+    doc = re.sub('[xX] ray', 'xray', doc)
+#    doc = re.sub('[aA]\-fib', 'afib', doc)
+    doc = re.sub('[aA] fib', 'afib', doc)
+#    doc = re.sub('[vV]\-fib', 'vfib', doc)
+    doc = re.sub('[vV] fib', 'vfib', doc)
+    doc = re.sub('(\\. )*\\.', '.', doc)
+    doc = re.sub('\s+', ' ', doc)
+    doc = doc.replace('CVA tenderness', 'costovertebral angle tenderness')
+    doc = re.sub('(nkda)\\.', '\\1', doc, flags=re.IGNORECASE)
+    doc = re.sub('(nka)\\.', '\\1', doc, flags=re.IGNORECASE)
+    doc = re.sub('(\\. )*\\.', '.', doc)
+    doc = re.sub('\ss\/p\s', ' status post ', doc, flags=re.IGNORECASE)
+    doc = re.sub('\sb\s6\s', ' b6 ', doc, flags=re.IGNORECASE|re.S)
+    doc = re.sub('\sb\s12\s', ' b6 ', doc, flags=re.IGNORECASE|re.S)
+    doc = re.sub('\sb6\/b12\s', ' b6 b12 ', doc, flags=re.IGNORECASE|re.S)
+    doc = re.sub('\sb12\/b6\s', ' b6 b12 ', doc, flags=re.IGNORECASE|re.S)
+    return doc
+
+def sequential(engine, doc):
+    """Rules of *engine* applied one after another with doc.replace / re.sub."""
+    for rule in engine.rules:
+        if rule.literal:
+            doc = doc.replace(rule.pattern, rule.replacement)
+        else:
+            doc = rule.regex.sub(rule.replacement, doc)
+    return doc
+
+def fragments():
+    """Random documents glued together from the patterns and replacements of the cleanup rules."""
+    pieces = ['Record date: 2091-03-04', 'QTY: 12 End:', '\n', ' ', '.', ':', '-', 'a', 'q', '1', '12/01/2091 ',
+              ' b 6 ', 'b6/b12', "'s", "can't", '<TEXT><![CDATA[', ']]></TEXT>', 'x. ', 'vit.', '(s)', 'nkda.', '*',
+              '"', '_', '==', '~', '3mg', ' yo m ', 'x ray', 'a fib', 's/p']
+    for rule in preprocessing.CLEANUP_RULES:
+        pieces += [rule.pattern.replace('\\', ''), rule.replacement.replace('\\', '')]
+    rng = random.Random(3)
+    return [''.join(rng.choice(pieces) + rng.choice(['', ' ', '\n', '. ']) for i in range(rng.randint(1, 60)))
+            for trial in range(2000)]
+
+def test_cleanup_equals_baseline():
+    for doc in patients(60) + fragments():
+        assert preprocessing.clean_document(doc) == old_clean_document(doc)
+
+def test_cleanup_rules_transcribed():
+    # every baseline rule is in the table, unmerged application gives the same output
+    engine = RuleEngine(preprocessing.CLEANUP_RULES, merge = False)
+    assert preprocessing.CLEANUP.eliminated > 0
+    for doc in patients(20):
+        assert engine.apply(doc) == old_clean_document(doc)
+
+ENGINES = [name for name, value in sorted(vars(preprocessing).items()) if isinstance(value, RuleEngine)]
+
+@pytest.mark.parametrize('name', ENGINES)
+def test_merged_passes_equal_sequential(name):
+    engine = getattr(preprocessing, name)
+    documents = patients(20) + fragments()[:300] if name == 'CLEANUP' else part1_documents(30)
+    for doc in documents:
+        assert engine.apply(doc) == sequential(engine, doc)
+
+def random_keys(rng, n):
+    """*n* different keys made of a few letters, many of them prefixes or parts of others."""
+    keys = []
+    while len(keys) < n:
+        key = ''.join(rng.choice('ab x') for i in range(rng.randint(1, 4)))
+        if key.strip() and key not in keys:
+            keys.append(key)
+    return keys
+
+def test_key_scanner_finds_all_keys():
+    rng = random.Random(4)
+    for trial in range(300):
+        keys = random_keys(rng, rng.randint(1, 12))
+        scanner = KeyScanner(keys)
+        text = ''.join(rng.choice('ab xy') for i in range(rng.randint(0, 30)))
+        assert scanner.find(text) == set(k for k, key in enumerate(keys) if key in text)
+
+def templates(key):
+    return [
+        regex('('+key+'.{0,3} y)', 'Y \\1'),   # keeps the match in order
+        regex('(x)('+key+')', '\\2a\\1'),     # swaps groups, creates any text
+        regex('b'+key, 'ab'),                   # replaces the match, creates keys with a or b
+        regex('('+key+')(y)', '\\1\\2'),      # keeps adjacent groups
+    ]
+
+def test_lexicon_engine_equals_sequential():
+    rng = random.Random(6)
+    for trial in range(300):
+        keys = random_keys(rng, rng.randint(1, 10))
+        # without the swap only the created keys are looked up again
+        for engine in [LexiconEngine(keys, lambda key: templates(re.escape(key))),
+                       LexiconEngine(keys, lambda key: [t for i, t in enumerate(templates(re.escape(key))) if i != 1])]:
+            for i in range(5):
+                doc = ''.join(rng.choice(['a', 'b', ' ', 'x', 'y', ' y']) for j in range(rng.randint(0, 30)))
+                assert engine.apply(doc) == sequential(engine, doc)
+
+def test_lexicon_engine_checks_all_keys_with_regex_syntax():
+    engine = LexiconEngine(['a.c', 'b'], lambda key: [regex(key, '<' + key + '>')])
+    assert engine.always == set([0])
+    assert engine.apply('abc b') == sequential(engine, 'abc b') == '<a.c> <b>'
+
+def test_lexicon_engine_finds_created_keys():
+    # swapping the groups glues b and a together
+    engine = LexiconEngine(['a', 'ba'], lambda key: [regex('(x+)('+key+')', '\\2\\1'), regex('^('+key+')', '<\\1>')])
+    assert engine.created[0] is None
+    assert engine.apply('bxa') == sequential(engine, 'bxa') == '<ba>x'
+
+def test_lexicon_passes_do_not_grow_with_keys():
+    doc = ' patient does not speak drug3 well , takes drug7 MED daily . \n' * 50
+    calls = []
+    for n in [10, 100]:
+        engine = LexiconEngine(['drug{}'.format(i) for i in range(n)], lambda key: [
+            regex('('+key+'.{0,10} speak)', 'NOENGL \\1'),
+            regex('(speak.{0,20} '+key+')', 'NOENGL \\1'),
+            regex('\\s('+key+'.{0,50} MED)', ' SPLMNT \\1', re.S),
+        ], name = 'drugs')
+        engine.profiler = Profiler()
+        result = engine.apply(doc)
+        assert result == sequential(engine, doc) and 'NOENGL speak' in result and 'SPLMNT drug7' in result
+        calls.append(sum(entry[1] for entry in engine.profiler.rules.values()))
+    # one key scan and the rules of drug3 and drug7
+    assert calls[0] == calls[1] == 7
@@ -0,0 +1,60 @@
+import os
+import time
+
+import pytest
+
+from sample import write_corpus
+
+medicalcase = pytest.importorskip('medicalcase')
+
+def same(a, b):
+    return [x.name for x in a] == [y.name for y in b] and all(
+        x.text == y.text and x.time_splits == y.time_splits and x.gold == y.gold and x.labs == y.labs
+        for x, y in zip(a, b))
+
+@pytest.fixture
+def corpus(tmpdir, monkeypatch):
+    names = write_corpus(str(tmpdir), medicalcase.CONFIG_PATH, 12)
+    monkeypatch.chdir(str(tmpdir))
+    calls = []
+    load_case = medicalcase.load_case
+    def counting(task):
+        calls.append(task[0])
+        return load_case(task)
+    monkeypatch.setattr(medicalcase, 'load_case', counting)
+    return names, calls
+
+def test_snapshot_equals_loading(corpus):
+    names, calls = corpus
+    loaded = medicalcase.load_whole_dataset()
+    del calls[:]
+    first = medicalcase.load_whole_dataset(snapshot = 'snapshot')
+    assert len(calls) == len(names) and same(loaded, first)
+    del calls[:]
+    second = medicalcase.load_whole_dataset(snapshot = 'snapshot')
+    assert calls == [] and same(loaded, second)
+    time.sleep(0.01)
+    os.utime(medicalcase.CONFIG_PATH['labs'].format(names[3]), None)
+    del calls[:]
+    third = medicalcase.load_whole_dataset(snapshot = 'snapshot')
+    assert calls == [names[3]] and same(loaded, third)
+
+def test_snapshot_keeps_loading_modes(corpus):
+    names, calls = corpus
+    medicalcase.load_whole_dataset(snapshot = 'snapshot')
+    medicalcase.load_whole_dataset(snapshot = 'snapshot', keep_clean_text = False)
+    del calls[:]
+    medicalcase.load_whole_dataset(snapshot = 'snapshot')
+    medicalcase.load_whole_dataset(snapshot = 'snapshot', keep_clean_text = False)
+    assert calls == []
+    assert len(os.listdir('snapshot')) == 2 * len(names)
+
+def test_snapshot_without_memos(corpus):
+    mc = medicalcase.load_whole_dataset()[0]
+    windows = dict((limit, mc.get_timed_text(limit)) for limit in [30, 62, 366])
+    store = medicalcase.CorpusSnapshot('snapshot')
+    entry, key = store.key((mc.name, mc.annotation_path, False, {}))
+    store.put(entry, key, mc)
+    stored = store.get(entry, key)
+    assert stored._windows == {} and mc._windows
+    assert dict((limit, stored.get_timed_text(limit)) for limit in windows) == windows
@@ -0,0 +1,36 @@
+import os
+import re
+
+import synthetic
+
+def read(folder, name):
+    with open(os.path.join(folder, name)) as f:
+        return f.read()
+
+def test_same_seed_same_corpus(tmpdir):
+    first, second, other = [str(tmpdir.join(name)) for name in ['first', 'second', 'other']]
+    options = dict(seed = 3, records = (1, 4), length = (20, 60))
+    assert synthetic.generate(first, 15, **options) == synthetic.generate(second, 15, **options)
+    synthetic.generate(other, 15, seed = 4, records = (1, 4), length = (20, 60))
+    names = sorted(os.listdir(first))
+    assert names == ['{}.xml'.format(100 + i) for i in range(15)] == sorted(os.listdir(second))
+    assert all(read(first, name) == read(second, name) for name in names)
+    assert any(read(first, name) != read(other, name) for name in names)
+
+def test_patient_depends_only_on_seed_and_index():
+    generator = synthetic.PatientGenerator(seed = 5)
+    assert generator.patient(7) == synthetic.PatientGenerator(seed = 5).patient(7)
+    assert [generator.patient(i) for i in [3, 1]] == [generator.patient(i) for i in [1, 3]][::-1]
+
+def test_lab_tags_follow_values():
+    generator = synthetic.PatientGenerator(seed = 2, records = (1, 6), length = (40, 120))
+    for i in range(40):
+        content = generator.patient(i)
+        creatinine = [float(x) for x in re.findall('Creatinine ([0-9.]+) mg/dl', content)]
+        hba1c = [float(x) for x in re.findall('HbA1c ([0-9.]+) %', content)]
+        tags = dict(re.findall('<([A-Z0-9-]+) met="([a-z ]+)" />', content))
+        assert sorted(tags) == sorted(synthetic.TAGS)
+        assert (tags['CREATININE'] == 'met') == any(x > 1.5 for x in creatinine)
+        assert (tags['HBA1C'] == 'met') == any(6.5 <= x <= 9.5 for x in hba1c)
+        dates = re.findall('Record date: ([0-9-]+)', content)
+        assert dates == sorted(dates) and len(dates) >= 1
@@ -0,0 +1,47 @@
+import os
+import re
+import json
+
+import pytest
+
+import preprocessing
+from sample import patients, Parser
+
+@pytest.fixture
+def input_dir(tmpdir, monkeypatch):
+    """Input folder with 6 patients in *tmpdir*, parsed by the stand-in parser."""
+    monkeypatch.chdir(str(tmpdir))
+    os.makedirs(preprocessing.in_dir)
+    for i, raw_xml in enumerate(patients(6)):
+        with open(preprocessing.in_dir + '{}.xml'.format(100 + i), 'w') as f:
+            f.write(raw_xml)
+    monkeypatch.setattr(preprocessing, 'load_parser', lambda profile = 'full': Parser())
+    return tmpdir
+
+def not_timing():
+    return (preprocessing.profiler is None and preprocessing.markup_re is re
+            and all(engine.profiler is None for engine in preprocessing.ENGINES))
+
+def outputs():
+    return dict((folder, dict((name, open(folder + name).read()) for name in sorted(os.listdir(folder))))
+                for folder in preprocessing.OUTPUT_DIRS)
+
+@pytest.mark.parametrize('options', [dict(), dict(batch_size = 4), dict(stream = True, debug = True)])
+def test_serial_timing_ends_with_run(input_dir, options):
+    preprocessing.run(jobs = 1, **options)
+    untimed = outputs()
+    preprocessing.run(jobs = 1, timing = 'timing', **options)
+    assert not_timing() and outputs() == untimed
+    assert set(['cleanup', 'negation.txt', 'spacy']) <= set(rule['group'] for rule in json.load(open('timing.json'))['rules'])
+    preprocessing.run(jobs = 1, **options)
+    assert not_timing()
+    preprocessor = preprocessing.Preprocessor()
+    preprocessor.preprocess_document(patients(1)[0])
+    assert not_timing()
+
+def test_init_worker_ends_timing(input_dir):
+    preprocessing.init_worker('full', True)
+    assert preprocessing.profiler is not None and all(engine.profiler is preprocessing.profiler
+                                                      for engine in preprocessing.ENGINES)
+    preprocessing.init_worker('full', False)
+    assert not_timing()
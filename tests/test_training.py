@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+utils = pytest.importorskip('utils')
+
+def test_save_pickle_keeps_complete_model(tmpdir):
+    path = str(tmpdir.join('model.pkl'))
+    utils.save_pickle({'tag': 'CREATININE'}, path)
+    with pytest.raises(Exception):
+        # an interrupted write (unpicklable object) leaves the old model
+        utils.save_pickle({'tag': lambda x: x}, path)
+    assert utils.load_pickle(path) == {'tag': 'CREATININE'}
+    utils.save_pickle({'tag': 'HBA1C'}, path)
+    assert utils.load_pickle(path) == {'tag': 'HBA1C'}
+    assert sorted(os.listdir(str(tmpdir))) == ['model.pkl']
+
+@pytest.mark.parametrize('jobs, tasks', [(1, 13), (4, 13), (13, 13), (16, 13), (32, 13), (8, 3), (5, 1)])
+def test_thread_budget(jobs, tasks):
+    classifiers = pytest.importorskip('classifiers')
+    workers, threads = classifiers.thread_budget(jobs, tasks)
+    assert workers == min(jobs, tasks) and len(threads) == tasks
+    # the first tasks running at the same time use all cores
+    assert sum(threads[:workers]) == jobs
+    assert max(threads) - min(threads) <= 1
+
+def test_set_threads():
+    classifiers = pytest.importorskip('classifiers')
+    clf = classifiers.Pipeline([('select', classifiers.SelectFromModel(classifiers.RandomForestClassifier(n_jobs = 1))),
+                                ('vote', classifiers.VotingClassifier([('lr', classifiers.LogisticRegression()),
+                                                                       ('xgb', classifiers.XGBClassifier())]))])
+    classifiers.set_threads(clf, 3)
+    params = clf.get_params(deep = True)
+    threads = [params[key] for key in params if key.split('__')[-1] in classifiers.THREAD_PARAMS]
+    assert threads and all(n == 3 for n in threads)
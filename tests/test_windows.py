@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+import pytest
+
+import preprocessing
+from sample import part1_documents
+
+medicalcase = pytest.importorskip('medicalcase')
+corpus = pytest.importorskip('corpus')
+
+LIMITS = [None, 1, 30, 62, 186, 366, 5000]
+
+def old_timed_text(mc, time_limit):
+    """MedicalCase.get_timed_text before the window memo (baseline code)."""
+    if time_limit is None or mc.time_splits is None or len(mc.time_splits) == 1:
+        return mc.text
+    now_ = mc.time_splits[-1][0]
+    selected_text = ""
+    for ts, ttext in mc.time_splits:
+        if not now_ - ts > timedelta(days = time_limit):
+            selected_text += ttext + ' '
+    return selected_text
+
+@pytest.fixture(scope = 'module')
+def cases():
+    cases = [medicalcase.MedicalCase(str(i), text = preprocessing.markup_text(doc))
+             for i, doc in enumerate(part1_documents(80))]
+    # records out of date order take the slow path
+    shuffled = medicalcase.MedicalCase('shuffled', text = preprocessing.markup_text(part1_documents(1, seed = 3)[0]))
+    shuffled._time_splits = list(reversed(shuffled.time_splits))
+    return cases + [shuffled]
+
+def test_windows_equal_baseline(cases):
+    for mc in cases:
+        for limit in LIMITS + LIMITS:
+            assert mc.get_timed_text(limit) == old_timed_text(mc, limit)
+        assert len(mc._windows) <= medicalcase.WINDOW_MEMO
+
+def test_compact_windows_equal_baseline(cases):
+    compact = corpus.CompactCorpus.from_cases([cases])
+    for view, mc in zip(compact, cases):
+        for limit in LIMITS:
+            assert view.get_timed_text(limit) == old_timed_text(mc, limit)
+    assert len(compact.windows) <= len(LIMITS)